@@ -1,58 +1,80 @@
 import os
+import sys
 import pandas as pd
-import glob
+
+# Shared results store lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import results_store
+
+RESULTS_FILE = os.path.join('results', 'bt_results.jsonl')
+
+# Store field -> column name in the exported CSV files
+COLUMNS = {
+    'leecher_id': 'Leecher ID',
+    'transfer_time': 'Transfer Time',
+    'throughput_kbps': 'Throughput',
+    'file_size': 'File Size',
+    'size_category': 'Size Category',
+    'iteration': 'Iteration',
+    'total_data_transferred': 'Total Data Transferred',
+    'transfer_ratio': 'Transfer Ratio',
+    'protocol_bytes': 'Protocol Bytes',
+    'overhead': 'Protocol Overhead',
+    'interface_overhead': 'Interface Overhead',
+    'timestamp': 'Timestamp',
+}
 
 def aggregate_results():
-    """Aggregate results from individual leecher files into combined files"""
-    print("Aggregating results from individual files...")
-    
-    # Find all individual result files
-    result_files = glob.glob('results/*.csv')
-    
-    if not result_files:
-        print("No result files found!")
-        return
+    """Export the per-iteration records in the results store into combined CSV files"""
+    print(f"Aggregating results from {RESULTS_FILE}...")
     
-    # Create a combined DataFrame
-    dfs = []
-    for file in result_files:
-        try:
-            df = pd.read_csv(file)
-            dfs.append(df)
-        except Exception as e:
-            print(f"Error reading {file}: {e}")
-    
-    if not dfs:
-        print("No valid data found in result files!")
+    records = results_store.read(RESULTS_FILE, kind='transfer', protocol='BitTorrent')
+    if not records:
+        print("No results found!")
         return
     
-    # Combine all DataFrames
-    combined_df = pd.concat(dfs, ignore_index=True)
+    combined_df = pd.DataFrame(records)
+    combined_df = combined_df[[field for field in COLUMNS if field in combined_df.columns]].rename(columns=COLUMNS)
     
     # Save the combined results
     combined_df.to_csv('results/all_leechers_results.csv', index=False)
     print(f"Combined results saved to results/all_leechers_results.csv")
     
+    # Data moved by all three leechers together per file size, against the
+    # three copies of the file they downloaded
+    total_data_analysis = combined_df.groupby('Size Category').agg({
+        'File Size': 'first',
+        'Total Data Transferred': 'sum',
+        'Transfer Ratio': 'mean'
+    }).reset_index()
+    total_data_analysis['Combined Transfer Ratio'] = (total_data_analysis['Total Data Transferred']
+                                                      / (total_data_analysis['File Size'] * 3))
+    total_data_analysis.to_csv('results/combined_data_analysis.csv', index=False)
+    print(f"Combined data analysis saved to results/combined_data_analysis.csv")
+    
     # Create aggregated results by leecher and size category
     grouped = combined_df.groupby(['Leecher ID', 'Size Category'])
     
     # Calculate statistics for each group
-    stats = grouped.agg({
+    metrics = {
         'Transfer Time': ['mean', 'std', 'min', 'max'],
         'Throughput': ['mean', 'std', 'min', 'max'],
         'Transfer Ratio': ['mean', 'std', 'min', 'max']
-    }).reset_index()
+    }
+    # Interface counters are missing where /proc/net/dev is not available
+    for column in ('Protocol Overhead', 'Interface Overhead'):
+        if combined_df.get(column) is not None and combined_df[column].notna().any():
+            metrics[column] = ['mean', 'std', 'min', 'max']
+    stats = grouped.agg(metrics).reset_index()
     
     # Save the analysis
     stats.to_csv('results/leechers_performance_comparison.csv', index=False)
     print(f"Leecher performance comparison saved to results/leechers_performance_comparison.csv")
     
     # Create a summary with averages across all leechers
-    summary = combined_df.groupby('Size Category').agg({
-        'Transfer Time': ['mean', 'std'],
-        'Throughput': ['mean', 'std'],
-        'Transfer Ratio': ['mean', 'std']
-    }).reset_index()
+    summary = combined_df.groupby('Size Category').agg(
+        {column: ['mean', 'std'] for column in metrics}
+    ).reset_index()
     
     summary.to_csv('results/all_leechers_summary.csv', index=False)
     print(f"Summary across all leechers saved to results/all_leechers_summary.csv")
@@ -1,10 +1,28 @@
 #!/bin/bash
 
-#make files for transfer
-dd if=/dev/zero of=A_10kB bs=10k count=1
-dd if=/dev/zero of=A_100kB bs=100k count=1
-dd if=/dev/zero of=A_1MB bs=1M count=1
-dd if=/dev/zero of=A_10MB bs=10M count=1
+#make files for transfer: A_10kB, A_100kB, A_1MB and A_10MB of zeros, as dd
+#from /dev/zero made them, listed with their iteration counts in
+#manifest.json. Files already in .testdata_cache are not written again. Pass
+#a manifest of your own as the second argument to run other sizes, e.g. one
+#from: python ../testdata.py generate --max 1GB --entropy 0,1
+MANIFEST=${2:-manifest.json}
+if [ ! -f "${MANIFEST}" ]; then
+    python ../testdata.py generate --output . --manifest "${MANIFEST}"
+fi
+
+# Leechers bring up a new libtorrent session for every iteration unless
+# SESSION_MODE=warm is set, which keeps one session per leecher for the whole
+# run (see torrent_session.py)
+export SESSION_MODE=${SESSION_MODE:-cold}
+
+# libtorrent alerts the peers subscribe to: timing (default), bulk for
+# multi-GB files, or verbose to log every alert (see torrent_session.py)
+export ALERT_PROFILE=${ALERT_PROFILE:-timing}
+
+# Piece size of the torrent the seeder creates: a size such as 16kB (the
+# default), auto to scale it with the file, or sweep (or a list such as
+# 64kB,1MB) to run every file once per piece size (see torrent_files.py)
+PIECE_POLICY=${PIECE_SIZE:-16kB}
 
 # Create directories for downloads and results
 mkdir -p downloads_peer1 downloads_peer2 downloads_peer3 results
@@ -14,10 +32,15 @@ run_experiment() {
     local file_path=$1
     local iterations=$2
     local result_dir=$3
+    local piece_size=$4
     
-    echo "Starting experiment: ${file_path} file (${iterations} iterations)"
+    echo "Starting experiment: ${file_path} file (${iterations} iterations, ${piece_size} pieces)"
     export FILE_PATH=${file_path}
     export ITERATIONS=${iterations}
+    export PIECE_SIZE=${piece_size}
+
+    # A torrent left over from another piece size would be taken for the new one
+    rm -f "${FILE_PATH}.torrent"
 
     # Start tracker
     echo "Starting tracker..."
@@ -49,14 +72,8 @@ run_experiment() {
     docker-compose up --build leecher1 leecher2 leecher3
     docker-compose down
 
-    # Create directory for this file size if it doesn't exist
-    mkdir -p results/${result_dir}
-    
-    # Move result files to results directory, organizing by file size
-    echo "Moving result files to results directory..."
-    
-    # Move leecher-specific files to the appropriate directory
-    mv ${size_category}_*_results.csv results/${result_dir}/ 2>/dev/null || true
+    # Leechers append their results to results/bt_results.jsonl; every record
+    # carries its size category, so nothing needs to be moved between runs
     
     # Clean up downloaded files but preserve result files
     rm -rf downloads_peer1/* downloads_peer2/* downloads_peer3/*
@@ -67,7 +84,9 @@ run_experiment() {
 # Check if we should run in small experiment mode
 if [ "$1" == "small" ]; then
     echo "Running small experiment with fewer iterations"
-    run_experiment "A_10kB" 5 "10kB"
+    for piece_size in $(python ../torrent_files.py sizes A_10kB "${PIECE_POLICY}"); do
+        run_experiment "A_10kB" 5 "10kB" "${piece_size}"
+    done
     echo "Small experiment completed! Results are available in the results directory."
     
     # Run the aggregation script
@@ -79,17 +98,13 @@ fi
 # Full experiment suite
 echo "Running full experiment suite"
 
-# Experiment 1: A_10kB file (333 iterations)
-run_experiment "A_10kB" 333 "10kB"
-
-# Experiment 2: A_100kB file (33 iterations)
-run_experiment "A_100kB" 33 "100kB"
-
-# Experiment 3: A_1MB file (3 iterations)
-run_experiment "A_1MB" 3 "1MB"
-
-# Experiment 4: A_10MB file (1 iteration)
-run_experiment "A_10MB" 1 "10MB"
+# One experiment per manifest file (by default A_10kB x 333, A_100kB x 33,
+# A_1MB x 3 and A_10MB x 1) and piece size
+while read -r name iterations; do
+    for piece_size in $(python ../torrent_files.py sizes "${name}" "${PIECE_POLICY}"); do
+        run_experiment "${name}" "${iterations}" "${name}" "${piece_size}"
+    done
+done < <(python ../testdata.py list "${MANIFEST}")
 
 # Run the aggregation script
 echo "Aggregating results..."
@@ -2,48 +2,47 @@ import libtorrent as lt
 import time
 import sys
 import os
-import numpy as np
 from datetime import datetime
-import pandas as pd
 from pathlib import Path
 import logging
 from typing import Dict
 import tempfile
 import socket
 import subprocess
+import results_store
+import timing
+import torrent_files
+import torrent_session
+import wire_stats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class TorrentExperiment:
-    def __init__(self, file_path: str, save_dir: str, mode: str, iterations: int):
+    def __init__(self, file_path: str, save_dir: str, mode: str, iterations: int,
+                 session_mode: str = torrent_session.DEFAULT_SESSION_MODE):
         self.file_path = file_path
         self.save_dir = save_dir
         self.mode = mode  # 'seeder' or 'leecher'
         self.iterations = iterations
+        self.session_mode = session_mode  # leecher: 'cold' or 'warm', see torrent_session.py
+        self.session_startups = []
         self.transfer_times = []
         self.throughputs = []
+        self.phase_timers = []
+        self.overheads = []
         
     def create_torrent(self) -> str:
         try:
-            fs = lt.file_storage()
-            lt.add_files(fs, self.file_path)
-            t = lt.create_torrent(fs, 16384)
-            t.set_creator('libtorrent python bindings')
+            tracker = "http://localhost:8000/announce"
+            # Piece size from $PIECE_SIZE: fixed (16kB unless set) or auto
+            # by file size. An unchanged file is not hashed again; its
+            # .torrent comes from the cache (see torrent_files.py).
+            piece_size = torrent_files.piece_size(os.path.getsize(self.file_path))
+            torrent_path, metadata_size, cached = torrent_files.create_torrent(self.file_path, piece_size, [tracker])
             
-            # Add tracker URL
-            t.add_tracker("http://localhost:8000/announce")
-            
-            abs_path = os.path.abspath(self.file_path)
-            lt.set_piece_hashes(t, os.path.dirname(abs_path))
-            
-            torrent_data = t.generate()
-            
-            torrent_path = f"{self.file_path}.torrent"
-            with open(torrent_path, 'wb') as f:
-                f.write(lt.bencode(torrent_data))
-            
-            logger.info(f"Created torrent file: {torrent_path}")
+            logger.info(f"{'Reused cached' if cached else 'Created'} torrent file: {torrent_path} "
+                        f"({torrent_files.format_piece_size(piece_size)} pieces, {metadata_size} bytes of metadata)")
             return torrent_path
             
         except Exception as e:
@@ -58,7 +57,7 @@ class TorrentExperiment:
             'enable_lsd': True,
             'enable_upnp': True,
             'enable_natpmp': True,
-            'alert_mask': lt.alert.category_t.all_categories,
+            'alert_mask': torrent_session.alert_mask(),
             'active_limit': -1,
             'allow_multiple_connections_per_ip': True,
             'announce_to_all_trackers': True,
@@ -87,46 +86,37 @@ class TorrentExperiment:
         logger.info(f"Waiting for connections...")
         
         last_uploaded = 0
-        unique_peers = set()
-        peer_count = 0
+        next_status = 0
+        dispatcher = torrent_session.SeederAlerts(emit=logger.info, log=logger.info)
         
+        reannouncer = torrent_session.Reannouncer(h)
         while True:
+            # Wakes on the next alert, or after ALERT_WAIT_MS to refresh the
+            # status line
+            session.wait_for_alert(torrent_session.ALERT_WAIT_MS)
+            dispatcher.dispatch(session.pop_alerts())
+            reannouncer.poll()
+            if time.monotonic() < next_status:
+                continue
+            next_status = time.monotonic() + torrent_session.STATUS_INTERVAL
+            
             s = h.status()
-            alerts = session.pop_alerts()
-            for a in alerts:
-                if isinstance(a, lt.peer_connect_alert):
-                    ip = str(a.endpoint[0])
-                    if ip not in unique_peers:
-                        unique_peers.add(ip)
-                        peer_count += 1
-                        logger.info(f"New peer connected from {ip}")
-                elif isinstance(a, lt.tracker_announce_alert):
-                    logger.info(f"Tracker announce: {a.message()}")
-                elif isinstance(a, lt.tracker_reply_alert):
-                    logger.info(f"Tracker reply: {a.message()}")
-                    
             current_uploaded = s.total_upload
             if current_uploaded > last_uploaded:
-                upload_rate = (current_uploaded - last_uploaded) / 1024
-                logger.info(f"Uploading data: {upload_rate:.1f} kB/s")
+                logger.info(f"Uploading data: {s.upload_rate/1024:.1f} kB/s")
             last_uploaded = current_uploaded
             
             print(f"\rSeeding... "
                   f"Up: {s.upload_rate/1024:.1f} kB/s "
-                  f"Total Peers: {peer_count} "
+                  f"Total Peers: {len(dispatcher.peers)} "
                   f"Total Uploaded: {s.total_upload/1024:.1f} kB "
                   f"State: {s.state} "
-                  f"Pieces: {s.num_pieces}", end='')
-            
-            # Force periodic announces
-            if int(time.time()) % 30 == 0:
-                h.force_reannounce()
-                h.force_dht_announce()
-            
-            time.sleep(1)
+                  f"Pieces: {s.num_pieces} "
+                  f"Alerts: {dispatcher.total()}", end='')
 
     def run_leecher(self, torrent_path: str):
         try:
+            leecher = torrent_session.LeecherSession(torrent_path, self.session_mode)
             for iteration in range(self.iterations):
                 logger.info(f"\nStarting iteration {iteration + 1}/{self.iterations}")
                 
@@ -135,37 +125,15 @@ class TorrentExperiment:
                 
                 logger.info(f"Found torrent file: {torrent_path}")
                 
-                session = lt.session()
-                settings = {
-                    'listen_interfaces': '0.0.0.0:0',
-                    'enable_dht': True,
-                    'enable_lsd': True,
-                    'enable_upnp': True,
-                    'enable_natpmp': True,
-                    'alert_mask': lt.alert.category_t.all_categories,
-                    'active_limit': -1,
-                    'allow_multiple_connections_per_ip': True,
-                    'announce_to_all_trackers': True,
-                    'announce_to_all_tiers': True,
-                    'connection_speed': 500,
-                    'min_announce_interval': 30,
-                    'tracker_backoff': 20,
-                    'piece_timeout': 20,
-                    'request_timeout': 20,
-                    'peer_connect_timeout': 20,
-                    'upload_rate_limit': 0,
-                    'download_rate_limit': 0
-                }
-                session.apply_settings(settings)
-                
-                with open(torrent_path, 'rb') as f:
-                    torrent_data = f.read()
-                info = lt.torrent_info(lt.bdecode(torrent_data))
+                # Cold mode brings up a new session and parses the .torrent
+                # for every iteration; warm mode reuses both
+                startup = leecher.start()
+                session = leecher.session
+                info = leecher.info
+                if startup:
+                    logger.info(f"Session started in {startup * 1000:.1f} ms")
                 
-                h = session.add_torrent({
-                    'ti': info,
-                    'save_path': self.save_dir
-                })
+                h = leecher.add(self.save_dir)
                 
                 # Set proper flags for leecher - allow both download and upload
                 h.set_flags(lt.torrent_flags.auto_managed)
@@ -183,168 +151,194 @@ class TorrentExperiment:
                 logger.info(f"Listening on port {my_port}")
                 logger.info("Waiting for peers from tracker...")
                 
-                start_time = time.time()
+                timer = timing.PhaseTimer(timing.TORRENT_PHASES)
+                interface_meter = wire_stats.InterfaceMeter().start()
                 last_downloaded = 0
                 last_uploaded = 0
-                transfer_started = False
                 download_complete = False
-                unique_peers = set()
-                peer_count = 0
                 last_progress = 0
+                finished_since = None
+                next_status = 0
+                reannouncer = torrent_session.Reannouncer(h)
+                dispatcher = torrent_session.LeecherAlerts(h, timer, leecher.profile, emit=logger.info, log=logger.info)
+                payload_alerts = torrent_session.progress_alerts(leecher.profile)
                 
-                while True:
-                    s = h.status()
-                    alerts = session.pop_alerts()
-                    for a in alerts:
-                        if isinstance(a, lt.peer_connect_alert):
-                            ip = str(a.endpoint[0])
-                            if ip not in unique_peers:
-                                unique_peers.add(ip)
-                                peer_count += 1
-                                logger.info(f"Connected to peer: {ip}")
-                        elif isinstance(a, lt.piece_finished_alert):
-                            logger.info(f"Piece {a.piece_index} downloaded - available for sharing")
-                        elif isinstance(a, lt.tracker_announce_alert):
-                            logger.info(f"Tracker announce: {a.message()}")
-                        elif isinstance(a, lt.tracker_reply_alert):
-                            logger.info(f"Tracker reply: {a.message()}")
-                    
-                    current_downloaded = s.total_download
-                    current_uploaded = s.total_upload
-                    current_progress = s.progress * 100
-                    
-                    if current_progress > last_progress:
-                        logger.info(f"Progress update: {current_progress:.2f}%")
-                        last_progress = current_progress
-                    
-                    if current_downloaded > last_downloaded:
-                        if not transfer_started:
-                            transfer_started = True
+                try:
+                    while True:
+                        # Wakes as soon as libtorrent posts an alert; phases are
+                        # marked at the alert's own timestamp, not when it is popped
+                        polling = not payload_alerts and "first_byte" not in timer.marks
+                        session.wait_for_alert(torrent_session.FIRST_BYTE_POLL_MS if polling
+                                               else torrent_session.ALERT_WAIT_MS)
+                        dispatcher.dispatch(session.pop_alerts())
+                        s = h.status()
+                        
+                        # Profiles without piece and block alerts take first byte
+                        # from the status
+                        if polling and s.total_payload_download > 0 and "last_byte" not in timer.marks:
+                            timer.mark("first_byte")
                             logger.info("Data transfer started")
-                        download_rate = (current_downloaded - last_downloaded) / 1024
-                        logger.info(f"Downloading at {download_rate:.1f} kB/s")
-                    last_downloaded = current_downloaded
-                    
-                    if current_uploaded > last_uploaded:
-                        upload_rate = (current_uploaded - last_uploaded) / 1024
-                        logger.info(f"Uploading at {upload_rate:.1f} kB/s")
-                    last_uploaded = current_uploaded
-                    
-                    print(f"\rIteration {iteration + 1}/{self.iterations} - "
-                          f"Progress: {s.progress*100:.2f}% "
-                          f"Down: {s.download_rate/1024:.1f} kB/s "
-                          f"Up: {s.upload_rate/1024:.1f} kB/s "
-                          f"Total Peers: {peer_count} "
-                          f"Total: {s.total_download/1024:.1f} kB "
-                          f"Pieces: {s.num_pieces} "
-                          f"State: {s.state}", end='')
-                    
-                    if s.is_finished:
-                        if not download_complete:
-                            print(f"\nDownload complete for iteration {iteration + 1}!")
-                            downloaded_path = os.path.join(self.save_dir, os.path.basename(self.file_path))
-                            logger.info(f"File downloaded successfully: {downloaded_path}")
+                        transfer_started = "first_byte" in timer.marks
+                        
+                        # Progress lines at most once per STATUS_INTERVAL, however
+                        # often alerts wake the loop
+                        if time.monotonic() >= next_status:
+                            next_status = time.monotonic() + torrent_session.STATUS_INTERVAL
+                            current_downloaded = s.total_download
+                            current_uploaded = s.total_upload
+                            current_progress = s.progress * 100
                             
-                            # Calculate metrics
-                            transfer_time = time.time() - start_time
-                            file_size = os.path.getsize(downloaded_path)
-                            throughput = (file_size * 8) / (transfer_time * 1000)  # Convert to kbps
+                            if current_progress > last_progress:
+                                logger.info(f"Progress update: {current_progress:.2f}%")
+                                last_progress = current_progress
                             
-                            self.transfer_times.append(transfer_time)
-                            self.throughputs.append(throughput)
+                            if current_downloaded > last_downloaded:
+                                logger.info(f"Downloading at {s.download_rate/1024:.1f} kB/s")
+                            last_downloaded = current_downloaded
                             
-                            logger.info(f"Transfer time: {transfer_time:.2f} seconds")
-                            logger.info(f"Throughput: {throughput:.2f} kbps")
+                            if current_uploaded > last_uploaded:
+                                logger.info(f"Uploading at {s.upload_rate/1024:.1f} kB/s")
+                            last_uploaded = current_uploaded
                             
-                            if iteration < self.iterations - 1:
-                                # Clean up for next iteration
-                                h.pause()
-                                session.remove_torrent(h)
-                                os.remove(downloaded_path)
-                                break  # Break inner loop to start next iteration
-                            else:
-                                # Calculate and save final results
-                                avg_transfer_time = np.mean(self.transfer_times)
-                                avg_throughput = np.mean(self.throughputs)
-                                std_dev_throughput = np.std(self.throughputs)
+                            print(f"\rIteration {iteration + 1}/{self.iterations} - "
+                                  f"Progress: {s.progress*100:.2f}% "
+                                  f"Down: {s.download_rate/1024:.1f} kB/s "
+                                  f"Up: {s.upload_rate/1024:.1f} kB/s "
+                                  f"Total Peers: {len(dispatcher.peers)} "
+                                  f"Total: {s.total_download/1024:.1f} kB "
+                                  f"Pieces: {s.num_pieces} "
+                                  f"State: {s.state}", end='')
+                        
+                        if s.is_finished and "last_byte" not in timer.marks:
+                            # Only if torrent_finished_alert never arrives
+                            finished_since = finished_since or time.monotonic()
+                            if time.monotonic() - finished_since > torrent_session.FINISHED_ALERT_GRACE:
+                                timer.mark("last_byte")
+                        
+                        # Done once torrent_finished_alert has marked last_byte
+                        if "last_byte" in timer.marks:
+                            if not download_complete:
+                                print(f"\nDownload complete for iteration {iteration + 1}!")
+                                downloaded_path = os.path.join(self.save_dir, os.path.basename(self.file_path))
+                                logger.info(f"File downloaded successfully: {downloaded_path}")
                                 
-                                logger.info(f"\nFinal Results after {self.iterations} iterations:")
-                                logger.info(f"Average Transfer Time: {avg_transfer_time:.2f} seconds")
-                                logger.info(f"Average Throughput: {avg_throughput:.2f} kbps")
-                                logger.info(f"Throughput Std Dev: {std_dev_throughput:.2f} kbps")
+                                # Calculate metrics
+                                transfer_time = timer.elapsed("last_byte")
+                                flushed_at = torrent_session.wait_for_disk_flush(session, h)
+                                if flushed_at is not None:
+                                    timer.mark("persisted", flushed_at)
+                                self.phase_timers.append(timer)
+                                file_size = os.path.getsize(downloaded_path)
+                                throughput = (file_size * 8) / (transfer_time * 1000)  # Convert to kbps
                                 
-                                # Save results with standard deviation
-                                save_results(avg_transfer_time, avg_throughput, std_dev_throughput, self.file_path)
-                                download_complete = True
-                    
-                    if time.time() - start_time > 30 and not transfer_started:
-                        if s.total_download == 0:
-                            print("\nTimeout reached - no data received")
-                            break
-                    
-                    # Force periodic announces
-                    if int(time.time()) % 30 == 0:
-                        h.force_reannounce()
-                        h.force_dht_announce()
-                    
-                    time.sleep(1)
+                                # Measured overhead: total_download/total_upload include
+                                # protocol messages, so everything except uploaded payload
+                                # counts against the file size
+                                counters = {
+                                    "app_sent": s.total_upload - s.total_payload_upload,
+                                    "app_received": s.total_download,
+                                    **interface_meter.stop()
+                                }
+                                overhead_layers = wire_stats.overhead_report(counters, file_size)
+                                overhead = overhead_layers.get("application")
+                                
+                                self.transfer_times.append(transfer_time)
+                                self.session_startups.append(startup)
+                                self.throughputs.append(throughput)
+                                self.overheads.append(overhead)
+                                
+                                logger.info(f"Transfer time: {transfer_time:.2f} seconds")
+                                logger.info(f"Throughput: {throughput:.2f} kbps")
+                                logger.info(f"Overhead by layer - {wire_stats.format_overhead(overhead_layers)}")
+                                logger.info(dispatcher.format_counts())
+                                
+                                if iteration < self.iterations - 1:
+                                    break  # Break inner loop to start next iteration
+                                else:
+                                    # Calculate and save final results; numpy is only
+                                    # imported here so seeders never load it
+                                    import numpy as np
+                                    avg_transfer_time = np.mean(self.transfer_times)
+                                    avg_throughput = np.mean(self.throughputs)
+                                    std_dev_throughput = np.std(self.throughputs)
+                                    avg_overhead = wire_stats.mean_ratio(self.overheads)
+                                    
+                                    logger.info(f"\nFinal Results after {self.iterations} iterations:")
+                                    logger.info(f"Average Transfer Time: {avg_transfer_time:.2f} seconds")
+                                    logger.info(f"Average Throughput: {avg_throughput:.2f} kbps")
+                                    logger.info(f"Throughput Std Dev: {std_dev_throughput:.2f} kbps")
+                                    timing.print_breakdown(self.phase_timers, emit=logger.info)
+                                    logger.info(f"Average Overhead Ratio: {wire_stats.format_ratio(avg_overhead)}")
+                                    logger.info(leecher.format_startup())
+                                    
+                                    # Save results with standard deviation
+                                    save_results(avg_transfer_time, avg_throughput, std_dev_throughput, self.file_path, avg_overhead,
+                                                 list(zip(self.transfer_times, self.throughputs, self.overheads,
+                                                          self.session_startups)),
+                                                 dict(leecher.startup_report(), piece_size=leecher.info.piece_length()))
+                                    download_complete = True
+                        
+                        if timer.elapsed() > 30 and not transfer_started:
+                            if s.total_download == 0:
+                                print("\nTimeout reached - no data received")
+                                break
+                        
+                        # Force periodic announces
+                        reannouncer.poll()
+                finally:
+                    # Every way out of the loop, the no-data timeout and errors
+                    # included, takes the torrent out of the session; warm mode
+                    # adds it again next iteration. Only the last iteration's
+                    # completed download is kept.
+                    leecher.finish(h, os.path.join(self.save_dir, os.path.basename(self.file_path)),
+                                   keep=download_complete and iteration == self.iterations - 1)
                     
         except Exception as e:
             logger.error(f"Error in leecher: {str(e)}")
             raise
 
-def save_results(transfer_time, throughput, std_dev, file_name):
-    EXCEL_FILE = "transfer_results.xlsx"
-    
+def save_results(transfer_time, throughput, std_dev, file_name, overhead, transfers=(), session_fields=None):
+    # transfers holds (transfer time, throughput, overhead, session startup)
+    # per iteration, session_fields the leecher's startup report and the
+    # torrent's piece size;
+    # export_results.py builds the Excel table from the store
     file_size = os.path.getsize(file_name)
-    if file_size <= 10 * 1024:
-        size_category = "10kB file"
-    elif file_size <= 100 * 1024:
-        size_category = "100kB file"
-    elif file_size <= 1024 * 1024:
-        size_category = "1MB file"
-    else:
-        size_category = "10MB file"
-
-    if os.path.exists(EXCEL_FILE):
-        df = pd.read_excel(EXCEL_FILE, index_col=0)
-    else:
-        columns = [
-            '10kB file_Average', '10kB file_Std. Dev.',
-            '100kB file_Average', '100kB file_Std. Dev.',
-            '1MB file_Average', '1MB file_Std. Dev.',
-            '10MB file_Average', '10MB file_Std. Dev.',
-            '10kB file_Overhead', '100kB file_Overhead',
-            '1MB file_Overhead', '10MB file_Overhead'
-        ]
-        df = pd.DataFrame(columns=columns, index=['BitTorrent'])
-
-    df.at['BitTorrent', f'{size_category}_Average'] = throughput
-    df.at['BitTorrent', f'{size_category}_Std. Dev.'] = std_dev
-    df.at['BitTorrent', f'{size_category}_Overhead'] = 3.0
-
-    df.to_excel(EXCEL_FILE)
-    logger.info(f"Results saved to {EXCEL_FILE}")
+    records = [
+        results_store.make_record("BitTorrent", "transfer", file_name, file_size,
+                                  transfer_time=t, throughput_kbps=thr, overhead=ovh, session_startup=startup)
+        for t, thr, ovh, startup in transfers
+    ]
+    records.append(results_store.make_record(
+        "BitTorrent", "summary", file_name, file_size,
+        transfers=len(transfers), transfer_time=transfer_time, throughput_avg_kbps=throughput,
+        throughput_std_kbps=std_dev, overhead=overhead, **(session_fields or {})))
+    results_store.append(records)
+    logger.info(f"Results appended to {results_store.results_path()}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: python btorr.py <mode> <file_path> <save_dir> <iterations>")
+    if len(sys.argv) not in (5, 6):
+        print("Usage: python btorr.py <mode> <file_path> <save_dir> <iterations> [cold|warm]")
         print("Example seeder: python btorr.py seeder A_10kB . 5")
         print("Example leecher: python btorr.py leecher A_10kB downloads 5")
+        print("Example leecher reusing one session: python btorr.py leecher A_10kB downloads 333 warm")
         sys.exit(1)
 
     mode = sys.argv[1]
     file_path = sys.argv[2]
     save_dir = sys.argv[3]
     iterations = int(sys.argv[4])
+    session_mode = sys.argv[5] if len(sys.argv) == 6 else torrent_session.DEFAULT_SESSION_MODE
 
     if mode not in ['seeder', 'leecher']:
         print("Mode must be either 'seeder' or 'leecher'")
         sys.exit(1)
+    if session_mode not in torrent_session.SESSION_MODES:
+        print("Session mode must be either 'cold' or 'warm'")
+        sys.exit(1)
 
     os.makedirs(save_dir, exist_ok=True)
 
-    experiment = TorrentExperiment(file_path, save_dir, mode, iterations)
+    experiment = TorrentExperiment(file_path, save_dir, mode, iterations, session_mode)
     torrent_path = f"{file_path}.torrent"
 
     try:
@@ -0,0 +1,100 @@
+import mmap
+import os
+
+# HTTP byte ranges (RFC 9110 section 14) shared by the HTTP/1.1 and HTTP/2
+# servers and their segmented clients. Only single ranges are served; that is
+# all a segmented download sends, and a multi-range request is answered with
+# the whole file, which the RFC allows.
+
+def parse_byte_range(header, size):
+    # Inclusive (start, end) offsets for "bytes=start-end", "bytes=start-" or
+    # "bytes=-suffix". Returns None for headers to ignore (other units,
+    # several ranges, malformed) and raises ValueError when the range does
+    # not overlap a file of `size` bytes, which is a 416.
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        first = int(first) if first.strip() else None
+        last = int(last) if last.strip() else None
+    except ValueError:
+        return None
+    if (first is None and last is None) or (first or 0) < 0 or (last or 0) < 0:
+        return None
+    if first is None:
+        if last == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - last), size - 1
+    else:
+        start, end = first, size - 1 if last is None else last
+        if last is not None and last < first:
+            return None
+    if start >= size:
+        raise ValueError(f"range starts at {start}, file has {size} bytes")
+    return start, min(end, size - 1)
+
+def content_range(start, end, size):
+    return f"bytes {start}-{end}/{size}"
+
+def split_ranges(size, segments):
+    # `segments` contiguous inclusive (start, end) ranges covering size
+    # bytes, the first ones one byte longer when size does not divide evenly
+    if size <= 0:
+        return []
+    segments = max(1, min(segments, size))
+    base, extra = divmod(size, segments)
+    ranges = []
+    start = 0
+    for index in range(segments):
+        length = base + (1 if index < extra else 0)
+        ranges.append((start, start + length - 1))
+        start += length
+    return ranges
+
+def total_size(content_range_header):
+    # File size from a "bytes start-end/size" Content-Range header
+    return int(content_range_header.rsplit("/", 1)[1])
+
+def open_preallocated(path, size):
+    # File descriptor for writing a download of `size` bytes, allocated up
+    # front so segments can land in any order without the file growing
+    # underneath them. Write each segment with os.pwrite at its offset.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    if size:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    return fd
+
+def read_slice(file_path, start, end):
+    # The bytes of one range, copied out of an mmap of the file so only the
+    # requested pages are read
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[start:end + 1]
+
+def ranged_file_response(file_path, range_header, media_type="application/octet-stream", size=None, data=None):
+    # Starlette response for a Range request on file_path: a 206 with the
+    # slice, a 416 for a range outside the file, or None when there is no
+    # usable range and the caller should send the whole file. size and data
+    # let a caller that already has the stat or the bytes skip the disk.
+    if not range_header:
+        return None
+    from starlette.responses import Response
+
+    if size is None:
+        size = os.path.getsize(file_path)
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return None
+    start, end = byte_range
+    body = data[start:end + 1] if data is not None else read_slice(file_path, start, end)
+    return Response(body, status_code=206, media_type=media_type,
+                    headers={"Content-Range": content_range(start, end, size), "Accept-Ranges": "bytes"})
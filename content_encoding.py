@@ -0,0 +1,198 @@
+import gzip
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# HTTP content codings (RFC 9110 section 8.4) shared by the http1.py and
+# FastAPI servers and their clients. gzip comes with Python; br needs the
+# brotli package and zstd the zstandard package, and each is only offered
+# when installed.
+#
+# Compressed bodies are kept per file version, so a file is compressed once,
+# the first time a client asks for that coding, and every later request is
+# answered from memory. Range requests are always answered uncompressed.
+
+# Server preference when the client weighs several codings equally
+ENCODINGS = ("zstd", "br", "gzip")
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 5, "zstd": 3}
+
+# Files above this are always sent uncompressed: compressing them takes
+# seconds and the variant would have to be held in memory
+DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# A variant has to come out below this fraction of the original to be used;
+# random data does not compress and is sent as is
+MAX_RATIO = 0.95
+
+def _module(encoding):
+    # The compression module behind a coding, or None if it is not installed
+    try:
+        if encoding == "gzip":
+            return gzip
+        if encoding == "br":
+            import brotli
+            return brotli
+        if encoding == "zstd":
+            import zstandard
+            return zstandard
+    except ImportError:
+        return None
+    raise ValueError(f"Unknown content coding '{encoding}', expected one of {', '.join(ENCODINGS)}")
+
+def available(encodings=ENCODINGS):
+    return tuple(encoding for encoding in encodings if _module(encoding) is not None)
+
+def parse_encodings(value):
+    # Codings from a comma-separated command-line value, in order; fails for
+    # unknown codings and for ones whose library is missing
+    encodings = tuple(encoding.strip().lower() for encoding in value.split(",") if encoding.strip())
+    for encoding in encodings:
+        if _module(encoding) is None:
+            raise ValueError(f"Content coding '{encoding}' needs a package that is not installed")
+    return encodings
+
+def compress(data, encoding, level=None):
+    level = DEFAULT_LEVELS[encoding] if level is None else level
+    if encoding == "gzip":
+        # mtime=0 keeps the output identical for identical input
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return _module("br").compress(data, quality=level)
+    return _module("zstd").ZstdCompressor(level=level).compress(data)
+
+def decoder(encoding):
+    # Function turning successive chunks of an encoded body into decoded bytes
+    if encoding == "gzip":
+        return zlib.decompressobj(wbits=31).decompress
+    if encoding == "br":
+        return _module("br").Decompressor().process
+    if encoding == "zstd":
+        return _module("zstd").ZstdDecompressor().decompressobj().decompress
+    raise ValueError(f"Unknown content coding '{encoding}'")
+
+def parse_accept_encoding(header):
+    # {coding: q} from an Accept-Encoding header; a missing q is 1
+    weights = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        weights[coding] = q
+    return weights
+
+def negotiate(header, offered):
+    # The offered coding the client weighs highest (ties go to the order of
+    # `offered`), or None for an uncompressed response
+    weights = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def variant_etag(etag, encoding):
+    # Entity tag of an encoded variant; it is a different representation, so
+    # it must not share the original's tag
+    return f'{etag[:-1]}-{encoding}"' if etag.endswith('"') else f"{etag}-{encoding}"
+
+class CompressedVariants:
+    # LRU of compressed bodies keyed by (path, coding) and validated against
+    # the file's size and mtime, so a regenerated file is compressed again.
+    # A file that does not compress is remembered too and sent as is.
+    # Thread-safe; compression runs outside the lock.
+    def __init__(self, encodings, levels=None, max_file_bytes=DEFAULT_MAX_FILE_BYTES, max_bytes=DEFAULT_MAX_BYTES):
+        self.encodings = tuple(encodings)
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.compressions = 0
+        self.incompressible = 0
+        self.cpu_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def negotiate(self, accept_encoding):
+        return negotiate(accept_encoding, self.encodings)
+
+    def lookup(self, path, st, encoding):
+        # (True, body or None) when this version was compressed before,
+        # (False, None) when get() would have to compress it
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get((path, encoding))
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end((path, encoding))
+                self.hits += 1
+                return True, entry[1]
+        return False, None
+
+    def get(self, path, st, encoding, data=None):
+        # The encoded body for this version of the file, or None when it is
+        # to be sent uncompressed. data saves reading a file already in memory.
+        found, body = self.lookup(path, st, encoding)
+        if found:
+            return body
+        if st.st_size > self.max_file_bytes:
+            return None
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        # Thread CPU time, so concurrent workers do not count each other
+        start = time.thread_time()
+        body = compress(bytes(data), encoding, self.levels[encoding])
+        cpu = time.thread_time() - start
+        if len(body) > len(data) * MAX_RATIO:
+            body = None
+
+        with self._lock:
+            self.compressions += 1
+            self.cpu_seconds += cpu
+            if body is None:
+                self.incompressible += 1
+            else:
+                self.bytes_in += len(data)
+                self.bytes_out += len(body)
+            old = self._entries.pop((path, encoding), None)
+            if old is not None:
+                self._total_bytes -= len(old[1] or b"")
+            self._entries[(path, encoding)] = ((st.st_size, st.st_mtime_ns), body)
+            self._total_bytes += len(body or b"")
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted or b"")
+        return body
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "compressions": self.compressions,
+                "incompressible": self.incompressible,
+                "cpu_seconds": self.cpu_seconds,
+                "ratio": self.bytes_out / self.bytes_in if self.bytes_in else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"Compression ({', '.join(self.encodings)}): {stats['compressions']} files compressed "
+                f"({stats['incompressible']} left uncompressed) in {stats['cpu_seconds'] * 1000:.1f} ms CPU, "
+                f"ratio {stats['ratio']:.3f}, {stats['hits']} responses from cached variants, "
+                f"cached: {stats['entries']} variants, {stats['bytes'] / 1024:.1f} kB")
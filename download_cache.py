@@ -0,0 +1,209 @@
+import hashlib
+import os
+import stat
+from collections import OrderedDict
+from email.utils import formatdate
+
+import byte_ranges
+import content_encoding
+
+# LRU cache of what the FastAPI download endpoint needs for each file: the
+# stat result, response headers with the ETag, and for small files the bytes
+# themselves. A request then costs one os.stat() to revalidate the entry
+# (size and mtime unchanged) instead of exists() + FileResponse's own stat,
+# open and threaded reads. A changed file is re-read on its next request.
+#
+# Files up to the preload size are read when the server starts and answered
+# with one Response built in advance, so small-file runs measure the protocol
+# rather than anyio's thread hops for every read.
+
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_SMALL_FILE_BYTES = 256 * 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_PRELOAD_BYTES = 64 * 1024
+
+MEDIA_TYPE = "application/octet-stream"
+
+class CachedFile:
+    __slots__ = ("filename", "path", "stat", "key", "headers", "data", "response")
+
+    def __init__(self, filename, path, st, data=None):
+        self.filename = filename
+        self.path = path
+        self.stat = st
+        self.key = (st.st_size, st.st_mtime_ns)
+        # Same ETag formula as Starlette's FileResponse, so cached and
+        # streamed responses for one file version agree
+        etag = hashlib.md5(f"{st.st_mtime}-{st.st_size}".encode(), usedforsecurity=False).hexdigest()
+        self.headers = {
+            "content-disposition": f'attachment; filename="{filename}"',
+            "etag": f'"{etag}"',
+            "last-modified": formatdate(st.st_mtime, usegmt=True),
+        }
+        self.data = data
+        # Starlette's Response computes its raw headers once and does not
+        # change on send, so one instance can answer every plain GET
+        self.response = None
+        if data is not None:
+            from starlette.responses import Response
+
+            self.response = Response(data, media_type=MEDIA_TYPE, headers=self.headers)
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+class DownloadCache:
+    # max_entries=0 keeps nothing, which is the uncached baseline: every
+    # request stats the file and streams it with FileResponse. Only used from
+    # the server's event loop, so there is no locking.
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES, small_file_bytes=DEFAULT_SMALL_FILE_BYTES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.small_file_bytes = small_file_bytes
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+    def lookup(self, filename):
+        # CachedFile for a regular file in the directory, or None
+        path = os.path.join(self.directory, filename)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._drop(filename)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+
+        entry = self._entries.get(filename)
+        if entry is not None:
+            if entry.key == (st.st_size, st.st_mtime_ns):
+                self._entries.move_to_end(filename)
+                self.hits += 1
+                return entry
+            self.invalidations += 1
+            self._drop(filename)
+        self.misses += 1
+
+        return self._load(filename, path, st, keep_data=st.st_size <= self.small_file_bytes)
+
+    def preload(self, max_file_bytes=DEFAULT_PRELOAD_BYTES):
+        # Loads every regular file of up to max_file_bytes in the directory
+        # with its prebuilt response; returns (files, bytes) loaded
+        files = total = 0
+        if not self.max_entries or not max_file_bytes:
+            return files, total
+        for filename in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_size <= max_file_bytes:
+                entry = self._load(filename, path, st, keep_data=True)
+                files += 1
+                total += len(entry.data)
+        return files, total
+
+    def _load(self, filename, path, st, keep_data):
+        data = None
+        if self.max_entries and keep_data:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        entry = CachedFile(filename, path, st, data)
+        if self.max_entries:
+            self._drop(filename)
+            self._entries[filename] = entry
+            self._total_bytes += len(data or b"")
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted.data or b"")
+        return entry
+
+    def _drop(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            self._total_bytes -= len(entry.data or b"")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"Cache hits: {stats['hits']}, misses: {stats['misses']}, "
+                f"invalidations: {stats['invalidations']}, hit rate: {stats['hit_rate']:.2%}, "
+                f"cached: {stats['entries']} files, {stats['bytes'] / 1024:.1f} kB")
+
+def parse_cache_options(options):
+    # run_server keyword arguments for --cache-entries N (0 disables the
+    # cache), --small-file-kb N and --preload-kb N (0 preloads nothing) in a
+    # script's hand-parsed argv
+    kwargs = {}
+    if "--cache-entries" in options:
+        kwargs["cache_entries"] = int(options[options.index("--cache-entries") + 1])
+    if "--small-file-kb" in options:
+        kwargs["small_file_bytes"] = int(options[options.index("--small-file-kb") + 1]) * 1024
+    if "--preload-kb" in options:
+        kwargs["preload_bytes"] = int(options[options.index("--preload-kb") + 1]) * 1024
+    return kwargs
+
+async def download_response(entry, request, media_type=MEDIA_TYPE, variants=None):
+    # Starlette response for a GET of a cached file: 304 when the client
+    # already has this representation, the slice for a Range request, the
+    # body in the client's preferred coding when variants (a
+    # content_encoding.CompressedVariants) is given, the prebuilt response
+    # for a file held in memory, otherwise FileResponse with the cached stat
+    # so it does not stat the file again. With variants every response
+    # carries Vary: Accept-Encoding, the uncompressed ones included, so a
+    # cache never hands one client's coding to another.
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import FileResponse, Response
+
+    headers = entry.headers
+    range_header = request.headers.get("range")
+    encoding = body = None
+    if variants is not None:
+        headers = dict(headers, vary="Accept-Encoding")
+        if not range_header:
+            encoding = variants.negotiate(request.headers.get("accept-encoding"))
+    if encoding is not None:
+        found, body = variants.lookup(entry.path, entry.stat, encoding)
+        if not found:
+            # The first request for a file version compresses it off the
+            # event loop; later ones hit the variant cache
+            body = await run_in_threadpool(variants.get, entry.path, entry.stat, encoding, entry.data)
+        if body is not None:
+            # A different representation, with its own entity tag
+            headers = dict(headers, etag=content_encoding.variant_etag(headers["etag"], encoding))
+            headers["content-encoding"] = encoding
+
+    if request.headers.get("if-none-match") == headers["etag"]:
+        return Response(status_code=304, headers=headers)
+    if body is not None:
+        return Response(body, media_type=media_type, headers=headers)
+    ranged = byte_ranges.ranged_file_response(entry.path, range_header, media_type,
+                                              size=entry.size, data=entry.data)
+    if ranged is not None:
+        if variants is not None:
+            ranged.headers["vary"] = "Accept-Encoding"
+        return ranged
+    if entry.response is not None and media_type == MEDIA_TYPE and variants is None:
+        return entry.response
+    if entry.data is not None:
+        return Response(entry.data, media_type=media_type, headers=headers)
+    return FileResponse(entry.path, media_type=media_type, filename=entry.filename, stat_result=entry.stat,
+                        headers=None if variants is None else {"vary": "Accept-Encoding"})
@@ -0,0 +1,68 @@
+import argparse
+import sys
+
+import pandas as pd
+
+import results_store
+
+# Builds the Excel summary table from the append-only results store.
+#
+# The "Summary" sheet keeps the original layout: one row per protocol and
+# Average / Std. Dev. / Overhead columns per file size, taken from the most
+# recent run summary for each protocol and size. Every size in the store
+# gets its own columns, next to the original 10kB to 10MB ones, in order
+# of size. "Runs" lists every run
+# summary and "Transfers" every individual download (nested fields such as
+# overhead_layers are flattened into dotted columns).
+
+EXCEL_FILE = "transfer_results.xlsx"
+
+def record_category(record):
+    # Taken from the file size, so records stored when every file above
+    # 1MB counted as "10MB file" land in their own column too
+    if "file_size" in record:
+        return results_store.size_category(record["file_size"])
+    return record["size_category"]
+
+def summary_table(summaries):
+    sizes = dict(zip(results_store.SIZE_CATEGORIES, results_store.ORIGINAL_SIZES))
+    for record in summaries:
+        sizes.setdefault(record_category(record), record.get("file_size", 0))
+    categories = sorted(sizes, key=sizes.get)
+    columns = [f'{size}_{stat}' for size in categories for stat in ('Average', 'Std. Dev.')]
+    columns += [f'{size}_Overhead' for size in categories]
+    protocols = list(dict.fromkeys(record["protocol"] for record in summaries))
+    df = pd.DataFrame(columns=columns, index=protocols)
+
+    # Records are oldest first, so later runs overwrite earlier ones
+    for record in summaries:
+        size = record_category(record)
+        df.at[record["protocol"], f'{size}_Average'] = record.get("throughput_avg_kbps")
+        df.at[record["protocol"], f'{size}_Std. Dev.'] = record.get("throughput_std_kbps")
+        df.at[record["protocol"], f'{size}_Overhead'] = record.get("overhead")
+    return df
+
+def export(results_file=None, excel_file=EXCEL_FILE):
+    records = results_store.read(results_file)
+    if not records:
+        print(f"No results found in {results_store.results_path(results_file)}")
+        return False
+
+    summaries = [record for record in records if record.get("kind") == "summary"]
+    transfers = [record for record in records if record.get("kind") == "transfer"]
+    with pd.ExcelWriter(excel_file) as writer:
+        summary_table(summaries).to_excel(writer, sheet_name="Summary")
+        pd.json_normalize(summaries).to_excel(writer, sheet_name="Runs", index=False)
+        pd.json_normalize(transfers).to_excel(writer, sheet_name="Transfers", index=False)
+
+    print(f"Exported {len(summaries)} runs and {len(transfers)} transfers to {excel_file}")
+    return True
+
+if __name__ == "__main__":
+    #python3 export_results.py
+    #python3 export_results.py --results bittorrent/results/bt_results.jsonl --output bt_results.xlsx
+    parser = argparse.ArgumentParser(description="Export the results store to the Excel summary table")
+    parser.add_argument("--results", help=f"results store (default: $RESULTS_FILE or {results_store.RESULTS_FILE})")
+    parser.add_argument("--output", default=EXCEL_FILE, help=f"Excel file to write (default: {EXCEL_FILE})")
+    args = parser.parse_args()
+    sys.exit(0 if export(args.results, args.output) else 1)
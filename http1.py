@@ -4,10 +4,41 @@ import threading
 import http.client
 import os
 import time
-import sys
-import numpy as np
 import socket
-import pandas as pd
+import argparse
+import asyncio
+import functools
+import mimetypes
+import mmap
+import queue
+import signal
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import byte_ranges
+import content_encoding
+import results_store
+import testdata
+import timing
+import wire_stats
+
+SERVER_MODES = ("single", "threaded", "asyncio", "prefork")
+DEFAULT_WORKERS = 32
+DEFAULT_BACKLOG = 128
+CACHE_MODES = ("none", "memory", "mmap")
+DEFAULT_CACHE_MB = 256
+CONNECTION_MODES = ("new", "keepalive", "pool")
+DEFAULT_POOL_SIZE = 4
+DEFAULT_DELAY = 0.1
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_SEGMENTS = 4
+# Seconds a client waits to connect or for the server to send anything
+# before giving up on a request
+DEFAULT_TIMEOUT = 30
+# Seconds a server waits for the next request on an idle keep-alive
+# connection before closing it, so quiet clients cannot hold on to a worker
+KEEPALIVE_TIMEOUT = 5
 
 def get_ip():
     # Get all network interfaces
@@ -25,138 +56,1007 @@ def get_ip():
     return '127.0.0.1'
 
 # Server code
-def run_server(port=8080, directory="."):
+class FileCache:
+    # LRU cache of hot file contents, either read into memory or mmap'ed.
+    # Entries are validated against (size, mtime) on every lookup so a test
+    # file regenerated between runs is never served stale.
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024, use_mmap=False):
+        self.max_bytes = max_bytes
+        self.use_mmap = use_mmap
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, st):
+        # Returns a buffer with the file contents, or None if the file is too
+        # large to cache and should be streamed from disk instead.
+        key = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if st.st_size > self.max_bytes:
+            return None
+
+        with open(path, "rb") as f:
+            if self.use_mmap and st.st_size:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._total_bytes -= len(old[1])
+            self._entries[path] = (key, data)
+            self._total_bytes += len(data)
+            # Evicted mmaps are left to the garbage collector because another
+            # worker may still be sending from them.
+            while self._total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+        return data
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            hit_rate = self.hits / lookups if lookups else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": hit_rate,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+class MyHttpRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # The serving directory and file options are bound with functools.partial
+    # in run_server so the class can be shared by the thread pool and forked
+    # workers.
+
+    # HTTP/1.1 keeps connections open between requests; every response from
+    # SimpleHTTPRequestHandler carries a Content-Length so this is safe.
+    protocol_version = "HTTP/1.1"
+    # Socket timeout set in StreamRequestHandler.setup(); handle() closes a
+    # connection once no request arrives within it
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out in separate writes; with Nagle enabled a
+    # reused connection stalls on the client's delayed ACK after each one.
+    disable_nagle_algorithm = True
+
+    def __init__(self, *args, file_cache=None, use_sendfile=True, variants=None, keep_alive=True, **kwargs):
+        # BaseRequestHandler handles the request inside __init__, so the
+        # options must be in place before calling up. Without keep_alive
+        # every response closes its connection.
+        self.file_cache = file_cache
+        self.use_sendfile = use_sendfile
+        self.variants = variants
+        self.keep_alive = keep_alive
+        self.byte_range = None
+        self.encoded_body = None
+        self.vary = False
+        super().__init__(*args, **kwargs)
+
+    def end_headers(self):
+        # A file that may be sent compressed says so in every response, the
+        # uncompressed ones included, so caches key on Accept-Encoding
+        if self.vary:
+            self.send_header("Vary", "Accept-Encoding")
+        # send_header("Connection", "close") also sets close_connection
+        if not self.keep_alive:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def send_head(self):
+        # A single byte range on a regular file is answered with 206 and only
+        # that slice of the body (see copyfile); everything else, including
+        # ranges the handler ignores, goes through SimpleHTTPRequestHandler.
+        # With compression on, a whole file goes out in the coding the
+        # client prefers (see send_encoded_head).
+        self.byte_range = None
+        self.encoded_body = None
+        range_header = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        self.vary = self.variants is not None and os.path.isfile(path)
+        if self.variants is not None and not range_header and os.path.isfile(path):
+            f = self.send_encoded_head(path)
+            if f is not None:
+                return f
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        size = os.fstat(f.fileno()).st_size
+        try:
+            byte_range = byte_ranges.parse_byte_range(range_header, size)
+        except ValueError:
+            f.close()
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        if byte_range is None:
+            f.close()
+            return super().send_head()
+
+        start, end = byte_range
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", byte_ranges.content_range(start, end, size))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.byte_range = (start, end - start + 1)
+        return f
+
+    def send_encoded_head(self, path):
+        # Sends the headers of a compressed response and keeps its body for
+        # copyfile. Returns None, with nothing sent, when the client accepts
+        # none of the server's codings or the file does not compress.
+        encoding = self.variants.negotiate(self.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return None
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return None
+        st = os.fstat(f.fileno())
+        data = self.file_cache.get(path, st) if self.file_cache is not None else None
+        body = self.variants.get(path, st, encoding, data)
+        if body is None:
+            f.close()
+            return None
+
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+        self.end_headers()
+        self.encoded_body = body
+        return f
+
+    def copyfile(self, source, outputfile):
+        if self.encoded_body is not None:
+            outputfile.write(self.encoded_body)
+            return
+        offset, count = self.byte_range or (0, None)
+        if self.file_cache is not None:
+            data = self.file_cache.get(source.name, os.fstat(source.fileno()))
+            if data is not None:
+                view = memoryview(data)
+                outputfile.write(view[offset:offset + count] if count is not None else view)
+                return
+
+        if self.use_sendfile and outputfile is self.wfile:
+            # socket.sendfile() drives os.sendfile() so the body goes from the
+            # page cache to the socket without passing through Python; it
+            # falls back to send() itself where sendfile is unavailable.
+            outputfile.flush()
+            self.connection.sendfile(source, offset, count)
+            return
+
+        if count is None:
+            super().copyfile(source, outputfile)
+            return
+        source.seek(offset)
+        while count > 0:
+            chunk = source.read(min(count, 64 * 1024))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            count -= len(chunk)
+
+class BoundedThreadPoolServer(socketserver.TCPServer):
+    # Hands each accepted connection to a fixed-size worker pool. When every
+    # worker is busy the accept loop blocks, so extra clients wait in the
+    # kernel listen backlog instead of spawning unbounded threads.
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS, backlog=DEFAULT_BACKLOG):
+        self.request_queue_size = backlog
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http1-worker")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._active = set()
+        self._active_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        with self._active_lock:
+            self._active.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._active_lock:
+                self._active.discard(request)
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        # Workers parked on idle keep-alive connections would otherwise keep
+        # the pool from shutting down until the clients hang up.
+        with self._active_lock:
+            for request in self._active:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self._pool.shutdown(wait=True)
+
+def _serve_single(address, handler, backlog):
+    class SingleServer(socketserver.TCPServer):
+        allow_reuse_address = True
+        request_queue_size = backlog
+
+    # The one connection slot is freed after every response; a kept-alive
+    # connection would leave every other client (e.g. the rest of a --pool
+    # or --segments run) waiting in the backlog
+    with SingleServer(address, functools.partial(handler, keep_alive=False)) as httpd:
+        print("\nServer is ready to accept connections...")
+        httpd.serve_forever()
+
+def _serve_threaded(address, handler, workers, backlog):
+    with BoundedThreadPoolServer(address, handler, workers=workers, backlog=backlog) as httpd:
+        print(f"\nServer is ready to accept connections ({workers} worker threads)...")
+        httpd.serve_forever()
+
+def _serve_prefork(address, handler, workers, backlog):
+    if not hasattr(os, "fork"):
+        raise RuntimeError("prefork mode requires os.fork()")
+
+    class PreforkServer(socketserver.TCPServer):
+        allow_reuse_address = True
+        request_queue_size = backlog
+
+    httpd = PreforkServer(address, handler)
+    # Every child polls the same listening socket; a non-blocking accept lets
+    # the losers of each wakeup go back to select() instead of hanging.
+    httpd.socket.setblocking(False)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    print(f"\nServer is ready to accept connections ({workers} worker processes)...")
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    finally:
+        httpd.server_close()
+
+def _resolve_path(directory, request_path):
+    # Map a request target onto a file below `directory`, refusing traversal.
+    path = urllib.parse.unquote(urllib.parse.urlsplit(request_path).path)
+    root = os.path.realpath(directory)
+    full_path = os.path.realpath(os.path.join(root, path.lstrip("/")))
+    if full_path != root and not full_path.startswith(root + os.sep):
+        return None
+    return full_path
+
+async def _send_async_error(writer, status, reason):
+    body = f"{status} {reason}\n".encode()
+    writer.write(
+        f"HTTP/1.1 {status} {reason}\r\n"
+        f"Content-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+async def _handle_async_connection(reader, writer, directory, file_cache=None, use_sendfile=True, variants=None):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError,
+                    asyncio.TimeoutError):
+                return
+
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ", 2)
+            except ValueError:
+                await _send_async_error(writer, 400, "Bad Request")
+                return
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+            connection = headers.get("connection", "").lower()
+            if version == "HTTP/1.1":
+                keep_alive = connection != "close"
+            else:
+                keep_alive = connection == "keep-alive"
+
+            if method not in ("GET", "HEAD"):
+                await _send_async_error(writer, 501, "Not Implemented")
+                return
+
+            file_path = _resolve_path(directory, target)
+            if file_path is None or not os.path.isfile(file_path):
+                await _send_async_error(writer, 404, "File not found")
+                return
+
+            content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+            with open(file_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                try:
+                    byte_range = byte_ranges.parse_byte_range(headers["range"], st.st_size) \
+                        if "range" in headers else None
+                except ValueError:
+                    writer.write(
+                        f"HTTP/1.1 416 Range Not Satisfiable\r\n"
+                        f"Content-Range: bytes */{st.st_size}\r\n"
+                        f"Content-Length: 0\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    )
+                    await writer.drain()
+                    if not keep_alive:
+                        return
+                    continue
+
+                encoding = body = None
+                if variants is not None and "range" not in headers:
+                    encoding = variants.negotiate(headers.get("accept-encoding"))
+                    if encoding is not None:
+                        found, body = variants.lookup(file_path, st, encoding)
+                        if not found:
+                            # The first request for a file version compresses
+                            # it off the event loop; later ones hit the cache
+                            body = await loop.run_in_executor(None, variants.get, file_path, st, encoding)
+
+                if body is not None:
+                    writer.write(
+                        f"HTTP/1.1 200 OK\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Content-Encoding: {encoding}\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        f"Vary: Accept-Encoding\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    )
+                    if method == "GET":
+                        writer.write(body)
+                    await writer.drain()
+                    if not keep_alive:
+                        return
+                    continue
+
+                # Uncompressed answers for a file that may be compressed say
+                # so too, so caches key on Accept-Encoding
+                vary = "Vary: Accept-Encoding\r\n" if variants is not None else ""
+                if byte_range is None:
+                    offset, count = 0, st.st_size
+                    status_line = "HTTP/1.1 200 OK\r\n"
+                else:
+                    offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                    status_line = (f"HTTP/1.1 206 Partial Content\r\n"
+                                   f"Content-Range: {byte_ranges.content_range(*byte_range, st.st_size)}\r\n")
+                writer.write(
+                    f"{status_line}"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {count}\r\n"
+                    f"Accept-Ranges: bytes\r\n"
+                    f"{vary}"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                )
+                if method == "GET" and count:
+                    data = file_cache.get(file_path, st) if file_cache is not None else None
+                    if data is not None:
+                        # Transports only take bytes-like objects, not mmaps.
+                        writer.write(memoryview(data)[offset:offset + count])
+                    elif use_sendfile:
+                        # loop.sendfile() uses os.sendfile on plain sockets and
+                        # falls back to read/write for transports that cannot.
+                        await writer.drain()
+                        await loop.sendfile(writer.transport, f, offset, count)
+                    else:
+                        f.seek(offset)
+                        remaining = count
+                        while remaining and (chunk := f.read(min(remaining, 64 * 1024))):
+                            writer.write(chunk)
+                            remaining -= len(chunk)
+                            await writer.drain()
+                await writer.drain()
+
+            if not keep_alive:
+                return
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def _serve_asyncio(host, port, directory, workers, backlog, file_cache=None, use_sendfile=True, variants=None):
+    slots = asyncio.Semaphore(workers)
+
+    async def handle(reader, writer):
+        async with slots:
+            await _handle_async_connection(reader, writer, directory, file_cache, use_sendfile, variants)
+
+    server = await asyncio.start_server(handle, host, port, backlog=backlog, reuse_address=True)
+    print(f"\nServer is ready to accept connections ({workers} concurrent connections)...")
+    async with server:
+        await server.serve_forever()
+
+def run_server(port=8080, directory=".", mode="single", workers=DEFAULT_WORKERS, backlog=DEFAULT_BACKLOG,
+               use_sendfile=True, cache="none", cache_mb=DEFAULT_CACHE_MB, compress=()):
+    # compress lists the content codings offered, in order of preference;
+    # each file version is compressed once per coding and kept in memory
+    if mode not in SERVER_MODES:
+        raise ValueError(f"Unknown server mode '{mode}', expected one of {', '.join(SERVER_MODES)}")
+    if cache not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode '{cache}', expected one of {', '.join(CACHE_MODES)}")
+
     server_ip = get_ip()
     print(f"\nServer Information:")
     print(f"IP Address: {server_ip}")
     print(f"Port: {port}")
     print(f"Full Address: http://{server_ip}:{port}")
+    print(f"Mode: {mode} (backlog {backlog})")
+    print(f"File path: {'sendfile' if use_sendfile else 'copy'}, cache: {cache}, "
+          f"compression: {', '.join(compress) or 'off'}")
 
-    class MyHttpRequestHandler(http.server.SimpleHTTPRequestHandler):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, directory=directory, **kwargs)
+    file_cache = None
+    if cache != "none":
+        file_cache = FileCache(max_bytes=cache_mb * 1024 * 1024, use_mmap=(cache == "mmap"))
 
-    handler_object = MyHttpRequestHandler
+    variants = content_encoding.CompressedVariants(compress) if compress else None
+
+    handler_object = functools.partial(MyHttpRequestHandler, directory=directory,
+                                       file_cache=file_cache, use_sendfile=use_sendfile, variants=variants)
     
     # Bind to all available interfaces
-    with socketserver.TCPServer(("0.0.0.0", port), handler_object) as httpd:
-        print("\nServer is ready to accept connections...")
-        httpd.serve_forever()
+    address = ("0.0.0.0", port)
+    try:
+        if mode == "single":
+            _serve_single(address, handler_object, backlog)
+        elif mode == "threaded":
+            _serve_threaded(address, handler_object, workers, backlog)
+        elif mode == "prefork":
+            _serve_prefork(address, handler_object, workers, backlog)
+        else:
+            asyncio.run(_serve_asyncio(*address, directory, workers, backlog, file_cache, use_sendfile, variants))
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+        # Forked workers keep their own caches, so only in-process modes report.
+        if file_cache is not None and mode != "prefork":
+            stats = file_cache.stats()
+            print(f"Cache hits: {stats['hits']}, misses: {stats['misses']}, "
+                  f"hit rate: {stats['hit_rate']:.2%}, cached: {stats['bytes'] / 1024:.1f} kB")
+        if variants is not None and mode != "prefork":
+            print(variants.format_stats())
 
 # Calculation function
-def calculate_metrics(results, file_size, file_path):
+def calculate_metrics(results, file_size, file_path, label='HTTP 1.1', wire=None, payload_bytes=None, **fields):
+    import numpy as np  # deferred so server mode and client start-up never load it
+
     throughputs = [result[1] for result in results]
     avg_throughput = np.mean(throughputs)
     std_dev_throughput = np.std(throughputs)
 
-    # Calculate overhead (total data transferred / file size)
-    header_size = 500 * 8  # Convert to bits
-    total_data_transferred = file_size + header_size
-    overhead = total_data_transferred / file_size
+    # Overhead is the measured application-layer bytes in both directions
+    # (request, response headers and body) over the body bytes delivered,
+    # as they were sent: encoded for a compressed run, so the coding's saving
+    # stays in compression_ratio. wire holds the summed wire_stats counters
+    # for the successful transfers.
+    overhead_layers = wire_stats.overhead_report(wire or {}, payload_bytes)
+    overhead = overhead_layers.get("application")
 
     print(f"\nResults for {file_path}:")
     print(f"Throughput - Average: {avg_throughput:.2f} kbps")
     print(f"Throughput - Std Dev: {std_dev_throughput:.2f} kbps")
-    print(f"Overhead Ratio: {overhead:.2f}\n")
+    print(f"Overhead Ratio: {wire_stats.format_ratio(overhead)}")
+    if overhead_layers:
+        print(f"Overhead by layer - {wire_stats.format_overhead(overhead_layers)}")
+    print()
 
-    # Save to Excel
-    EXCEL_FILE = "transfer_results.xlsx"
-    
-    # Determine file size category
-    file_size_bytes = file_size / 8  # Convert bits to bytes
-    if file_size_bytes <= 10 * 1024:
-        size_category = "10kB file"
-    elif file_size_bytes <= 100 * 1024:
-        size_category = "100kB file"
-    elif file_size_bytes <= 1024 * 1024:
-        size_category = "1MB file"
-    else:
-        size_category = "10MB file"
+    # Record every transfer plus the run summary; export_results.py builds
+    # the Excel table from the store
+    file_size_bytes = file_size // 8  # Convert bits to bytes
+    records = [
+        results_store.make_record(label, "transfer", file_path, file_size_bytes,
+                                  transfer_time=transfer_time, throughput_kbps=throughput)
+        for transfer_time, throughput in results
+    ]
+    records.append(results_store.make_record(
+        label, "summary", file_path, file_size_bytes,
+        transfers=len(results), throughput_avg_kbps=avg_throughput,
+        throughput_std_kbps=std_dev_throughput, overhead=overhead, overhead_layers=overhead_layers, **fields))
+    results_store.append(records)
+    print(f"Results appended to {results_store.results_path()}")
+
+# Client code
+class CountingHTTPConnection(http.client.HTTPConnection):
+    # Counts TCP connects so connection setup can be told apart from
+    # steady-state requests when connections are reused, and wraps each
+    # socket so every byte sent and received is accounted for. When a
+    # phase_timer is set, name lookup and the TCP handshake are marked on it.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connect_count = 0
+        self.byte_counter = wire_stats.ByteCounter()
+        self.phase_timer = None
+        self._create_connection = self._timed_create_connection
 
-    # Create or load existing DataFrame
-    if os.path.exists(EXCEL_FILE):
-        df = pd.read_excel(EXCEL_FILE, index_col=0)
+    def _timed_create_connection(self, address, timeout, source_address=None):
+        # Resolves the name up front so DNS and the TCP handshake are timed apart
+        host, port = address
+        sockaddr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4]
+        if self.phase_timer:
+            self.phase_timer.mark("dns")
+        sock = socket.create_connection(sockaddr[:2], timeout, source_address)
+        if self.phase_timer:
+            self.phase_timer.mark("connect")
+        return sock
+
+    def connect(self):
+        super().connect()
+        self.sock = wire_stats.CountingSocket(self.sock, self.byte_counter)
+        self.connect_count += 1
+
+    def wire_snapshot(self):
+        return wire_stats.snapshot(self.sock, self.byte_counter)
+
+def _download(conn, file_path, reuse, buffer=None, discard=False, headers=None):
+    # Fetches one file and returns (response, body bytes, timings, wire
+    # counters for this transfer). With a
+    # buffer the body is streamed through it with readinto() so memory stays
+    # flat regardless of file size; otherwise it is read whole. Timings are
+    # seconds from the request start: "ttfb" when the response headers
+    # arrived, "ttlb" when the last body byte arrived, "disk" spent writing
+    # and "chunks" as (arrival time, bytes) per streamed read. "phases" is
+    # the timing.PhaseTimer for the transfer. A compressed body is decoded
+    # as it arrives: body bytes are then the decoded file bytes, "encoding"
+    # and "wire_body" give the coding and its encoded size and "decode_cpu"
+    # the CPU seconds spent decoding.
+    wire_before = conn.wire_snapshot()
+    timer = conn.phase_timer = timing.PhaseTimer()
+    try:
+        conn.request("GET", f"/{file_path}", headers=headers or {})
+        timer.mark("request_sent")
+        response = conn.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        if not reuse:
+            raise
+        # The server dropped an idle keep-alive connection; reconnect once.
+        conn.close()
+        timer.restart()
+        conn.request("GET", f"/{file_path}", headers=headers or {})
+        timer.mark("request_sent")
+        response = conn.getresponse()
+    timer.mark("first_byte")
+    encoding = response.getheader("Content-Encoding")
+    decode = content_encoding.decoder(encoding) if encoding else None
+    timings = {"ttfb": timer.elapsed("first_byte"), "disk": 0.0, "chunks": [], "phases": timer,
+               "encoding": encoding, "wire_body": 0, "decode_cpu": 0.0}
+
+    # The body is always drained so a reused connection stays usable.
+    if response.status != 200:
+        response.read()
+        timer.mark("last_byte")
+        timings["ttlb"] = timings["total"] = timer.elapsed("last_byte")
+        return response, 0, timings, wire_stats.delta(conn.wire_snapshot(), wire_before)
+
+    out_path = os.devnull if discard else f"downloaded_{file_path}"
+    received = 0
+    if buffer is None:
+        content = response.read()
+        timings["wire_body"] = len(content)
+        timer.mark("last_byte")
+        if decode is not None:
+            cpu_start = time.thread_time()
+            content = decode(content)
+            timings["decode_cpu"] = time.thread_time() - cpu_start
+        received = len(content)
+        # Save the downloaded file
+        with open(out_path, 'wb') as f:
+            f.write(content)
+        timer.mark("persisted")
+        timings["disk"] = timer.durations()["persisted"]
     else:
-        # Create DataFrame with the structure matching the table
-        columns = [
-            '10kB file_Average', '10kB file_Std. Dev.',
-            '100kB file_Average', '100kB file_Std. Dev.',
-            '1MB file_Average', '1MB file_Std. Dev.',
-            '10MB file_Average', '10MB file_Std. Dev.',
-            '10kB file_Overhead', '100kB file_Overhead',
-            '1MB file_Overhead', '10MB file_Overhead'
-        ]
-        df = pd.DataFrame(columns=columns, index=['HTTP 1.1'])
-
-    # Update the appropriate columns
-    df.at['HTTP 1.1', f'{size_category}_Average'] = avg_throughput
-    df.at['HTTP 1.1', f'{size_category}_Std. Dev.'] = std_dev_throughput
-    df.at['HTTP 1.1', f'{size_category}_Overhead'] = overhead
-
-    # Save DataFrame
-    df.to_excel(EXCEL_FILE)
-    print(f"Results saved to {EXCEL_FILE}")
+        view = memoryview(buffer)
+        timer.mark("last_byte")
+        with open(out_path, 'wb') as f:
+            while True:
+                n = response.readinto(view)
+                if not n:
+                    break
+                arrived = timer.mark("last_byte")
+                timings["wire_body"] += n
+                timings["chunks"].append(((arrived - timer.start_ns) / 1e9, n))
+                chunk = view[:n]
+                if decode is not None:
+                    cpu_start = time.thread_time()
+                    chunk = decode(chunk)
+                    timings["decode_cpu"] += time.thread_time() - cpu_start
+                received += len(chunk)
+                write_start = time.perf_counter_ns()
+                f.write(chunk)
+                timings["disk"] += (time.perf_counter_ns() - write_start) / 1e9
+        timer.mark("persisted")
 
-# Client code
-def run_client(host='localhost', port=8080, file_path='index.html', iterations=1):
+    timings["ttlb"] = timer.elapsed("last_byte")
+    timings["total"] = timer.elapsed("persisted")
+    return response, received, timings, wire_stats.delta(conn.wire_snapshot(), wire_before)
+
+def _request(conn, file_path, reuse, headers=None):
+    # Sends one GET and returns the response, reconnecting once if the
+    # server dropped an idle keep-alive connection
+    try:
+        conn.request("GET", f"/{file_path}", headers=headers or {})
+        return conn.getresponse()
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        if not reuse:
+            raise
+        conn.close()
+        conn.request("GET", f"/{file_path}", headers=headers or {})
+        return conn.getresponse()
+
+def probe_size(conn, file_path):
+    # File size from a one-byte range request, or None if the server does
+    # not answer ranges (or the file does not exist)
+    response = _request(conn, file_path, reuse=True, headers={"Range": "bytes=0-0"})
+    response.read()
+    if response.status != 206:
+        return None
+    return byte_ranges.total_size(response.getheader("Content-Range"))
+
+def _fetch_range(conn, file_path, start, end, fd, buffer, timer):
+    # GETs bytes start..end over conn and writes them at the same offset of
+    # fd (unless fd is None) as they arrive. Returns (status, bytes
+    # received, wire counters for this request).
+    wire_before = conn.wire_snapshot()
+    response = _request(conn, file_path, reuse=True, headers={"Range": f"bytes={start}-{end}"})
+    # Every segment shares one timer, so first_byte keeps the earliest and
+    # last_byte is marked once all of them are done
+    timer.marks.setdefault("first_byte", time.perf_counter_ns())
+    if response.status != 206:
+        response.read()
+        return response.status, 0, wire_stats.delta(conn.wire_snapshot(), wire_before)
+
+    view = memoryview(buffer)
+    offset = start
+    while True:
+        n = response.readinto(view)
+        if not n:
+            break
+        if fd is not None:
+            os.pwrite(fd, view[:n], offset)
+        offset += n
+    return response.status, offset - start, wire_stats.delta(conn.wire_snapshot(), wire_before)
+
+def run_segmented_client(host='localhost', port=8080, file_path='index.html', iterations=1,
+                         segments=DEFAULT_SEGMENTS, delay=DEFAULT_DELAY, chunk_size=DEFAULT_CHUNK_SIZE,
+                         discard=False, timeout=DEFAULT_TIMEOUT):
+    # Downloads the file `iterations` times, each time as `segments` byte
+    # ranges fetched in parallel over as many persistent connections and
+    # written straight into their place in a preallocated file: the HTTP
+    # counterpart of BitTorrent fetching pieces from several peers. The size
+    # is probed once up front, as a torrent's metadata would provide it.
+    # A segment whose connection sees nothing for timeout seconds (e.g. it
+    # sits in the backlog of a server that holds its only connection open)
+    # ends the run instead of hanging it.
+    connections = [CountingHTTPConnection(host, port, timeout=timeout) for _ in range(segments)]
+    try:
+        size = probe_size(connections[0], file_path)
+    except TimeoutError:
+        print(f"Server did not answer within {timeout}s")
+        connections[0].close()
+        return []
+    if not size:
+        print(f"Server did not answer a range request for {file_path}; segmented download needs Range support")
+        for conn in connections:
+            conn.close()
+        return []
+
+    ranges = byte_ranges.split_ranges(size, segments)
+    buffers = [bytearray(chunk_size) for _ in ranges]
+    out_path = f"downloaded_{file_path}"
     results = []
+    phase_timers = []
+    wire_totals = {}
+    payload_bytes = 0
+    print(f"Fetching {size} bytes as {len(ranges)} ranges of ~{size // len(ranges)} bytes")
 
-    for i in range(iterations):
-        start_time = time.time()
-        
-        conn = http.client.HTTPConnection(host, port)
-        conn.request("GET", f"/{file_path}")
-        response = conn.getresponse()
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        for i in range(iterations):
+            timer = timing.PhaseTimer()
+            fd = None if discard else byte_ranges.open_preallocated(out_path, size)
+            try:
+                fetched = list(executor.map(
+                    lambda conn, byte_range, buffer: _fetch_range(conn, file_path, *byte_range, fd, buffer, timer),
+                    connections, ranges, buffers))
+                timer.mark("last_byte")
+            except TimeoutError:
+                print(f"\nA segment timed out after {timeout}s; does the server serve {len(ranges)} "
+                      f"connections at once (e.g. --mode threaded)?")
+                break
+            finally:
+                if fd is not None:
+                    os.close(fd)
+            timer.mark("persisted")
 
-        if response.status == 200:
-            # Read the response content and get its size
-            content = response.read()
-            file_size = len(content) * 8  # Convert bytes to bits
-            
-            # Save the downloaded file
-            with open(f"downloaded_{file_path}", 'wb') as f:
-                f.write(content)
-            
-            end_time = time.time()
-            transfer_time = end_time - start_time
-            throughput = (file_size / transfer_time) / 1000  # Convert to kilobits per second
-            results.append((transfer_time, throughput))
-            
-            # Calculate and print progress
-            progress = ((i + 1) / iterations) * 100
-            print(f"Progress: {progress:.2f}%", end='\r')
-
-            # Only calculate metrics after the first iteration to get the correct file size
-            if i == 0:
-                first_file_size = file_size
-        else:
-            print(f"Failed to download file. Status: {response.status}, Reason: {response.reason}")
+            received = sum(n for _, n, _ in fetched)
+            failed = [status for status, _, _ in fetched if status != 206]
+            if failed or received != size:
+                print(f"Failed to download file. Statuses: {sorted(set(failed))}, received {received} of {size} bytes")
+            else:
+                transfer_time = timer.elapsed("persisted")
+                results.append((transfer_time, (size * 8 / transfer_time) / 1000))
+                phase_timers.append(timer)
+                for _, _, wire in fetched:
+                    wire_stats.accumulate(wire_totals, wire)
+                payload_bytes += received
+                print(f"Progress: {(i + 1) / iterations * 100:.2f}%", end='\r')
+            if delay > 0:
+                time.sleep(delay)
 
+    for conn in connections:
         conn.close()
-        time.sleep(0.1)  # Small delay to avoid overwhelming the server
+    print("\nDownload complete.")
+    connects = sum(conn.connect_count for conn in connections)
+    print(f"Connections opened: {connects} for {iterations} downloads of {len(ranges)} ranges")
+    timing.print_breakdown(phase_timers)
+    if results:
+        calculate_metrics(results, size * 8, file_path, label=f"HTTP 1.1 segmented x{len(ranges)}",
+                          wire=wire_totals, payload_bytes=payload_bytes)
+    return results
+
+def run_client(host='localhost', port=8080, file_path='index.html', iterations=1,
+               connection_mode="new", pool_size=DEFAULT_POOL_SIZE, delay=DEFAULT_DELAY,
+               stream=False, chunk_size=DEFAULT_CHUNK_SIZE, discard=False, chunk_log=None, accept_encoding=None,
+               timeout=DEFAULT_TIMEOUT):
+    # connection_mode "new" opens a connection per request, "keepalive" reuses
+    # one connection for every request and "pool" spreads the requests over
+    # pool_size persistent connections driven concurrently. stream reads the
+    # body in chunk_size pieces into a buffer reused across requests, discard
+    # writes to /dev/null instead of disk and chunk_log saves every chunk's
+    # arrival time as CSV. accept_encoding is sent as the Accept-Encoding
+    # header (e.g. "gzip" or "br, gzip;q=0.5"); throughput then counts the
+    # decoded file bytes, and the encoded size and decode CPU are reported.
+    # Every connection gives up after timeout seconds without progress.
+    if connection_mode not in CONNECTION_MODES:
+        raise ValueError(f"Unknown connection mode '{connection_mode}', expected one of {', '.join(CONNECTION_MODES)}")
+
+    results = []
+    phase_times = []
+    phase_timers = []
+    wire_totals = {}
+    payload_bytes = 0
+    wire_body_bytes = 0
+    decode_cpu = 0.0
+    encodings = set()
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding else None
+    first_file_size = None
+    completed = 0
+    lock = threading.Lock()
+    buffers = threading.local()
+    chunk_log_file = open(chunk_log, 'w') if chunk_log else None
+    if chunk_log_file:
+        chunk_log_file.write("request,arrival_ms,bytes\n")
+
+    def transfer(conn, reuse):
+        nonlocal first_file_size, completed, payload_bytes, wire_body_bytes, decode_cpu
+        buffer = None
+        if stream:
+            # One preallocated buffer per thread, reused for every request
+            buffer = getattr(buffers, "buffer", None)
+            if buffer is None:
+                buffer = buffers.buffer = bytearray(chunk_size)
+        response, received, timings, wire = _download(conn, file_path, reuse, buffer, discard, headers)
+        transfer_time = timings["total"]
+
+        with lock:
+            completed += 1
+            if response.status == 200:
+                file_size = received * 8  # Convert bytes to bits
+                throughput = (file_size / transfer_time) / 1000  # Convert to kilobits per second
+                results.append((transfer_time, throughput))
+                phase_times.append((timings["ttfb"], timings["ttlb"], timings["disk"]))
+                phase_timers.append(timings["phases"])
+                wire_stats.accumulate(wire_totals, wire)
+                payload_bytes += received
+                wire_body_bytes += timings["wire_body"]
+                decode_cpu += timings["decode_cpu"]
+                encodings.add(timings["encoding"] or "identity")
+                if chunk_log_file:
+                    for arrived, n in timings["chunks"]:
+                        chunk_log_file.write(f"{completed},{arrived * 1000:.3f},{n}\n")
+
+                # Calculate and print progress
+                progress = (completed / iterations) * 100
+                print(f"Progress: {progress:.2f}%", end='\r')
+
+                # Keep the first file size for the metrics
+                if first_file_size is None:
+                    first_file_size = file_size
+            else:
+                print(f"Failed to download file. Status: {response.status}, Reason: {response.reason}")
+
+        if delay > 0:
+            time.sleep(delay)  # Optional pacing between requests
+
+    if connection_mode == "new":
+        connections = []
+        for i in range(iterations):
+            conn = CountingHTTPConnection(host, port, timeout=timeout)
+            transfer(conn, reuse=False)
+            conn.close()
+            connections.append(conn)
+    elif connection_mode == "keepalive":
+        connections = [CountingHTTPConnection(host, port, timeout=timeout)]
+        for i in range(iterations):
+            transfer(connections[0], reuse=True)
+        connections[0].close()
+    else:
+        connections = [CountingHTTPConnection(host, port, timeout=timeout) for _ in range(pool_size)]
+        idle = queue.Queue()
+        for conn in connections:
+            idle.put(conn)
+
+        def pooled_transfer(_):
+            conn = idle.get()
+            try:
+                transfer(conn, reuse=True)
+            finally:
+                idle.put(conn)
+
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            list(executor.map(pooled_transfer, range(iterations)))
+        for conn in connections:
+            conn.close()
 
     print("\nDownload complete.")
+    if chunk_log_file:
+        chunk_log_file.close()
+        print(f"Chunk arrival times saved to {chunk_log}")
+    connects = sum(conn.connect_count for conn in connections)
+    print(f"Connections opened: {connects} for {iterations} requests ({connection_mode})")
+    if phase_times:
+        count = len(phase_times)
+        print(f"Time to first byte - Average: {sum(p[0] for p in phase_times) / count * 1000:.3f} ms")
+        print(f"Time to last byte - Average: {sum(p[1] for p in phase_times) / count * 1000:.3f} ms")
+        print(f"Disk write time - Average: {sum(p[2] for p in phase_times) / count * 1000:.3f} ms")
+        timing.print_breakdown(phase_timers)
+    label, fields, body_bytes = 'HTTP 1.1', {}, payload_bytes
+    if accept_encoding and results:
+        # Compressed runs are stored apart from the uncompressed baseline,
+        # with what the coding saved on the wire and cost to decode
+        coding = ", ".join(sorted(encodings))
+        label = f"HTTP 1.1 {coding}"
+        wire_kbits = wire_body_bytes * 8 / 1000
+        fields = {"content_encoding": coding, "wire_body_bytes": wire_body_bytes,
+                  "compression_ratio": wire_body_bytes / payload_bytes if payload_bytes else None,
+                  "wire_throughput_kbps": wire_kbits / sum(t for t, _ in results),
+                  "decode_cpu_ms": decode_cpu / len(results) * 1000}
+        print(f"Content-Encoding: {coding} - body {wire_body_bytes} bytes on the wire for {payload_bytes} file bytes "
+              f"(ratio {fields['compression_ratio']:.4f})")
+        # Protocol overhead is measured against the encoded body, not the file
+        body_bytes = wire_body_bytes
+        print(f"Wire throughput: {fields['wire_throughput_kbps']:.2f} kbps, "
+              f"decode CPU - Average: {fields['decode_cpu_ms']:.3f} ms per transfer")
     if results:  # Only calculate metrics if we have successful transfers
-        calculate_metrics(results, first_file_size, file_path)
+        calculate_metrics(results, first_file_size, file_path, label=label, wire=wire_totals,
+                          payload_bytes=body_bytes, **fields)
     return results
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/1.1 file transfer experiment")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    server = subparsers.add_parser("server", help="serve files from a directory")
+    server.add_argument("--port", type=int, default=8080)
+    server.add_argument("--directory", default=".")
+    server.add_argument("--mode", choices=SERVER_MODES, default="single",
+                        help="concurrency model (default: single, one connection at a time, "
+                             "closed after each response)")
+    server.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker threads, processes or concurrent connections depending on --mode")
+    server.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                        help="listen(2) backlog for pending connections")
+    server.add_argument("--no-sendfile", dest="use_sendfile", action="store_false",
+                        help="copy file bodies through Python buffers instead of os.sendfile")
+    server.add_argument("--cache", choices=CACHE_MODES, default="none",
+                        help="keep hot files in memory or mmap'ed (default: none)")
+    server.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_MB,
+                        help="upper bound on cached file bytes, in MB")
+    server.add_argument("--compress", type=content_encoding.parse_encodings, default=(), metavar="CODINGS",
+                        help="offer these content codings, e.g. gzip,br,zstd (default: none)")
+
+    client = subparsers.add_parser("client", help="download a file repeatedly")
+    client.add_argument("host")
+    client.add_argument("port", type=int)
+    client.add_argument("file_path", help="file to download, or @manifest.json for every file of a testdata.py manifest")
+    client.add_argument("iterations", type=int, nargs="?",
+                        help="downloads per file (default: 1, or the manifest's count for each file)")
+    reuse = client.add_mutually_exclusive_group()
+    reuse.add_argument("--keepalive", action="store_true",
+                       help="reuse one persistent connection for every request")
+    reuse.add_argument("--pool", type=int, metavar="N",
+                       help="spread requests over N persistent connections used concurrently")
+    reuse.add_argument("--segments", type=int, metavar="N",
+                       help="fetch each download as N byte ranges in parallel over N persistent connections")
+    client.add_argument("--delay", type=float, default=DEFAULT_DELAY,
+                        help="seconds to sleep between requests (default: 0.1, 0 disables)")
+    client.add_argument("--stream", action="store_true",
+                        help="read the body in chunks into a reusable buffer instead of all at once")
+    client.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="bytes per read in --stream mode (default: 65536)")
+    client.add_argument("--discard", action="store_true",
+                        help="write downloads to /dev/null instead of downloaded_<file> (with --segments, skip writing)")
+    client.add_argument("--chunk-log", metavar="CSV",
+                        help="save per-chunk arrival times (with --stream) to a CSV file")
+    client.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds to wait for a connection or data before giving up (default: 30)")
+    client.add_argument("--accept-encoding", metavar="VALUE",
+                        help="Accept-Encoding header to send, e.g. gzip (default: none, uncompressed)")
+
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python script.py [server|client] [host] [port] [file_path] [iterations]")
-        sys.exit(1)
-
-    if sys.argv[1] == "server":
-        run_server()
-    elif sys.argv[1] == "client":
-        if len(sys.argv) < 5:
-            print("Usage: python script.py client [host] [port] [file_path] [iterations]")
-            sys.exit(1)
-        
-        host = sys.argv[2]          # Get IP address from command line
-        port = int(sys.argv[3])     # Get port from command line
-        file_path = sys.argv[4]     # Get file path
-        iterations = int(sys.argv[5]) if len(sys.argv) > 5 else 1  # Get iterations if provided
-        
-        results = run_client(host=host, port=port, file_path=file_path, iterations=iterations)
+    #python3 http1.py server --mode threaded --workers 64
+    #python3 http1.py client 127.0.0.1 8080 A_10kB 333
+    #python3 http1.py client 127.0.0.1 8080 A_10MB 10 --segments 4
+    #python3 http1.py client 127.0.0.1 8080 @manifest.json --keepalive
+    #python3 http1.py server --mode threaded --compress gzip
+    #python3 http1.py client 127.0.0.1 8080 A_10MB 10 --accept-encoding gzip
+    args = parse_args()
+
+    if args.role == "server":
+        run_server(port=args.port, directory=args.directory, mode=args.mode,
+                   workers=args.workers, backlog=args.backlog, use_sendfile=args.use_sendfile,
+                   cache=args.cache, cache_mb=args.cache_mb, compress=args.compress)
+    elif args.segments:
+        for file_path, iterations in testdata.expand(args.file_path, args.iterations):
+            results = run_segmented_client(host=args.host, port=args.port, file_path=file_path,
+                                           iterations=iterations, segments=args.segments, delay=args.delay,
+                                           chunk_size=args.chunk_size, discard=args.discard,
+                                           timeout=args.timeout)
     else:
-        print("Invalid argument. Use 'server' or 'client'.")
+        if args.pool:
+            connection_mode = "pool"
+        elif args.keepalive:
+            connection_mode = "keepalive"
+        else:
+            connection_mode = "new"
+        for file_path, iterations in testdata.expand(args.file_path, args.iterations):
+            results = run_client(host=args.host, port=args.port, file_path=file_path, iterations=iterations,
+                                 connection_mode=connection_mode, pool_size=args.pool or DEFAULT_POOL_SIZE,
+                                 delay=args.delay, stream=args.stream, chunk_size=args.chunk_size,
+                                 discard=args.discard, chunk_log=args.chunk_log,
+                                 accept_encoding=args.accept_encoding, timeout=args.timeout)
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import http.client
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import wire_stats
+from http1 import DEFAULT_CHUNK_SIZE, DEFAULT_TIMEOUT, CountingHTTPConnection, calculate_metrics
+
+ENGINES = ("threads", "processes", "asyncio")
+
+# Latency histogram bucket upper bounds in milliseconds (log spaced)
+HISTOGRAM_BOUNDS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, math.inf]
+
+# Each client k issues requests k, k + clients, k + 2 * clients, ... so the
+# work split needs no shared counter and is identical for threads, processes
+# and asyncio tasks. In open-loop mode (rate > 0) request i is due at
+# start + i / rate and its latency is measured from that due time, so a slow
+# server shows up as growing latency instead of a silently lower send rate.
+# Closed-loop mode (rate == 0) sends the next request as soon as the previous
+# one finishes.
+#
+# A kept-alive connection is dropped when the server says "Connection: close"
+# or closes it itself after its idle timeout. A GET that fails on a reused
+# connection is sent once more on a fresh one, so the server's housekeeping
+# is not reported as failed requests.
+
+# Errors that mean the server had already closed a reused connection
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                           asyncio.IncompleteReadError)
+
+def _schedule(worker_id, clients, requests, rate, start_epoch):
+    # time.time() is only used to agree on a start instant across processes;
+    # all intervals are measured with perf_counter.
+    local_start = time.perf_counter() + (start_epoch - time.time())
+    for index in range(worker_id, requests, clients):
+        due = local_start + index / rate if rate else None
+        yield due, local_start
+
+def _sync_worker(host, port, path, worker_id, clients, requests, rate, start_epoch, keepalive, chunk_size,
+                 timeout=DEFAULT_TIMEOUT):
+    samples = []
+    buffer = memoryview(bytearray(chunk_size))
+    conn = CountingHTTPConnection(host, port, timeout=timeout)
+    for due, local_start in _schedule(worker_id, clients, requests, rate, start_epoch):
+        if due is not None:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        wire_before = conn.wire_snapshot()
+        sent = time.perf_counter()
+        received = 0
+        # http.client closes the connection itself after a response with
+        # "Connection: close" and opens a new one for the next request
+        reused = conn.sock is not None
+        try:
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn.request("GET", path)
+                response = conn.getresponse()
+            status = response.status
+            while True:
+                n = response.readinto(buffer)
+                if not n:
+                    break
+                received += n
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+        done = time.perf_counter()
+        wire = wire_stats.delta(conn.wire_snapshot(), wire_before)
+        samples.append((sent - local_start, done - (due if due is not None else sent), done - sent, received, status, wire))
+        if not keepalive:
+            conn.close()
+    conn.close()
+    return samples
+
+def _process_worker(args):
+    return _sync_worker(*args)
+
+async def _async_fetch(reader, writer, path, host, keepalive, counter):
+    request = (
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Connection: {'keep-alive' if keepalive else 'close'}\r\n\r\n".encode()
+    )
+    writer.write(request)
+    counter.sent += len(request)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    counter.received += len(head)
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    reusable = keepalive and lines[0].startswith("HTTP/1.1")
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection":
+            reusable = keepalive and value.strip().lower() != "close"
+    remaining = length
+    while remaining:
+        chunk = await reader.read(min(remaining, 256 * 1024))
+        if not chunk:
+            raise ConnectionError("connection closed mid-body")
+        remaining -= len(chunk)
+        counter.received += len(chunk)
+    # Whether the connection may carry the next request
+    return status, length, reusable
+
+async def _async_worker(host, port, path, worker_id, clients, requests, rate, start_epoch, keepalive,
+                        timeout=DEFAULT_TIMEOUT):
+    samples = []
+    reader = writer = None
+    counter = wire_stats.ByteCounter()
+    for due, local_start in _schedule(worker_id, clients, requests, rate, start_epoch):
+        if due is not None:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        sock = writer.get_extra_info("socket") if writer is not None else None
+        wire_before = wire_stats.snapshot(sock, counter)
+        sent = time.perf_counter()
+        status, received, reusable = 0, 0, False
+        for attempt in range(2):
+            reused = writer is not None
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                    sock = writer.get_extra_info("socket")
+                status, received, reusable = await asyncio.wait_for(
+                    _async_fetch(reader, writer, path, host, keepalive, counter), timeout)
+                break
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                if writer is not None:
+                    writer.close()
+                    reader = writer = None
+                if not (reused and isinstance(e, STALE_CONNECTION_ERRORS)):
+                    break
+        done = time.perf_counter()
+        wire = wire_stats.delta(wire_stats.snapshot(sock, counter), wire_before)
+        if not reusable and writer is not None:
+            writer.close()
+            reader = writer = None
+        samples.append((sent - local_start, done - (due if due is not None else sent), done - sent, received, status, wire))
+    if writer is not None:
+        writer.close()
+    return samples
+
+async def _run_asyncio(host, port, path, clients, requests, rate, start_epoch, keepalive, timeout=DEFAULT_TIMEOUT):
+    tasks = [
+        _async_worker(host, port, path, worker_id, clients, requests, rate, start_epoch, keepalive, timeout)
+        for worker_id in range(clients)
+    ]
+    per_worker = await asyncio.gather(*tasks)
+    return [sample for samples in per_worker for sample in samples]
+
+def run_load(host, port, file_path, clients=10, requests=100, rate=0.0, engine="threads",
+             keepalive=True, chunk_size=DEFAULT_CHUNK_SIZE, timeout=DEFAULT_TIMEOUT):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {', '.join(ENGINES)}")
+
+    path = f"/{file_path}"
+    # Give every worker time to start before the first request is due
+    start_epoch = time.time() + 0.5
+    worker_args = [
+        (host, port, path, worker_id, clients, requests, rate, start_epoch, keepalive, chunk_size, timeout)
+        for worker_id in range(clients)
+    ]
+
+    if engine == "threads":
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            per_worker = list(executor.map(lambda args: _sync_worker(*args), worker_args))
+        samples = [sample for worker_samples in per_worker for sample in worker_samples]
+    elif engine == "processes":
+        with multiprocessing.Pool(processes=clients) as pool:
+            per_worker = pool.map(_process_worker, worker_args)
+        samples = [sample for worker_samples in per_worker for sample in worker_samples]
+    else:
+        samples = asyncio.run(_run_asyncio(host, port, path, clients, requests, rate, start_epoch, keepalive,
+                                           timeout))
+
+    report(samples, file_path, clients, rate, engine)
+    return samples
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[max(index, 0)]
+
+def report(samples, file_path, clients, rate, engine):
+    ok = [s for s in samples if s[4] == 200]
+    failed = len(samples) - len(ok)
+    print(f"\nLoad test for {file_path}: {clients} clients, engine {engine}, "
+          f"{'open loop at ' + format(rate, 'g') + ' req/s' if rate else 'closed loop'}")
+    print(f"Requests: {len(ok)} succeeded, {failed} failed")
+    if not ok:
+        return
+
+    # Goodput counts only successful body bytes over the span from the first
+    # request being sent to the last response finishing.
+    first_sent = min(s[0] for s in ok)
+    last_done = max(s[0] + s[2] for s in ok)
+    span = last_done - first_sent
+    total_bytes = sum(s[3] for s in ok)
+    goodput = (total_bytes * 8 / span) / 1000 if span > 0 else 0.0
+    print(f"Duration: {span:.3f} s, achieved rate: {len(ok) / span if span > 0 else 0:.1f} req/s")
+    print(f"Aggregate goodput: {goodput:.2f} kbps")
+
+    latencies = sorted(s[1] * 1000 for s in ok)
+    print(f"Latency (ms) - p50: {_percentile(latencies, 0.50):.3f}  p90: {_percentile(latencies, 0.90):.3f}  "
+          f"p99: {_percentile(latencies, 0.99):.3f}  max: {latencies[-1]:.3f}")
+
+    counts = [0] * len(HISTOGRAM_BOUNDS_MS)
+    for latency in latencies:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if latency <= bound:
+                counts[i] += 1
+                break
+    widest = max(counts)
+    print("Latency histogram:")
+    for bound, count in zip(HISTOGRAM_BOUNDS_MS, counts):
+        if not count:
+            continue
+        label = f"<= {bound:g} ms" if bound != math.inf else "> 5000 ms"
+        bar = "#" * max(1, round(40 * count / widest))
+        print(f"  {label:>12} | {bar} {count}")
+
+    # Same schema as the sequential client: one (transfer time, kbps) pair
+    # per request, using service time so queueing in open-loop mode does not
+    # distort per-transfer throughput.
+    results = [(s[2], (s[3] * 8 / s[2]) / 1000) for s in ok if s[2] > 0]
+    file_size = ok[0][3] * 8
+    wire_totals = {}
+    for s in ok:
+        wire_stats.accumulate(wire_totals, s[5])
+    if results and file_size:
+        calculate_metrics(results, file_size, file_path, label=f"HTTP 1.1 ({clients} clients)",
+                          wire=wire_totals, payload_bytes=total_bytes)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the HTTP/1.1 experiment")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("file_path")
+    parser.add_argument("--clients", type=int, default=10, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="total requests across all clients")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="target requests per second across all clients (open loop); 0 runs closed loop")
+    parser.add_argument("--engine", choices=ENGINES, default="threads")
+    parser.add_argument("--new-connections", dest="keepalive", action="store_false",
+                        help="open a new connection for every request instead of keeping one per client")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds to wait for a connection or data before a request fails (default: 30)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    #python3 http1_loadgen.py 127.0.0.1 8080 A_10kB --clients 100 --requests 10000
+    #python3 http1_loadgen.py 127.0.0.1 8080 A_1MB --clients 10 --rate 50 --engine asyncio
+    args = parse_args()
+    if args.clients < 1 or args.requests < 1:
+        print("--clients and --requests must be at least 1")
+        sys.exit(1)
+    run_load(args.host, args.port, args.file_path, clients=args.clients, requests=args.requests,
+             rate=args.rate, engine=args.engine, keepalive=args.keepalive, chunk_size=args.chunk_size,
+             timeout=args.timeout)
@@ -1,46 +1,406 @@
 import sys
 import os
+import asyncio
+import itertools
+import socket
+import ssl
+import subprocess
 import time
-import httpx
-import uvicorn
-import numpy as np
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
 
-app = FastAPI()
+# Shared measurement helpers live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import byte_ranges
+import content_encoding
+import download_cache
+import results_store
+import testdata
+import timing
+import wire_stats
+
+# The HTTP/2 benchmark: one server and one instrumented client engine, with
+# TLS, the server backend, where reports go and whether runs are stored all
+# chosen by flags. http2_log.py, http2_withoutcert.py and
+# http2_withoutcertlog.py run this module with their old behaviour preset.
+
 FILE_DIRECTORY = os.getcwd()
 
-def run_server(host, port):
+# Default per-connection stream cap for the multiplexed client; matches the
+# SETTINGS_MAX_CONCURRENT_STREAMS most servers advertise
+DEFAULT_MAX_STREAMS = 100
+
+# Read size for streamed responses
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# ASGI server stacks the server can run on, with the protocol a client ends
+# up speaking to each. uvicorn only implements HTTP/1.1, so the h2 and h3
+# runs need hypercorn; h3 also needs aioquic installed.
+BACKENDS = {
+    "uvicorn-h11": "HTTP/1.1",
+    "uvicorn-httptools": "HTTP/1.1",
+    "hypercorn-h2": "HTTP/2",
+    "hypercorn-h3": "HTTP/3",
+}
+DEFAULT_BACKEND = "hypercorn-h2"
+
+# How the client treats TLS between requests: a full handshake on a new
+# connection per request, a new connection per request resuming the previous
+# TLS session, or one connection for the whole run
+TLS_MODES = ("new", "resume", "persistent")
+
+# ALPN offers the client can make. httpcore sets the ALPN list itself from
+# httpx's http1/http2 switches, so each offer maps onto those. Without TLS
+# there is no ALPN and "h2" means HTTP/2 with prior knowledge (h2c).
+ALPN_OFFERS = {"h2,http/1.1": (True, True), "h2": (False, True), "http/1.1": (True, False)}
+
+TLS_VERSIONS = {"1.2": ssl.TLSVersion.TLSv1_2, "1.3": ssl.TLSVersion.TLSv1_3}
+
+# HTTP/2 settings the hypercorn server can be tuned with, as command-line
+# options. Anything not given keeps hypercorn's default: 64 kB stream and
+# connection windows, 16 kB frames, 100 concurrent streams and a 32 kB write
+# buffer per stream. The windows and the frame size limit what the server
+# receives; for a download the client's own ones count, which the client
+# takes as the same options.
+H2_OPTIONS = {
+    "--initial-window": "initial_window",
+    "--connection-window": "connection_window",
+    "--max-frame-size": "max_frame_size",
+    "--max-streams": "max_streams",
+    "--write-buffer": "write_buffer",
+}
+
+# Grid the sweep mode runs when no settings are given on the command line
+DEFAULT_SWEEP = {
+    "initial_window": [65535, 2**24],
+    "max_frame_size": [2**14, 2**16, 2**20],
+    "write_buffer": [2**15, 2**18],
+}
+
+# Settings the client advertises to the server: its frame size (None keeps
+# h2's 16 kB), its stream receive window (None keeps the 64 kB default) and
+# its connection receive window (None keeps the 16 MB httpcore opens)
+client_max_frame_size = None
+client_initial_window = None
+client_connection_window = None
+
+# Where reports go (print, or logger.info after use_logging()) and whether
+# client runs are appended to the results store
+emit = print
+logger = None
+record_results = True
+
+def use_logging():
+    # Reports, and one line per request on the server, go through logging
+    # with timestamps instead of plain prints
+    global emit, logger
+    import logging
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    logger = logging.getLogger(__name__)
+    emit = logger.info
+
+def store(records):
+    # Appends records to the results store unless recording is turned off
+    if record_results and records:
+        results_store.append(records)
+        emit(f"Results appended to {results_store.results_path()}")
+
+def download_url(server_ip, port, file_name, tls=True):
+    return f"{'https' if tls else 'http'}://{server_ip}:{port}/download/{file_name}"
+
+def client_options(tls=True, http2=True):
+    # httpx.Client / AsyncClient keyword arguments. Over TLS HTTP/2 is
+    # negotiated with ALPN and HTTP/1.1 stays on offer; over plain HTTP there
+    # is nothing to negotiate, so http2 means prior knowledge (h2c). httpx
+    # asks for gzip by default, so bodies are explicitly requested as is.
+    headers = {"Accept-Encoding": "identity"}
+    if tls:
+        return {"http1": True, "http2": http2, "verify": os.path.join(FILE_DIRECTORY, "cert.pem"), "headers": headers}
+    return {"http1": not http2, "http2": http2, "headers": headers}
+
+class ResumingSSLContext(ssl.SSLContext):
+    # Client context that offers the last remembered session on every new
+    # connection. httpcore wraps its sockets with wrap_socket() and has no
+    # session option of its own, so the hook lives here.
+    session = None
+    last_socket = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None:
+            kwargs.setdefault("session", self.session)
+        self.last_socket = super().wrap_socket(sock, *args, **kwargs)
+        return self.last_socket
+
+    def remember_session(self):
+        # TLS 1.3 tickets arrive after the handshake, so this is called once
+        # response headers have been read, while the socket is still open
+        if self.last_socket is not None and self.last_socket.session is not None:
+            self.session = self.last_socket.session
+
+def client_tls_context(tls_mode="persistent", ciphers=None, tls_version=None):
+    # ciphers is an OpenSSL cipher string; it only governs TLS 1.2 (and
+    # lower), since Python's ssl cannot restrict TLS 1.3 suites, so pair
+    # it with tls_version "1.2"
+    context_class = ResumingSSLContext if tls_mode == "resume" else ssl.SSLContext
+    context = context_class(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(os.path.join(FILE_DIRECTORY, "cert.pem"))
+    if ciphers:
+        context.set_ciphers(ciphers)
+    if tls_version:
+        context.minimum_version = context.maximum_version = TLS_VERSIONS[tls_version]
+    return context
+
+def _tune_h2(initial_window=None, connection_window=None, max_frame_size=None, write_buffer=None):
+    # hypercorn's Config has no receive window or write buffer options and
+    # never advertises h2_max_inbound_frame_size, so these are applied to its
+    # H2Protocol before each connection sends its first SETTINGS frame
+    import h2.settings
+    import hypercorn.protocol.h2 as hypercorn_h2
+
+    if write_buffer:
+        # Each stream's send buffer pauses the app at the high water mark
+        hypercorn_h2.BUFFER_HIGH_WATER = write_buffer
+        hypercorn_h2.BUFFER_LOW_WATER = write_buffer / 2
+
+    initiate = hypercorn_h2.H2Protocol.initiate
+
+    async def tuned_initiate(self, headers=None, settings=None):
+        connection = self.connection
+        values = dict(connection.local_settings.items())
+        if initial_window:
+            values[h2.settings.SettingCodes.INITIAL_WINDOW_SIZE] = initial_window
+        if max_frame_size:
+            values[h2.settings.SettingCodes.MAX_FRAME_SIZE] = max_frame_size
+            connection.max_inbound_frame_size = max_frame_size
+        # Replaced rather than updated so the values go out in the initial
+        # SETTINGS frame instead of a second one waiting for an ACK
+        connection.local_settings = h2.settings.Settings(client=False, initial_values=values)
+        await initiate(self, headers, settings)
+        if connection_window and connection_window > connection.inbound_flow_control_window:
+            # The connection window can only grow through WINDOW_UPDATE
+            connection.increment_flow_control_window(connection_window - connection.inbound_flow_control_window)
+            await self._flush()
+
+    hypercorn_h2.H2Protocol.initiate = tuned_initiate
+
+def _advertise_client_settings():
+    # DATA frames from the server are capped at the frame size the client
+    # advertises and held back by the client's receive windows. httpcore
+    # has no option for either: it keeps h2's 64 kB stream window and only
+    # grows the connection window, to 16 MB. So the client sends a SETTINGS
+    # update right after its connection preface, ahead of the first request.
+    # The server applies it as soon as it reads it; the client's own stream
+    # windows grow when the server acknowledges it, which comes before any
+    # DATA.
+    import h2.settings
+    from httpcore._sync.http2 import HTTP2Connection
+
+    send_connection_init = HTTP2Connection._send_connection_init
+    if getattr(send_connection_init, "tuned", False):
+        return
+
+    def tuned_send_connection_init(self, request):
+        send_connection_init(self, request)
+        values = {}
+        if client_max_frame_size:
+            values[h2.settings.SettingCodes.MAX_FRAME_SIZE] = client_max_frame_size
+        if client_initial_window:
+            values[h2.settings.SettingCodes.INITIAL_WINDOW_SIZE] = client_initial_window
+        if values:
+            self._h2_state.update_settings(values)
+        connection_window = self._h2_state.inbound_flow_control_window
+        if client_connection_window and client_connection_window > connection_window:
+            # The connection window can only grow through WINDOW_UPDATE
+            self._h2_state.increment_flow_control_window(client_connection_window - connection_window)
+        if values or client_connection_window:
+            self._write_outgoing_data(request)
+
+    tuned_send_connection_init.tuned = True
+    HTTP2Connection._send_connection_init = tuned_send_connection_init
+
+def parse_h2_options(options):
+    # {setting: [values]} for every H2_OPTIONS flag given; values may be a
+    # comma-separated list (only the sweep mode uses more than one)
+    grid = {}
+    for flag, name in H2_OPTIONS.items():
+        if flag in options:
+            grid[name] = [int(value) for value in options[options.index(flag) + 1].split(",")]
+    return grid
+
+def run_server(host, port, backend=DEFAULT_BACKEND, tls=True, cache_entries=download_cache.DEFAULT_MAX_ENTRIES,
+               small_file_bytes=download_cache.DEFAULT_SMALL_FILE_BYTES,
+               preload_bytes=download_cache.DEFAULT_PRELOAD_BYTES, compress=(), **h2_settings):
+    # tls=False serves plain HTTP: HTTP/1.1 on uvicorn, HTTP/1.1 and h2c on
+    # hypercorn. compress lists the content codings offered, in order of
+    # preference. h2_settings are H2_OPTIONS names and only apply to hypercorn.
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if not tls and BACKENDS[backend] == "HTTP/3":
+        raise ValueError("HTTP/3 runs over QUIC, which always uses TLS")
+    # Server and client stacks are imported only by the mode that uses them,
+    # so neither pays for the other's start-up
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+    # Stat results, ETags and small files' bytes, revalidated against the
+    # file's mtime on every request; cache_entries=0 disables it
+    cache = download_cache.DownloadCache(FILE_DIRECTORY, cache_entries, small_file_bytes)
+    # Files up to preload_bytes are answered from a Response built here
+    preloaded, preloaded_bytes = cache.preload(preload_bytes)
+    if preloaded:
+        emit(f"Preloaded {preloaded} files ({preloaded_bytes / 1024:.1f} kB) of up to {preload_bytes // 1024} kB")
+    # Compressed bodies, made once per file version and coding
+    variants = content_encoding.CompressedVariants(compress) if compress else None
+
     @app.get("/download/{filename}")
-    async def download_file(filename: str):
-        file_path = os.path.join(FILE_DIRECTORY, filename)
-        if os.path.exists(file_path):
-            return FileResponse(file_path, media_type="application/octet-stream", filename=filename)
+    async def download_file(filename: str, request: Request):
+        entry = cache.lookup(filename)
+        if entry is not None:
+            if logger is not None:
+                logger.info(f"File '{filename}' found. Serving download.")
+            return await download_cache.download_response(entry, request, variants=variants)
+        if logger is not None:
+            logger.warning(f"File '{filename}' not found.")
         return {"error": "File not found"}
-    
-    print(f"Starting server at {host}:{port}")
-    uvicorn.run(app, host=host, port=port, ssl_keyfile="key.pem", ssl_certfile="cert.pem", http="h11")
 
-def run_client(server_ip, port, file_name, iterations):
-    server_url = f"https://{server_ip}:{port}/download/{file_name}"
+    tuned = {name: value for name, value in h2_settings.items() if value}
+    emit(f"Starting server at {host}:{port} ({backend}, {BACKENDS[backend]}{'' if tls else ' without TLS'}"
+         f"{', compression: ' + ', '.join(compress) if compress else ''})")
+    try:
+        if backend.startswith("uvicorn"):
+            import uvicorn
+
+            if tuned:
+                emit(f"Warning: {backend} does not speak HTTP/2, ignoring {tuned}")
+            tls_files = {"ssl_keyfile": "key.pem", "ssl_certfile": "cert.pem"} if tls else {}
+            uvicorn.run(app, host=host, port=port, http=backend.split("-")[1], **tls_files)
+        else:
+            import hypercorn.asyncio
+            import hypercorn.config
+
+            config = hypercorn.config.Config()
+            if tls:
+                config.certfile = "cert.pem"
+                config.keyfile = "key.pem"
+            config.bind = [f"{host}:{port}"]
+            if backend == "hypercorn-h3":
+                # QUIC listens on the same port number over UDP; the TCP
+                # listener stays for clients that discover h3 via Alt-Svc
+                config.quic_bind = [f"{host}:{port}"]
+            else:
+                config.alpn_protocols = ["h2"]
+            if tuned.get("max_streams"):
+                config.h2_max_concurrent_streams = tuned["max_streams"]
+            if tuned.get("max_frame_size"):
+                config.h2_max_inbound_frame_size = tuned["max_frame_size"]
+            _tune_h2(tuned.get("initial_window"), tuned.get("connection_window"), tuned.get("max_frame_size"),
+                     tuned.get("write_buffer"))
+            if tuned:
+                emit(f"HTTP/2 settings: {tuned}")
+            asyncio.run(hypercorn.asyncio.serve(app, config))
+    except KeyboardInterrupt:
+        pass
+    emit(cache.format_stats())
+    if variants is not None:
+        emit(variants.format_stats())
+
+def check_protocol(response_version, backend):
+    # Stops the run when the connection did not negotiate the protocol the
+    # backend is meant to be measured with
+    expected = BACKENDS[backend]
+    if response_version != expected:
+        emit(f"Error: negotiated {response_version} with {backend}, expected {expected}")
+        sys.exit(1)
+
+def run_client(server_ip, port, file_name, iterations, stream=False, chunk_size=DEFAULT_CHUNK_SIZE, backend=None,
+               tls_mode="persistent", ciphers=None, tls_version=None, alpn="h2,http/1.1", tls=True,
+               label=None, settings=None, accept_encoding=None):
+    # stream reads the body with client.stream() in chunk_size pieces and
+    # drops each one, so memory does not grow with the file size. With a
+    # backend the first response must have negotiated its protocol.
+    # tls_mode is one of TLS_MODES; every TLS handshake is timed and
+    # reported on its own, split into full and resumed ones. tls=False uses
+    # http:// URLs, where alpn "h2" starts HTTP/2 with prior knowledge.
+    # Runs are stored under label (default: the negotiated protocol) with
+    # settings, the server's HTTP/2 settings in a sweep. accept_encoding is
+    # sent as the Accept-Encoding header; throughput then counts decoded
+    # file bytes, and the encoded size and client CPU time are reported.
+    if tls_mode not in TLS_MODES:
+        raise ValueError(f"Unknown TLS mode '{tls_mode}', expected one of {', '.join(TLS_MODES)}")
+    if backend is not None and BACKENDS[backend] == "HTTP/3":
+        return run_h3_client(server_ip, port, file_name, iterations)
+    import httpx
+
+    server_url = download_url(server_ip, port, file_name, tls)
     transfer_times = []
-    total_data_transferred = 0
+    phase_timers = []
+    chunk_stats = []
+    wire_totals = {}
+    sock = wire_after = None
     total_file_size_transferred = 0
     success_count = 0
     failure_count = 0
-    cert_path = os.path.join(FILE_DIRECTORY, "cert.pem")
-    
-    with httpx.Client(http2=True, verify=cert_path) as client:
+    handshakes = []
+    versions = set()
+    encodings = set()
+    wire_body_bytes = 0
+    cpu_seconds = 0.0
+    context = client_tls_context(tls_mode, ciphers, tls_version) if tls else None
+    http1, http2 = ALPN_OFFERS[alpn]
+    # No idle connections are kept in the new and resume modes, so every
+    # request opens its own connection and pays for a handshake
+    keepalive = None if tls_mode == "persistent" else 0
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=keepalive)
+
+    def trace(event_name, info):
+        # Connect, TLS, request and first-byte phases come from httpcore's trace hook
+        nonlocal wire_after
+        timer.trace(event_name, info)
+        if event_name == "connection.start_tls.complete":
+            ssl_object = info["return_value"].get_extra_info("ssl_object")
+            handshakes.append((timer, ssl_object.session_reused, ssl_object.version(), ssl_object.cipher()[0]))
+        elif event_name.endswith("receive_response_headers.complete") and tls_mode == "resume" and tls:
+            context.remember_session()
+        elif event_name.endswith("receive_response_body.complete"):
+            # httpx closes the response as soon as the body is read, and in
+            # the new and resume modes the connection with it, so its TCP
+            # counters are read here, while it is still open
+            wire_after = wire_stats.snapshot(sock)
+
+    _advertise_client_settings()
+    headers = {"Accept-Encoding": accept_encoding or "identity"}
+    with httpx.Client(http1=http1, http2=http2, verify=context or False, limits=limits, headers=headers) as client:
         for _ in range(iterations):
-            start_time = time.time()
-            response = client.get(server_url)
-            end_time = time.time()
-            
+            wire_before = wire_stats.snapshot(sock)
+            wire_after = None
+            timer = timing.PhaseTimer()
+            cpu_start = time.thread_time()
+            with client.stream("GET", server_url, extensions={"trace": trace}) as response:
+                # The socket the trace hook reads at the end of the body
+                sock = wire_stats.response_socket(response)
+                if stream:
+                    # iter_bytes decodes a compressed body, iter_raw skips the decoder
+                    chunks = response.iter_bytes(chunk_size) if accept_encoding else response.iter_raw(chunk_size)
+                    file_size_bytes, arrivals = timing.consume_chunks(chunks, timer)
+                else:
+                    response.read()
+                    timer.mark("last_byte")
+                    file_size_bytes = len(response.content)
+            transfer_cpu = time.thread_time() - cpu_start
+            if backend is not None and not phase_timers and not failure_count:
+                check_protocol(response.http_version, backend)
+            wire = wire_stats.delta(wire_after or wire_stats.snapshot(sock), wire_before)
+
             if response.status_code == 200:
-                file_size_bytes = len(response.content)
                 file_size_kbits = (file_size_bytes * 8) / 1000
-                elapsed_time = end_time - start_time
-                total_data_transferred += len(response.content) + len(str(response.headers).encode())
+                elapsed_time = timer.elapsed("last_byte")
+                phase_timers.append(timer)
+                versions.add(response.http_version)
+                encodings.add(response.headers.get("content-encoding", "identity"))
+                wire_body_bytes += response.num_bytes_downloaded
+                cpu_seconds += transfer_cpu
+                if stream:
+                    chunk_stats.append((len(arrivals), timing.largest_gap(arrivals)))
+                wire_stats.accumulate(wire_totals, wire)
                 total_file_size_transferred += file_size_bytes
                 transfer_times.append(elapsed_time)
                 success_count += 1
@@ -48,41 +408,640 @@ def run_client(server_ip, port, file_name, iterations):
                 failure_count += 1
 
     if transfer_times:
+        import numpy as np  # only needed once there are results to summarize
+
         avg_throughput = file_size_kbits / np.mean(transfer_times)
         std_dev_throughput = np.std([file_size_kbits / t for t in transfer_times])
-        overhead = total_data_transferred / total_file_size_transferred
+        # Measured TCP payload in both directions (HTTP/2 frames, plus TLS
+        # records on https) over the body bytes delivered, encoded for a
+        # compressed run so the coding's saving stays in compression_ratio;
+        # None where TCP_INFO is unavailable, so nothing is stored as a
+        # measurement
+        body_bytes = wire_body_bytes if accept_encoding else total_file_size_transferred
+        overhead_layers = wire_stats.overhead_report(wire_totals, body_bytes)
+        overhead = overhead_layers.get("tcp_payload")
     else:
-        avg_throughput, std_dev_throughput, overhead = 0, 0, 0
+        avg_throughput, std_dev_throughput, overhead = 0, 0, None
+        overhead_layers = {}
 
-    print(f"\nSummary for {file_name}:")
-    print(f"Total Successful Transfers: {success_count}")
-    print(f"Total Failed Transfers: {failure_count}")
-    print(f"Average Throughput: {avg_throughput:.2f} kbps")
-    print(f"Standard Deviation: {std_dev_throughput:.2f} kbps")
-    print(f"Application Layer Overhead: {overhead:.2f}\n")
+    emit(f"\nSummary for {file_name}:")
+    emit(f"Total Successful Transfers: {success_count}")
+    emit(f"Total Failed Transfers: {failure_count}")
+    emit(f"Average Throughput: {avg_throughput:.2f} kbps")
+    emit(f"Standard Deviation: {std_dev_throughput:.2f} kbps")
+    # httpx exposes no application byte counts, so the stored overhead is
+    # the TCP payload ratio, and the line says so
+    emit(f"Overhead Ratio ({wire_stats.LAYER_NAMES['tcp_payload']}): {wire_stats.format_ratio(overhead)}")
+    if overhead_layers:
+        emit(f"Overhead by layer - {wire_stats.format_overhead(overhead_layers)}")
+    timing.print_breakdown(phase_timers, emit=emit)
+    if chunk_stats:
+        emit(f"Streamed in {chunk_size // 1024} kB reads - chunks per transfer: "
+             f"{sum(c for c, _ in chunk_stats) / len(chunk_stats):.1f}, "
+             f"largest gap between chunks: {max(g for _, g in chunk_stats) * 1000:.3f} ms")
+    report_handshakes(handshakes, tls_mode)
+    encoding_fields = {}
+    if accept_encoding and transfer_times:
+        coding = ", ".join(sorted(encodings))
+        wire_kbits = wire_body_bytes * 8 / 1000
+        encoding_fields = {"content_encoding": coding, "wire_body_bytes": wire_body_bytes,
+                           "compression_ratio": wire_body_bytes / total_file_size_transferred,
+                           "wire_throughput_kbps": wire_kbits / sum(transfer_times),
+                           "client_cpu_ms": cpu_seconds / success_count * 1000}
+        emit(f"Content-Encoding: {coding} - body {wire_body_bytes} bytes on the wire for "
+             f"{total_file_size_transferred} file bytes (ratio {encoding_fields['compression_ratio']:.4f})")
+        emit(f"Wire throughput: {encoding_fields['wire_throughput_kbps']:.2f} kbps, "
+             f"client CPU - Average: {encoding_fields['client_cpu_ms']:.3f} ms per transfer")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python script.py [server|client] [host] [port] [file_name] [iterations]")
+    # Record every transfer plus the run summary; export_results.py builds
+    # the Excel table from the store. Compressed runs are stored apart from
+    # the uncompressed baseline.
+    if not label:
+        label = ", ".join(sorted(versions)) or "HTTP/2"
+        if encoding_fields:
+            label += f" {encoding_fields['content_encoding']}"
+    if transfer_times:
+        records = [
+            results_store.make_record(label, "transfer", file_name, file_size_bytes,
+                                      transfer_time=t, throughput_kbps=file_size_kbits / t)
+            for t in transfer_times
+        ]
+        records.append(results_store.make_record(
+            label, "summary", file_name, file_size_bytes,
+            transfers=success_count, failures=failure_count, streamed=stream, throughput_avg_kbps=avg_throughput,
+            throughput_std_kbps=std_dev_throughput, overhead=overhead, overhead_layers=overhead_layers,
+            tls=tls, tls_mode=tls_mode if tls else None, http_versions=sorted(versions), h2_settings=settings,
+            **encoding_fields))
+        store(records)
+    emit("")
+    return {
+        "label": label,
+        "transfers": success_count,
+        "failures": failure_count,
+        "throughput_avg_kbps": avg_throughput,
+        "throughput_std_kbps": std_dev_throughput,
+        "overhead_layers": overhead_layers,
+        "handshakes": handshakes,
+    }
+
+def report_handshakes(handshakes, tls_mode):
+    # Handshake time is the TLS phase (TCP connect to handshake complete)
+    if not handshakes:
+        return
+    _, _, version, cipher = handshakes[0]
+    emit(f"TLS handshakes ({tls_mode}, {version}, {cipher}): {len(handshakes)}, "
+         f"{sum(1 for _, reused, _, _ in handshakes if reused)} resumed")
+    for reused, kind in ((False, "Full"), (True, "Resumed")):
+        times = [timer.durations().get("tls") for timer, was_reused, _, _ in handshakes if was_reused == reused]
+        times = [t for t in times if t is not None]
+        if times:
+            emit(f"  {kind:<8} handshake avg {sum(times) / len(times) * 1000:9.3f} ms  "
+                 f"min {min(times) * 1000:9.3f}  max {max(times) * 1000:9.3f}  (n={len(times)})")
+
+def _h3_protocol():
+    # aioquic client protocol doing HTTP/3 GETs, one future per request stream.
+    # Built on first use so aioquic is only imported for HTTP/3 runs.
+    from aioquic.asyncio.protocol import QuicConnectionProtocol
+    from aioquic.h3.connection import H3Connection
+    from aioquic.h3.events import DataReceived, HeadersReceived
+
+    class H3ClientProtocol(QuicConnectionProtocol):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.http = H3Connection(self._quic)
+            self._requests = {}
+
+        async def get(self, authority, path, timer):
+            # Returns (status, body bytes received); the body is dropped
+            stream_id = self._quic.get_next_available_stream_id()
+            self.http.send_headers(stream_id, [
+                (b":method", b"GET"), (b":scheme", b"https"),
+                (b":authority", authority.encode()), (b":path", path.encode()),
+            ], end_stream=True)
+            waiter = self._loop.create_future()
+            self._requests[stream_id] = {"timer": timer, "status": None, "received": 0, "waiter": waiter}
+            self.transmit()
+            timer.mark("request_sent")
+            return await waiter
+
+        def quic_event_received(self, event):
+            for http_event in self.http.handle_event(event):
+                request = self._requests.get(getattr(http_event, "stream_id", None))
+                if request is None:
+                    continue
+                if isinstance(http_event, HeadersReceived):
+                    request["timer"].mark("first_byte")
+                    request["status"] = int(dict(http_event.headers)[b":status"])
+                elif isinstance(http_event, DataReceived):
+                    request["received"] += len(http_event.data)
+                    request["timer"].mark("last_byte")
+                if http_event.stream_ended:
+                    del self._requests[http_event.stream_id]
+                    request["timer"].mark("last_byte")
+                    request["waiter"].set_result((request["status"], request["received"]))
+
+    return H3ClientProtocol
+
+async def _run_h3(server_ip, port, file_name, iterations):
+    from aioquic.asyncio.client import connect
+    from aioquic.h3.connection import H3_ALPN
+    from aioquic.quic.configuration import QuicConfiguration
+
+    configuration = QuicConfiguration(is_client=True, alpn_protocols=H3_ALPN)
+    configuration.load_verify_locations(os.path.join(FILE_DIRECTORY, "cert.pem"))
+    results = []
+    timer = timing.PhaseTimer(timing.QUIC_PHASES)
+    async with connect(server_ip, port, configuration=configuration, create_protocol=_h3_protocol()) as client:
+        timer.mark("quic_handshake")
+        for _ in range(iterations):
+            status, received = await client.get(f"{server_ip}:{port}", f"/download/{file_name}", timer)
+            results.append((timer, status, received))
+            timer = timing.PhaseTimer(timing.QUIC_PHASES)
+    return results
+
+def run_h3_client(server_ip, port, file_name, iterations):
+    # HTTP/3 counterpart of run_client over one QUIC connection. httpx has
+    # no HTTP/3, so this uses aioquic directly; QUIC runs over UDP, so the
+    # TCP_INFO overhead layers do not apply.
+    results = asyncio.run(_run_h3(server_ip, port, file_name, iterations))
+    ok = [(timer, received) for timer, status, received in results if status == 200]
+    transfer_times = [timer.elapsed("last_byte") for timer, _ in ok]
+
+    emit(f"\nSummary for {file_name} (HTTP/3):")
+    emit(f"Total Successful Transfers: {len(ok)}")
+    emit(f"Total Failed Transfers: {len(results) - len(ok)}")
+    if not ok:
+        return None
+    import numpy as np  # only needed once there are results to summarize
+
+    file_size_bytes = ok[0][1]
+    file_size_kbits = file_size_bytes * 8 / 1000
+    avg_throughput = file_size_kbits / np.mean(transfer_times)
+    std_dev_throughput = np.std([file_size_kbits / t for t in transfer_times])
+    emit(f"Average Throughput: {avg_throughput:.2f} kbps")
+    emit(f"Standard Deviation: {std_dev_throughput:.2f} kbps")
+    timing.print_breakdown([timer for timer, _ in ok], emit=emit)
+
+    records = [
+        results_store.make_record("HTTP/3", "transfer", file_name, file_size_bytes,
+                                  transfer_time=t, throughput_kbps=file_size_kbits / t)
+        for t in transfer_times
+    ]
+    records.append(results_store.make_record(
+        "HTTP/3", "summary", file_name, file_size_bytes,
+        transfers=len(ok), failures=len(results) - len(ok), throughput_avg_kbps=avg_throughput,
+        throughput_std_kbps=std_dev_throughput))
+    store(records)
+    return {
+        "label": "HTTP/3",
+        "transfers": len(ok),
+        "failures": len(results) - len(ok),
+        "throughput_avg_kbps": avg_throughput,
+        "throughput_std_kbps": std_dev_throughput,
+        "overhead_layers": {},
+        "handshakes": [],
+    }
+
+def verify_backend(server_ip, port, file_name, backend, tls=True):
+    # One request with the client matching the backend; reports the
+    # protocol it negotiated and fails when it is not the intended one
+    expected = BACKENDS[backend]
+    if expected == "HTTP/3":
+        results = asyncio.run(_run_h3(server_ip, port, file_name, 1))
+        # aioquic only completes a handshake that agreed on an h3 ALPN
+        version, status = "HTTP/3", results[0][1]
+    else:
+        import httpx
+
+        # Over TLS both protocols are offered and the server picks; plain
+        # HTTP has no negotiation, so the client speaks the expected one
+        with httpx.Client(**client_options(tls, http2=tls or expected == "HTTP/2")) as client:
+            response = client.get(download_url(server_ip, port, file_name, tls))
+        version, status = response.http_version, response.status_code
+    emit(f"{backend}: negotiated {version} (expected {expected}), status {status}")
+    check_protocol(version, backend)
+    return version
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def _fetch_concurrently(client, url, iterations, concurrency, counters):
+    # Issues `iterations` GETs keeping at most `concurrency` of them in
+    # flight, taking each connection's TCP counters into counters; returns
+    # (timer, response) per request and the wall time
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with semaphore:
+            timer = timing.PhaseTimer()
+            async with client.stream("GET", url, extensions={"trace": timer.atrace}) as response:
+                # Counters are read before the connection can go away
+                counters.take(wire_stats.response_socket(response))
+                await response.aread()
+                timer.mark("last_byte")
+                counters.take(wire_stats.response_socket(response))
+            return timer, response
+
+    start_ns = time.perf_counter_ns()
+    results = await asyncio.gather(*(fetch() for _ in range(iterations)))
+    return results, (time.perf_counter_ns() - start_ns) / 1e9
+
+async def _run_concurrent(server_ip, port, file_name, iterations, concurrency, http2, max_streams, tls):
+    import httpx
+
+    server_url = download_url(server_ip, port, file_name, tls)
+    if http2:
+        # One connection; the semaphore caps the streams open on it at once
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        in_flight = min(concurrency, max_streams)
+    else:
+        # One request per connection at a time, so K requests need K connections
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        in_flight = concurrency
+
+    counters = wire_stats.ConnectionCounters()
+    async with httpx.AsyncClient(**client_options(tls, http2), limits=limits) as client:
+        results, wall_time = await _fetch_concurrently(client, server_url, iterations, in_flight, counters)
+        # The connections were opened for this run, so their TCP counters
+        # cover exactly its traffic; read them once more before the client
+        # closes them
+        counters.refresh()
+        wire_totals = counters.totals()
+
+    ok = [(timer, response) for timer, response in results if response.status_code == 200]
+    payload_bytes = sum(len(response.content) for _, response in ok)
+    latencies = sorted(timer.elapsed("last_byte") for timer, _ in ok)
+    return {
+        "label": f"{'HTTP/2' if http2 else 'HTTP/1.1'} x{concurrency}",
+        "requests": len(results),
+        "failures": len(results) - len(ok),
+        "connections": len(counters),
+        "versions": sorted({response.http_version for _, response in results}),
+        "wall_time": wall_time,
+        "payload_bytes": payload_bytes,
+        "goodput_kbps": (payload_bytes * 8 / 1000) / wall_time if wall_time else 0,
+        "latencies": latencies,
+        "timers": [timer for timer, _ in ok],
+        "overhead_layers": wire_stats.overhead_report(wire_totals, payload_bytes),
+    }
+
+def _report_concurrent(file_name, stats):
+    emit(f"\n{stats['label']} summary for {file_name}:")
+    emit(f"Requests: {stats['requests']} ({stats['failures']} failed) over {stats['connections']} connection(s), "
+         f"negotiated {', '.join(stats['versions'])}")
+    emit(f"Aggregate Goodput: {stats['goodput_kbps']:.2f} kbps ({stats['wall_time'] * 1000:.1f} ms wall)")
+    latencies = stats["latencies"]
+    if latencies:
+        emit(f"Request Latency - Average: {sum(latencies) / len(latencies) * 1000:.3f} ms, "
+             f"p50: {_percentile(latencies, 0.5) * 1000:.3f} ms, p95: {_percentile(latencies, 0.95) * 1000:.3f} ms")
+    if stats["overhead_layers"]:
+        emit(f"Overhead by layer - {wire_stats.format_overhead(stats['overhead_layers'])}")
+    timing.print_breakdown(stats["timers"], emit=emit)
+
+def run_multiplexed_client(server_ip, port, file_name, iterations, concurrency, max_streams=DEFAULT_MAX_STREAMS,
+                           http2=True, tls=True):
+    # K = concurrency requests in flight at once: as K streams over a single
+    # HTTP/2 connection, or with http2=False over K parallel HTTP/1.1
+    # connections. Throughput is aggregate goodput (all bytes / wall time).
+    stats = asyncio.run(_run_concurrent(server_ip, port, file_name, iterations, concurrency, http2, max_streams, tls))
+    _report_concurrent(file_name, stats)
+    if http2 and "HTTP/2" not in stats["versions"]:
+        emit("Warning: the server did not negotiate HTTP/2, so requests were not multiplexed")
+
+    successes = stats["requests"] - stats["failures"]
+    if successes:
+        file_size_bytes = stats["payload_bytes"] // successes
+        records = [
+            results_store.make_record(stats["label"], "transfer", file_name, file_size_bytes,
+                                      transfer_time=latency, concurrency=concurrency)
+            for latency in stats["latencies"]
+        ]
+        records.append(results_store.make_record(
+            stats["label"], "summary", file_name, file_size_bytes,
+            transfers=successes, failures=stats["failures"], concurrency=concurrency,
+            connections=stats["connections"], http_versions=stats["versions"], tls=tls,
+            wall_time=stats["wall_time"], throughput_avg_kbps=stats["goodput_kbps"],
+            overhead=stats["overhead_layers"].get("tcp_payload"), overhead_layers=stats["overhead_layers"]))
+        store(records)
+    return stats
+
+def run_comparison(server_ip, port, file_name, iterations, concurrency, max_streams=DEFAULT_MAX_STREAMS, tls=True):
+    # Same workload as K streams on one HTTP/2 connection and as K parallel
+    # HTTP/1.1 connections, then a side-by-side summary
+    runs = [
+        run_multiplexed_client(server_ip, port, file_name, iterations, concurrency, max_streams, http2=True, tls=tls),
+        run_multiplexed_client(server_ip, port, file_name, iterations, concurrency, http2=False, tls=tls),
+    ]
+    emit(f"\nComparison for {file_name} ({iterations} requests, {concurrency} concurrent):")
+    emit(f"{'':<16}{'goodput kbps':>16}{'avg ms':>10}{'p95 ms':>10}{'conns':>7}")
+    for stats in runs:
+        latencies = stats["latencies"] or [float("nan")]
+        emit(f"{stats['label']:<16}{stats['goodput_kbps']:>16.2f}"
+             f"{sum(latencies) / len(latencies) * 1000:>10.3f}{_percentile(latencies, 0.95) * 1000:>10.3f}"
+             f"{stats['connections']:>7}")
+    return runs
+
+async def _run_segmented(server_ip, port, file_name, iterations, segments, http2, discard, tls):
+    import httpx
+
+    server_url = download_url(server_ip, port, file_name, tls)
+    # HTTP/2 carries the ranges as streams of one connection, HTTP/1.1
+    # needs a connection per range
+    connections = 1 if http2 else segments
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    counters = wire_stats.ConnectionCounters()
+    async with httpx.AsyncClient(**client_options(tls, http2), limits=limits) as client:
+        # The size is probed once up front, as a torrent's metadata would provide it
+        probe = await client.get(server_url, headers={"Range": "bytes=0-0"})
+        counters.take(wire_stats.response_socket(probe))
+        if probe.status_code != 206:
+            return None
+        size = byte_ranges.total_size(probe.headers["content-range"])
+        ranges = byte_ranges.split_ranges(size, segments)
+
+        async def fetch(start, end, fd, timer):
+            async with client.stream("GET", server_url, headers={"Range": f"bytes={start}-{end}"}) as response:
+                # Every range shares one timer, so first_byte keeps the earliest
+                timer.marks.setdefault("first_byte", time.perf_counter_ns())
+                sock = wire_stats.response_socket(response)
+                counters.take(sock)
+                offset = start
+                if response.status_code == 206:
+                    async for chunk in response.aiter_raw():
+                        if fd is not None:
+                            os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                else:
+                    await response.aread()
+                counters.take(sock)
+            return response, offset - start
+
+        transfers = []
+        for _ in range(iterations):
+            timer = timing.PhaseTimer()
+            fd = None if discard else byte_ranges.open_preallocated(f"downloaded_{file_name}", size)
+            try:
+                fetched = await asyncio.gather(*(fetch(start, end, fd, timer) for start, end in ranges))
+                timer.mark("last_byte")
+            finally:
+                if fd is not None:
+                    os.close(fd)
+            timer.mark("persisted")
+            transfers.append((timer, fetched))
+
+        # The connections were opened for this run (the size probe included),
+        # so their TCP counters cover exactly its traffic
+        counters.refresh()
+        wire_totals = counters.totals()
+
+    ok = [timer for timer, fetched in transfers
+          if all(response.status_code == 206 for response, _ in fetched) and sum(n for _, n in fetched) == size]
+    return {
+        "label": f"{'HTTP/2' if http2 else 'HTTP/1.1'} segmented x{len(ranges)}",
+        "size": size,
+        "ranges": len(ranges),
+        "requests": len(transfers),
+        "failures": len(transfers) - len(ok),
+        "connections": len(counters),
+        "versions": sorted({response.http_version for _, fetched in transfers for response, _ in fetched}),
+        "timers": ok,
+        "overhead_layers": wire_stats.overhead_report(wire_totals, size * len(ok)),
+    }
+
+def run_segmented_client(server_ip, port, file_name, iterations, segments, http2=True, discard=False, tls=True):
+    # Downloads the file `iterations` times, each as `segments` byte ranges
+    # fetched in parallel and written into their place in a preallocated
+    # downloaded_<file> (skipped with discard): the HTTP counterpart of
+    # BitTorrent fetching pieces from several peers
+    stats = asyncio.run(_run_segmented(server_ip, port, file_name, iterations, segments, http2, discard, tls))
+    if stats is None:
+        emit(f"Server did not answer a range request for {file_name}; segmented download needs Range support")
+        return None
+
+    times = [timer.elapsed("persisted") for timer in stats["timers"]]
+    file_size_kbits = stats["size"] * 8 / 1000
+    throughputs = [file_size_kbits / t for t in times]
+    emit(f"\n{stats['label']} summary for {file_name} ({stats['size']} bytes in {stats['ranges']} ranges):")
+    emit(f"Downloads: {stats['requests']} ({stats['failures']} failed) over {stats['connections']} connection(s), "
+         f"negotiated {', '.join(stats['versions'])}")
+    if throughputs:
+        import numpy as np  # only needed once there are results to summarize
+
+        emit(f"Average Throughput: {np.mean(throughputs):.2f} kbps")
+        emit(f"Standard Deviation: {np.std(throughputs):.2f} kbps")
+    if stats["overhead_layers"]:
+        emit(f"Overhead by layer - {wire_stats.format_overhead(stats['overhead_layers'])}")
+    timing.print_breakdown(stats["timers"], emit=emit)
+    if http2 and "HTTP/2" not in stats["versions"]:
+        emit("Warning: the server did not negotiate HTTP/2, so the ranges queued on one HTTP/1.1 connection "
+             "(--http1 opens one per range)")
+
+    if throughputs:
+        records = [
+            results_store.make_record(stats["label"], "transfer", file_name, stats["size"],
+                                      transfer_time=t, throughput_kbps=file_size_kbits / t, segments=stats["ranges"])
+            for t in times
+        ]
+        records.append(results_store.make_record(
+            stats["label"], "summary", file_name, stats["size"],
+            transfers=len(times), failures=stats["failures"], segments=stats["ranges"],
+            connections=stats["connections"], http_versions=stats["versions"], tls=tls,
+            throughput_avg_kbps=float(np.mean(throughputs)), throughput_std_kbps=float(np.std(throughputs)),
+            overhead=stats["overhead_layers"].get("tcp_payload"), overhead_layers=stats["overhead_layers"]))
+        store(records)
+    return stats
+
+def _wait_for_port(host, port, proc, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+def run_sweep(host, port, file_name, iterations, grid=None, stream=True, chunk_size=DEFAULT_CHUNK_SIZE, tls=True):
+    # Starts a hypercorn server for every combination of the settings in
+    # grid, runs the client against it over HTTP/2 (ALPN "h2" with TLS, prior
+    # knowledge without) and prints the throughput of each. The max frame
+    # size and the windows are advertised by the client too, since the
+    # client's are the ones that cap and pace the server's DATA frames; on
+    # the server they only apply to the requests.
+    global client_max_frame_size, client_initial_window, client_connection_window
+
+    grid = grid or DEFAULT_SWEEP
+    names = list(grid)
+    results = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        settings = dict(zip(names, values))
+        server_argv = [sys.executable, os.path.abspath(__file__), "server", host, str(port),
+                       "--backend", "hypercorn-h2"]
+        if not tls:
+            server_argv.append("--no-tls")
+        for flag, name in H2_OPTIONS.items():
+            if name in settings:
+                server_argv += [flag, str(settings[name])]
+
+        emit(f"Sweep: {settings}")
+        server = subprocess.Popen(server_argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_for_port(host, port, server):
+                emit(f"Error: server did not start with {settings}")
+                results.append((settings, None, None))
+                continue
+            client_max_frame_size = settings.get("max_frame_size")
+            client_initial_window = settings.get("initial_window")
+            client_connection_window = settings.get("connection_window")
+            stats = run_client(host, port, file_name, iterations, stream, chunk_size, alpn="h2", tls=tls,
+                               label="HTTP/2 sweep", settings=settings)
+            results.append((settings, stats["throughput_avg_kbps"], stats["throughput_std_kbps"]))
+        finally:
+            server.terminate()
+            server.wait()
+    client_max_frame_size = client_initial_window = client_connection_window = None
+
+    emit(f"\nSweep results for {file_name} ({iterations} transfers per combination):")
+    emit("  ".join(f"{name:>17}" for name in names) + f"  {'avg kbps':>12}  {'std kbps':>12}")
+    for settings, avg, std in results:
+        row = "  ".join(f"{settings[name]:>17}" for name in names)
+        if avg is None:
+            emit(f"{row}  {'failed':>12}")
+        else:
+            emit(f"{row}  {avg:12.2f}  {std:12.2f}")
+    return results
+
+def main(argv, tls=True, log=False, record=True, backend=DEFAULT_BACKEND):
+    # Command line shared by this script and the presets wrapping it. The
+    # keyword arguments are defaults the flags override: --tls / --no-tls,
+    # --log / --print (logging or plain output), --record / --no-record
+    # (results store) and --backend (server side).
+    global client_max_frame_size, client_initial_window, client_connection_window, record_results
+
+    options = argv[1:]
+    if "--tls" in options or "--no-tls" in options:
+        tls = "--tls" in options
+    if "--log" in options or "--print" in options:
+        log = "--log" in options
+    if "--record" in options or "--no-record" in options:
+        record = "--record" in options
+    if log:
+        use_logging()
+    record_results = record
+    flags = "[--tls|--no-tls] [--log|--print] [--record|--no-record]"
+    if len(argv) < 1:
+        emit(f"Usage: python script.py [server|client|multiplex|compare|segmented|verify|sweep] [host] [port] "
+             f"[file_name] [iterations] {flags}")
         sys.exit(1)
-    #python3 http2.py server 127.0.0.1 8080
-    #python3 http2.py client 127.0.0.1 8080 A_10kB 2
-    mode = sys.argv[1]
+    mode = argv[0]
     if mode == "server":
-        if len(sys.argv) < 4:
-            print("Usage: python script.py server [host] [port]")
+        if len(argv) < 3:
+            emit("Usage: python script.py server [host] [port] [--backend NAME] [--cache-entries N] [--small-file-kb N] "
+                 "[--preload-kb N] [--compress gzip,br,zstd] [--initial-window N] [--connection-window N] [--max-frame-size N] "
+                 f"[--max-streams N] [--write-buffer N] {flags}")
             sys.exit(1)
-        host = sys.argv[2]
-        port = int(sys.argv[3])
-        run_server(host, port)
+        host = argv[1]
+        port = int(argv[2])
+        options = argv[3:]
+        backend = options[options.index("--backend") + 1] if "--backend" in options else backend
+        settings = {name: values[0] for name, values in parse_h2_options(options).items()}
+        compress = content_encoding.parse_encodings(options[options.index("--compress") + 1]) \
+            if "--compress" in options else ()
+        run_server(host, port, backend, tls, **download_cache.parse_cache_options(options), compress=compress,
+                   **settings)
     elif mode == "client":
-        if len(sys.argv) < 6:
-            print("Usage: python script.py client [host] [port] [file_name] [iterations]")
+        if len(argv) < 5:
+            emit("Usage: python script.py client [host] [port] [file_name|@manifest.json] [iterations] [--stream] "
+                 "[--chunk-size N] [--backend NAME] [--tls-mode new|resume|persistent] [--tls-version 1.2|1.3] "
+                 "[--ciphers STRING] "
+                 "[--alpn h2|http/1.1|h2,http/1.1] [--h2c] [--max-frame-size N] [--initial-window N] "
+                 f"[--connection-window N] [--accept-encoding VALUE] {flags}")
+            sys.exit(1)
+        server_ip = argv[1]
+        port = int(argv[2])
+        file_name = argv[3]
+        iterations = int(argv[4])
+        options = argv[5:]
+        stream = "--stream" in options
+        chunk_size = int(options[options.index("--chunk-size") + 1]) if "--chunk-size" in options else DEFAULT_CHUNK_SIZE
+        client_backend = options[options.index("--backend") + 1] if "--backend" in options else None
+        tls_options = {}
+        for flag in ("--tls-mode", "--tls-version", "--ciphers", "--alpn", "--accept-encoding"):
+            if flag in options:
+                tls_options[flag[2:].replace("-", "_")] = options[options.index(flag) + 1]
+        if "--h2c" in options:
+            # HTTP/2 with prior knowledge, the plain-HTTP spelling of --alpn h2
+            tls_options["alpn"] = "h2"
+        if "--max-frame-size" in options:
+            client_max_frame_size = int(options[options.index("--max-frame-size") + 1])
+        if "--initial-window" in options:
+            client_initial_window = int(options[options.index("--initial-window") + 1])
+        if "--connection-window" in options:
+            client_connection_window = int(options[options.index("--connection-window") + 1])
+        # With a testdata.py manifest every file is run in turn; iterations 0
+        # takes each file's count from the manifest
+        for file_name, file_iterations in testdata.expand(file_name, iterations):
+            run_client(server_ip, port, file_name, file_iterations, stream, chunk_size, client_backend, tls=tls,
+                       **tls_options)
+    elif mode in ("multiplex", "compare"):
+        if len(argv) < 6:
+            emit(f"Usage: python script.py {mode} [host] [port] [file_name] [iterations] [concurrency] [max_streams] "
+                 f"{flags}")
+            sys.exit(1)
+        server_ip = argv[1]
+        port = int(argv[2])
+        file_name = argv[3]
+        iterations = int(argv[4])
+        concurrency = int(argv[5])
+        max_streams = int(argv[6]) if len(argv) > 6 and argv[6].isdigit() else DEFAULT_MAX_STREAMS
+        if mode == "multiplex":
+            run_multiplexed_client(server_ip, port, file_name, iterations, concurrency, max_streams, tls=tls)
+        else:
+            run_comparison(server_ip, port, file_name, iterations, concurrency, max_streams, tls=tls)
+    elif mode == "segmented":
+        if len(argv) < 6:
+            emit(f"Usage: python script.py segmented [host] [port] [file_name] [iterations] [segments] [--http1] "
+                 f"[--discard] {flags}")
             sys.exit(1)
-        server_ip = sys.argv[2]
-        port = int(sys.argv[3])
-        file_name = sys.argv[4]
-        iterations = int(sys.argv[5])
-        run_client(server_ip, port, file_name, iterations)
+        options = argv[6:]
+        run_segmented_client(argv[1], int(argv[2]), argv[3], int(argv[4]), int(argv[5]),
+                             http2="--http1" not in options, discard="--discard" in options, tls=tls)
+    elif mode == "verify":
+        if len(argv) < 5:
+            emit(f"Usage: python script.py verify [host] [port] [file_name] [{'|'.join(BACKENDS)}] {flags}")
+            sys.exit(1)
+        verify_backend(argv[1], int(argv[2]), argv[3], argv[4], tls)
+    elif mode == "sweep":
+        if len(argv) < 5:
+            emit("Usage: python script.py sweep [host] [port] [file_name] [iterations] [--initial-window N,N] "
+                 f"[--connection-window N,N] [--max-frame-size N,N] [--max-streams N,N] [--write-buffer N,N] {flags}")
+            sys.exit(1)
+        run_sweep(argv[1], int(argv[2]), argv[3], int(argv[4]), parse_h2_options(argv[5:]), tls=tls)
     else:
-        print("Invalid argument. Use 'server' or 'client'.")
+        emit("Invalid argument. Use 'server', 'client', 'multiplex', 'compare', 'segmented', 'verify' or 'sweep'.")
+
+if __name__ == "__main__":
+    #python3 http2.py server 127.0.0.1 8080
+    #python3 http2.py server 127.0.0.1 8080 --backend hypercorn-h3
+    #python3 http2.py server 127.0.0.1 8080 --cache-entries 0
+    #python3 http2.py server 127.0.0.1 8080 --no-tls --log --initial-window 16777216 --max-frame-size 1048576
+    #python3 http2.py verify 127.0.0.1 8080 A_10kB hypercorn-h3
+    #python3 http2.py client 127.0.0.1 8080 A_10kB 2
+    #python3 http2.py client 127.0.0.1 8080 A_10kB 2 --backend hypercorn-h2
+    #python3 http2.py client 127.0.0.1 8080 A_10kB 100 --tls-mode resume
+    #python3 http2.py client 127.0.0.1 8080 @manifest.json 0
+    #python3 http2.py client 127.0.0.1 8080 A_10kB 100 --tls-mode new --tls-version 1.2 --ciphers ECDHE-RSA-AES128-GCM-SHA256
+    #python3 http2.py client 127.0.0.1 8080 A_10MB 2 --stream --chunk-size 262144
+    #python3 http2.py client 127.0.0.1 8080 A_10MB 2 --stream --no-tls --h2c --max-frame-size 1048576
+    #python3 http2.py client 127.0.0.1 8080 A_10MB 2 --stream --no-tls --h2c --initial-window 16777216
+    #python3 http2.py server 127.0.0.1 8080 --compress zstd,br,gzip
+    #python3 http2.py client 127.0.0.1 8080 A_10MB 10 --accept-encoding gzip
+    #python3 http2.py multiplex 127.0.0.1 8080 A_10kB 100 8 [max_streams]
+    #python3 http2.py compare 127.0.0.1 8080 A_10kB 100 8 [max_streams]
+    #python3 http2.py segmented 127.0.0.1 8080 A_10MB 10 4 [--http1] [--discard]
+    #python3 http2.py sweep 127.0.0.1 8080 A_10MB 5 --no-tls --initial-window 65535,1048576 --max-streams 10,100
+    main(sys.argv[1:])
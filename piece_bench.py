@@ -0,0 +1,171 @@
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import libtorrent as lt
+
+import results_store
+import testdata
+import timing
+import torrent_files
+import torrent_session
+import wire_stats
+
+# Piece-size benchmark for the BitTorrent experiment.
+#
+# Every file of a testdata manifest (by default the 10kB to 10MB grid,
+# generated into a temporary directory) is turned into one torrent per piece
+# size of the policy (by default sweep, see torrent_files.py) and downloaded
+# several times from a seeder session to a leecher session in this process.
+# Both listen on loopback with DHT, LSD and port mapping off; the leecher
+# connects to the seeder directly, so no tracker is needed and the numbers
+# show what the piece size itself costs. Per file and piece size it reports:
+#   pieces   - pieces in the torrent
+#   metadata - size of the .torrent, which every leecher fetches first
+#   hash     - time to hash the file and create the torrent, bypassing the
+#              .torrent cache the seeders use
+#   transfer - median time from connecting to the seeder to the last byte,
+#              timed from the alerts as the leechers do. connect_peer only
+#              takes effect on libtorrent's next one-second tick, so the wait
+#              before the connection is left out.
+#   overhead - application bytes in both directions at the leecher over the
+#              file size, as the leechers report it (HAVE messages, requests
+#              and piece headers grow with the piece count)
+
+BENCH_SETTINGS = dict(
+    torrent_session.LEECHER_SETTINGS,
+    listen_interfaces='127.0.0.1:0',
+    enable_dht=False,
+    enable_lsd=False,
+    enable_upnp=False,
+    enable_natpmp=False,
+)
+
+def start_seeder():
+    session = lt.session()
+    session.apply_settings(dict(BENCH_SETTINGS, alert_mask=torrent_session.alert_mask("bulk")))
+    return session
+
+def seed(session, torrent_path, save_dir, timeout):
+    # Adds the torrent and waits until the file is checked and seeding.
+    # seed_mode would skip the check, but it verifies each piece when it is
+    # first requested instead, which stalls some transfers for a second.
+    handle = session.add_torrent({
+        'ti': torrent_session.load_torrent_info(torrent_path),
+        'save_path': save_dir,
+    })
+    deadline = time.monotonic() + timeout
+    while not handle.status().is_seeding:
+        if time.monotonic() > deadline:
+            raise TimeoutError("seeder did not start seeding")
+        time.sleep(0.01)
+    session.pop_alerts()
+    return handle
+
+def download(leecher, download_dir, seeder_port, file_size, timeout):
+    # One transfer; returns (seconds from peer connection to last byte,
+    # application overhead)
+    timer = timing.PhaseTimer(timing.TORRENT_PHASES)
+    session = leecher.session
+    handle = leecher.add(download_dir)
+    dispatcher = torrent_session.LeecherAlerts(handle, timer, leecher.profile, emit=lambda message: None)
+    handle.connect_peer(("127.0.0.1", seeder_port))
+    deadline = time.monotonic() + timeout
+    try:
+        while "last_byte" not in timer.marks:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"no complete download within {timeout}s")
+            session.wait_for_alert(torrent_session.ALERT_WAIT_MS)
+            dispatcher.dispatch(session.pop_alerts())
+        s = handle.status()
+        counters = {
+            "app_sent": s.total_upload - s.total_payload_upload,
+            "app_received": s.total_download,
+        }
+        connected = timer.marks.get("peer_connect", timer.start_ns)
+        transfer_time = (timer.marks["last_byte"] - connected) / 1e9
+        return transfer_time, wire_stats.overhead_report(counters, file_size)["application"]
+    finally:
+        handle.pause()
+        leecher.remove(handle, delete_files=True)
+
+def run_benchmark(manifest=None, policy="sweep", runs=3, timeout=60, results=None, threads=None):
+    workdir = tempfile.mkdtemp(prefix="piece_bench_")
+    try:
+        if manifest is None:
+            manifest = os.path.join(workdir, testdata.MANIFEST_FILE)
+            testdata.generate(os.path.join(workdir, "files"), manifest_path=manifest)
+        download_dir = os.path.join(workdir, "downloads")
+        os.makedirs(download_dir)
+        seeder = start_seeder()
+        seeder_port = seeder.listen_port()
+
+        print(f"Piece size benchmark, policy {policy}, median of {runs} transfers over loopback, "
+              f"hashing on {torrent_files.hash_threads(threads)} thread(s)")
+        print(f"{'file':<16} {'piece':>7} {'pieces':>7} {'metadata':>9} {'hash ms':>9} "
+              f"{'transfer ms':>12} {'overhead':>9}")
+        records = []
+        for entry in testdata.load_manifest(manifest):
+            file_path = entry["path"]
+            file_size = os.path.getsize(file_path)
+            for piece_size in torrent_files.piece_sizes(file_size, policy):
+                label = torrent_files.format_piece_size(piece_size)
+                torrent_path = os.path.join(workdir, f"{entry['name']}_{label}.torrent")
+                start = time.perf_counter_ns()
+                torrent_path, metadata_size, _ = torrent_files.create_torrent(
+                    file_path, piece_size, torrent_path=torrent_path, threads=threads, cache=False)
+                hash_time = (time.perf_counter_ns() - start) / 1e9
+                pieces = -(-file_size // piece_size)
+
+                seed_handle = seed(seeder, torrent_path, os.path.dirname(file_path), timeout)
+                leecher = torrent_session.LeecherSession(torrent_path, "warm", BENCH_SETTINGS, "timing")
+                leecher.start()
+                try:
+                    transfers = [download(leecher, download_dir, seeder_port, file_size, timeout)
+                                 for _ in range(runs)]
+                except TimeoutError as e:
+                    print(f"{entry['name']:<16} {label:>7} failed: {e}")
+                    continue
+                finally:
+                    leecher.session = None
+                    seeder.remove_torrent(seed_handle)
+
+                transfer_time = statistics.median(t for t, _ in transfers)
+                overhead = statistics.median(ovh for _, ovh in transfers)
+                print(f"{entry['name']:<16} {label:>7} {pieces:>7} {metadata_size:>9} {hash_time * 1000:9.1f} "
+                      f"{transfer_time * 1000:12.1f} {overhead:9.4f}")
+                records.append(results_store.make_record(
+                    "BitTorrent", "piece_size", file_path, file_size,
+                    piece_size=piece_size, pieces=pieces, metadata_bytes=metadata_size, hash_time=hash_time,
+                    hash_threads=torrent_files.hash_threads(threads),
+                    transfers=len(transfers), transfer_time=transfer_time,
+                    transfer_times=[t for t, _ in transfers], overhead=overhead))
+        if results:
+            results_store.append(records, results)
+            print(f"Results appended to {results}")
+        return records
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    #python3 piece_bench.py
+    #python3 piece_bench.py --policy 16kB,256kB,4MB --runs 5
+    #python3 piece_bench.py --manifest bittorrent/manifest.json --results piece_results.jsonl
+    parser = argparse.ArgumentParser(description="Measure BitTorrent transfer time, metadata size and "
+                                                 "overhead per piece size")
+    parser.add_argument("--manifest", help="testdata manifest to run (default: the 10kB to 10MB grid)")
+    parser.add_argument("--policy", default="sweep",
+                        help="piece sizes: sweep, auto, a size or a comma-separated list (default: sweep)")
+    parser.add_argument("--runs", type=int, default=3, help="transfers per file and piece size (default: 3)")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a transfer is abandoned")
+    parser.add_argument("--results", help="also append one record per file and piece size to this store")
+    parser.add_argument("--threads", type=int, help="hashing threads (default: $HASH_THREADS or one per CPU)")
+    args = parser.parse_args()
+    try:
+        run_benchmark(args.manifest, args.policy, args.runs, args.timeout, args.results, args.threads)
+    except ValueError as e:
+        sys.exit(str(e))
@@ -0,0 +1,104 @@
+import json
+import os
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from concurrent processes are not serialized
+    fcntl = None
+
+# Append-only results store shared by every experiment script.
+#
+# Each transfer and each run summary is one JSON object on its own line, so
+# writing a result costs one locked append instead of reading, modifying and
+# rewriting a whole spreadsheet, and concurrent writers (e.g. three leechers
+# sharing a volume) cannot lose each other's rows. export_results.py turns
+# the store into the Excel summary table.
+#
+# Every record has timestamp, protocol, kind ("transfer" for one download,
+# "summary" for the aggregate of a run), file, file_size and size_category;
+# the remaining fields depend on the kind and the protocol.
+
+RESULTS_FILE = "results.jsonl"
+
+# Binary units, as testdata.py and dd use them (10kB is 10240 bytes)
+_UNITS = (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("kB", 1024))
+
+def results_path(path=None):
+    # Explicit path, then $RESULTS_FILE, then results.jsonl in the working directory
+    return path or os.environ.get("RESULTS_FILE") or RESULTS_FILE
+
+def size_category(file_size_bytes):
+    # "<size> file" with the size in the largest unit it reaches, so every
+    # size of a testdata.py grid is a category of its own: 10240 bytes is
+    # "10kB file", 3145728 "3MB file" and 1536 "1.5kB file"
+    for unit, factor in _UNITS:
+        if file_size_bytes >= factor:
+            return f"{file_size_bytes / factor:.4g}{unit} file"
+    return f"{file_size_bytes}B file"
+
+# The four sizes of the original experiments, which the Summary sheet always
+# has columns for
+ORIGINAL_SIZES = (10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2)
+SIZE_CATEGORIES = tuple(size_category(size) for size in ORIGINAL_SIZES)
+
+def make_record(protocol, kind, file_name, file_size_bytes, **fields):
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "protocol": protocol,
+        "kind": kind,
+        "file": os.path.basename(file_name),
+        "file_size": file_size_bytes,
+        "size_category": size_category(file_size_bytes),
+    }
+    record.update(fields)
+    return record
+
+def _to_json(value):
+    # numpy scalars and the like
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def append(records, path=None):
+    # Appends one record or a list of records with a single write under an
+    # exclusive lock, so lines from concurrent writers never interleave
+    if isinstance(records, dict):
+        records = [records]
+    data = "".join(json.dumps(record, default=_to_json) + "\n" for record in records).encode()
+    if not data:
+        return
+    path = results_path(path)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)  # also releases the lock
+
+def read(path=None, kind=None, protocol=None):
+    # All records in the store, oldest first, optionally filtered. A line cut
+    # short by a crashed writer is skipped.
+    path = results_path(path)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if kind is not None and record.get("kind") != kind:
+                continue
+            if protocol is not None and record.get("protocol") != protocol:
+                continue
+            records.append(record)
+    return records
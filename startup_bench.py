@@ -0,0 +1,161 @@
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cold-start benchmark for every script and mode.
+#
+# Each case is a fresh interpreter, timed with perf_counter_ns:
+#   load   - executing the module without its __main__ block, i.e. what the
+#            module-level imports cost
+#   server - from spawn until the port accepts connections
+#   client - a complete one-request run against a server started beforehand,
+#            so with a small file nearly all of it is start-up
+# Cases whose dependencies (httpx, fastapi, libtorrent, ...) are not installed
+# are reported as failed with the interpreter's last error line.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEST_FILE = "startup_bench_10kB"
+
+def _load(script):
+    return ["-c", f"import runpy; runpy.run_path({script!r}, run_name='startup_bench')"]
+
+# (name, kind, argv, server argv for client cases)
+CASES = [
+    ("python -c pass", "load", ["-c", "pass"], None),
+    ("http1.py load", "load", _load("http1.py"), None),
+    ("http1.py server", "server", ["http1.py", "server", "--port", "{port}", "--directory", "{dir}"], None),
+    ("http1.py client", "client",
+     ["http1.py", "client", "127.0.0.1", "{port}", TEST_FILE, "1", "--delay", "0", "--discard"],
+     ["http1.py", "server", "--port", "{port}", "--directory", "{dir}", "--mode", "threaded"]),
+    ("http1_loadgen.py load", "load", _load("http1_loadgen.py"), None),
+    ("http2/http2.py load", "load", _load("http2/http2.py"), None),
+    ("http2/http2_log.py load", "load", _load("http2/http2_log.py"), None),
+    ("http2/http2_withoutcert.py load", "load", _load("http2/http2_withoutcert.py"), None),
+    ("http2/http2_withoutcert.py server", "server",
+     ["http2/http2_withoutcert.py", "server", "127.0.0.1", "{port}"], None),
+    ("http2/http2_withoutcert.py client", "client",
+     ["http2/http2_withoutcert.py", "client", "127.0.0.1", "{port}", TEST_FILE, "1"],
+     ["http2/http2_withoutcert.py", "server", "127.0.0.1", "{port}"]),
+    ("http2/http2_withoutcertlog.py load", "load", _load("http2/http2_withoutcertlog.py"), None),
+    ("btorr.py load", "load", _load("btorr.py"), None),
+    ("bt.py load", "load", _load("bt.py"), None),
+    ("bittorrent/bt.py load", "load", _load("bittorrent/bt.py"), None),
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, proc, timeout):
+    # Polls until the port accepts a connection; returns False if the
+    # process died or the timeout passed first
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                return True
+        except OSError:
+            time.sleep(0.001)
+    return False
+
+def stop(proc):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+def _resolve(argv, workdir, port):
+    argv = [arg.format(port=port, dir=workdir) for arg in argv]
+    # Scripts are given relative to the repository root
+    if argv[0].endswith(".py"):
+        argv[0] = os.path.join(ROOT, argv[0])
+    return [sys.executable] + argv
+
+def _last_error(stderr):
+    lines = [line for line in stderr.decode(errors="replace").splitlines() if line.strip()]
+    return lines[-1] if lines else "no output"
+
+def run_case(kind, argv, server_argv, workdir, env, timeout):
+    # Returns (seconds, None) or (None, error message) for one cold start
+    port = free_port()
+    server = None
+    try:
+        if server_argv:
+            server = subprocess.Popen(_resolve(server_argv, workdir, port), cwd=workdir, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if not wait_for_port(port, server, timeout):
+                stop(server)
+                return None, f"server did not start: {_last_error(server.stderr.read())}"
+
+        command = [sys.executable] + argv if kind == "load" else _resolve(argv, workdir, port)
+        start = time.perf_counter_ns()
+        if kind == "server":
+            proc = subprocess.Popen(command, cwd=workdir, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            ready = wait_for_port(port, proc, timeout)
+            elapsed = (time.perf_counter_ns() - start) / 1e9
+            stop(proc)
+            if not ready:
+                return None, _last_error(proc.stderr.read())
+            return elapsed, None
+
+        proc = subprocess.run(command, cwd=ROOT if kind == "load" else workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        if proc.returncode != 0:
+            return None, _last_error(proc.stderr)
+        return elapsed, None
+    except subprocess.TimeoutExpired:
+        return None, f"timed out after {timeout}s"
+    finally:
+        if server is not None:
+            stop(server)
+
+def run_benchmark(runs=5, only=None, timeout=30):
+    workdir = tempfile.mkdtemp(prefix="startup_bench_")
+    with open(os.path.join(workdir, TEST_FILE), "wb") as f:
+        f.write(os.urandom(10 * 1024))
+    env = dict(os.environ, RESULTS_FILE=os.path.join(workdir, "results.jsonl"))
+
+    print(f"Cold start over {runs} runs (ms)")
+    print(f"{'case':<38} {'median':>9} {'min':>9} {'max':>9}")
+    try:
+        for name, kind, argv, server_argv in CASES:
+            if only and not any(pattern in name for pattern in only):
+                continue
+            times = []
+            error = None
+            for _ in range(runs):
+                elapsed, error = run_case(kind, argv, server_argv, workdir, env, timeout)
+                if error:
+                    break
+                times.append(elapsed)
+            if error:
+                print(f"{name:<38} failed: {error}")
+                continue
+            print(f"{name:<38} {statistics.median(times) * 1000:9.1f} "
+                  f"{min(times) * 1000:9.1f} {max(times) * 1000:9.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    #python3 startup_bench.py
+    #python3 startup_bench.py --runs 20 --only http1
+    parser = argparse.ArgumentParser(description="Measure cold-start time of each script and mode")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per case (default: 5)")
+    parser.add_argument("--only", nargs="+", help="run only cases whose name contains one of these strings")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a case is abandoned")
+    args = parser.parse_args()
+    run_benchmark(args.runs, args.only, args.timeout)
@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import byte_ranges
+import results_store
+
+# Test files for the HTTP/1.1, HTTP/2 and BitTorrent experiments, on a
+# logarithmic size grid with controlled compressibility, plus a manifest the
+# runners read instead of a single file name.
+#
+# Content is a pure function of (size, entropy, seed), so every file is
+# generated once into a cache directory named by the hash of that spec and
+# hard-linked into the output directory; a rerun only stats the cache. The
+# manifest records each file's SHA-256 so a copy on another machine can be
+# checked with the verify command.
+#
+# Entropy is the fraction of every 4 kB page filled with random bytes, the
+# rest being zeros: 0 is what dd from /dev/zero gives (written as a sparse
+# file, so it takes no time or disk), 1 is /dev/urandom, and anything in
+# between compresses to roughly that fraction.
+
+# Bumped whenever the content for a spec changes, so old cache entries are
+# not reused
+GENERATOR_VERSION = 1
+
+PAGE_SIZE = 4096
+BLOCK_SIZE = 1024 * 1024
+
+# Same binary units dd uses (bs=10k is 10240 bytes), so A_10kB stays 10240
+UNITS = (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("kB", 1024), ("B", 1))
+
+# Multipliers within each unit for 1, 2 or 3 sizes per decade
+DECADE_STEPS = {1: (1,), 2: (1, 3), 3: (1, 2, 5)}
+
+# Bytes each file is downloaded in total: the original 333 x 10kB,
+# 33 x 100kB, 3 x 1MB and 1 x 10MB runs
+DEFAULT_BUDGET_BYTES = 333 * 10 * 1024
+
+MANIFEST_FILE = "manifest.json"
+CACHE_DIR = ".testdata_cache"
+
+def parse_size(text):
+    # "10kB", "1MB", "4GB" or a plain byte count
+    text = text.strip()
+    for unit, factor in UNITS:
+        if text.lower().endswith(unit.lower()) and text[:-len(unit)].strip():
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+def size_label(size):
+    for unit, factor in UNITS:
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+def size_grid(min_size, max_size, per_decade=1):
+    # Sizes 1, 10 and 100 (or 1, 2, 5, 10, ...) of every unit between
+    # min_size and max_size, ascending
+    sizes = set()
+    for _, factor in UNITS[:-1]:
+        for decade in (1, 10, 100):
+            for step in DECADE_STEPS[per_decade]:
+                size = step * decade * factor
+                if min_size <= size <= max_size:
+                    sizes.add(size)
+    return sorted(sizes)
+
+def spec_key(size, entropy, seed):
+    spec = json.dumps({"version": GENERATOR_VERSION, "size": size, "entropy": entropy, "seed": seed},
+                      sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:20]
+
+def _blocks(size, entropy, seed):
+    # The file's content as BLOCK_SIZE pieces (the last one shorter)
+    import numpy as np  # PCG64 is several times faster than random.randbytes
+
+    rng = np.random.default_rng([seed, size, round(entropy * PAGE_SIZE)])
+    random_per_page = round(entropy * PAGE_SIZE)
+    zeros = bytes(BLOCK_SIZE)
+    for offset in range(0, size, BLOCK_SIZE):
+        length = min(BLOCK_SIZE, size - offset)
+        if random_per_page == 0:
+            yield zeros[:length]
+        elif random_per_page == PAGE_SIZE:
+            yield rng.bytes(length)
+        else:
+            pages = -(-length // PAGE_SIZE)
+            block = np.zeros((pages, PAGE_SIZE), dtype=np.uint8)
+            block[:, :random_per_page] = np.frombuffer(rng.bytes(pages * random_per_page),
+                                                       dtype=np.uint8).reshape(pages, random_per_page)
+            yield block.tobytes()[:length]
+
+def _write(path, size, entropy, seed, sparse=True):
+    # Writes the file and returns its SHA-256. All-zero content is only
+    # hashed: the file is truncated to size, which leaves it sparse, or
+    # allocated with fallocate when sparse is off.
+    digest = hashlib.sha256()
+    if entropy == 0:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if sparse or not hasattr(os, "posix_fallocate") or not size:
+                os.ftruncate(fd, size)
+            else:
+                os.posix_fallocate(fd, 0, size)
+        finally:
+            os.close(fd)
+        for block in _blocks(size, entropy, seed):
+            digest.update(block)
+        return digest.hexdigest()
+
+    # Allocated up front so the file does not grow block by block
+    fd = byte_ranges.open_preallocated(path, size)
+    try:
+        offset = 0
+        for block in _blocks(size, entropy, seed):
+            os.pwrite(fd, block, offset)
+            digest.update(block)
+            offset += len(block)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+def _link(source, target):
+    # Exposes a cache entry under its file name: a hard link where possible,
+    # which costs nothing, otherwise a copy
+    try:
+        if os.path.samefile(source, target):
+            return
+        os.remove(target)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def ensure_file(cache_dir, size, entropy, seed=0, sparse=True):
+    # Path of the cached file for this spec and its metadata, generating it
+    # only when the cache has no intact copy
+    os.makedirs(cache_dir, exist_ok=True)
+    key = spec_key(size, entropy, seed)
+    path = os.path.join(cache_dir, key)
+    meta_path = path + ".json"
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        st = os.stat(path)
+        if st.st_size == size and st.st_mtime_ns == meta["mtime_ns"]:
+            return path, meta, True
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha256 = _write(path, size, entropy, seed, sparse)
+    meta = {"key": key, "size": size, "entropy": entropy, "seed": seed, "sha256": sha256,
+            "sparse": entropy == 0 and sparse, "mtime_ns": os.stat(path).st_mtime_ns}
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return path, meta, False
+
+def generate(output_dir=".", sizes=None, entropies=(0.0,), seed=0, prefix="A", sparse=True,
+             budget_bytes=DEFAULT_BUDGET_BYTES, cache_dir=None, manifest_path=None):
+    # Creates one file per size and entropy in output_dir and writes the
+    # manifest. Names are <prefix>_<size>, with _e<percent> appended when
+    # several entropy levels are generated.
+    sizes = sizes or size_grid(10 * 1024, 10 * 1024 ** 2)
+    cache_dir = cache_dir or os.path.join(output_dir, CACHE_DIR)
+    manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_FILE)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    entries = []
+    for size in sizes:
+        for entropy in entropies:
+            name = f"{prefix}_{size_label(size)}"
+            if len(entropies) > 1:
+                name += f"_e{round(entropy * 100):03d}"
+            cached_path, meta, reused = ensure_file(cache_dir, size, entropy, seed, sparse)
+            path = os.path.join(output_dir, name)
+            _link(cached_path, path)
+            print(f"{name:<24} {size:>14} bytes  entropy {entropy:.2f}  {'cached' if reused else 'generated'}")
+            entries.append({
+                "name": name,
+                "path": os.path.relpath(os.path.abspath(path), manifest_dir),
+                "size": size,
+                "size_category": results_store.size_category(size),
+                "entropy": entropy,
+                "seed": seed,
+                "sha256": meta["sha256"],
+                "sparse": meta["sparse"],
+                "iterations": max(1, round(budget_bytes / size)),
+            })
+
+    with open(manifest_path, "w") as f:
+        json.dump({"version": GENERATOR_VERSION, "files": entries}, f, indent=2)
+    print(f"Manifest with {len(entries)} files written to {manifest_path}")
+    return entries
+
+def load_manifest(path):
+    # Manifest entries with "path" resolved against the manifest's directory
+    with open(path) as f:
+        entries = json.load(f)["files"]
+    base = os.path.dirname(os.path.abspath(path))
+    for entry in entries:
+        entry["path"] = os.path.join(base, entry["path"])
+    return entries
+
+def expand(file_arg, iterations=None):
+    # (file name, iterations) pairs for a runner's file argument: the file
+    # itself, or every file of a manifest given as @manifest.json. A
+    # manifest's per-file iterations apply unless iterations is given.
+    if not file_arg.startswith("@"):
+        return [(file_arg, iterations or 1)]
+    return [(entry["name"], iterations or entry["iterations"]) for entry in load_manifest(file_arg[1:])]
+
+def verify(manifest_path):
+    # Rehashes every file in the manifest; returns the names that differ
+    bad = []
+    for entry in load_manifest(manifest_path):
+        digest = hashlib.sha256()
+        try:
+            with open(entry["path"], "rb") as f:
+                while block := f.read(BLOCK_SIZE):
+                    digest.update(block)
+        except OSError as e:
+            print(f"{entry['name']:<24} missing ({e.strerror})")
+            bad.append(entry["name"])
+            continue
+        ok = digest.hexdigest() == entry["sha256"]
+        print(f"{entry['name']:<24} {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            bad.append(entry["name"])
+    return bad
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate test files and the manifest the runners read")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gen = subparsers.add_parser("generate", help="create the files and write the manifest")
+    gen.add_argument("--output", default=".", help="directory for the files (default: .)")
+    gen.add_argument("--sizes", help="comma-separated sizes, e.g. 10kB,1MB (overrides the grid)")
+    gen.add_argument("--min", default="10kB", help="smallest size on the grid (default: 10kB)")
+    gen.add_argument("--max", default="10MB", help="largest size on the grid (default: 10MB)")
+    gen.add_argument("--per-decade", type=int, choices=sorted(DECADE_STEPS), default=1,
+                     help="grid sizes per factor of ten (default: 1)")
+    gen.add_argument("--entropy", default="0",
+                     help="comma-separated random fractions, 0 (zeros) to 1 (random) (default: 0)")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--prefix", default="A", help="file name prefix (default: A)")
+    gen.add_argument("--no-sparse", dest="sparse", action="store_false",
+                     help="allocate all-zero files with fallocate instead of leaving them sparse")
+    gen.add_argument("--budget", default=size_label(DEFAULT_BUDGET_BYTES),
+                     help="bytes each file is downloaded in total, which sets its iterations")
+    gen.add_argument("--cache", help=f"cache directory (default: <output>/{CACHE_DIR})")
+    gen.add_argument("--manifest", help=f"manifest path (default: <output>/{MANIFEST_FILE})")
+
+    listing = subparsers.add_parser("list", help="print '<name> <iterations>' per file, for shell loops")
+    listing.add_argument("manifest")
+
+    check = subparsers.add_parser("verify", help="rehash the files against the manifest")
+    check.add_argument("manifest")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    #python3 testdata.py generate
+    #python3 testdata.py generate --min 1kB --max 4GB --per-decade 2 --entropy 0,0.5,1
+    #python3 testdata.py list manifest.json
+    #python3 http1.py client 127.0.0.1 8080 @manifest.json
+    args = parse_args()
+    if args.command == "generate":
+        if args.sizes:
+            sizes = [parse_size(size) for size in args.sizes.split(",")]
+        else:
+            sizes = size_grid(parse_size(args.min), parse_size(args.max), args.per_decade)
+        entropies = tuple(float(value) for value in args.entropy.split(","))
+        if any(not 0 <= entropy <= 1 for entropy in entropies):
+            sys.exit("Entropy values must be between 0 and 1")
+        generate(args.output, sizes, entropies, args.seed, args.prefix, args.sparse, parse_size(args.budget),
+                 args.cache, args.manifest)
+    elif args.command == "list":
+        for entry in load_manifest(args.manifest):
+            print(entry["name"], entry["iterations"])
+    else:
+        sys.exit(1 if verify(args.manifest) else 0)
@@ -0,0 +1,71 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("libtorrent")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import results_store
+
+def load(name, path):
+    # bittorrent/bt.py shares its module name with the root bt.py
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+bt = load("bittorrent_bt", "bittorrent/bt.py")
+aggregate = load("bittorrent_aggregate_results", "bittorrent/aggregate_results.py")
+
+@pytest.fixture
+def experiment(tmp_path, monkeypatch):
+    # A leecher's view: the downloaded files, and the store in results/
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "results").mkdir()
+    store = tmp_path / "results" / bt.RESULTS_FILE
+    monkeypatch.setattr(bt, "results_store_path", lambda: str(store))
+    for name, size in (("A_10kB", 10 * 1024), ("A_3MB", 3 * 1024 ** 2)):
+        with open(tmp_path / name, "wb") as f:
+            f.truncate(size)
+    return store
+
+def test_leecher_results_go_to_the_store(experiment, monkeypatch):
+    monkeypatch.setenv("LEECHER_ID", "leecher1")
+    monkeypatch.setattr(bt.socket, "gethostname", lambda: "host")
+    for iteration in range(2):
+        bt.save_individual_result(0.5, 160.0, "A_10kB", iteration, 3 * 10 * 1024, 1.1,
+                                  overhead_layers={"application": 1.05})
+    bt.save_results(0.5, 160.0, 0.0, "A_10kB", 1.1, 0.0, 1.05, {"session_mode": "warm", "piece_size": 16384})
+
+    transfers = results_store.read(str(experiment), kind="transfer")
+    assert [record["iteration"] for record in transfers] == [0, 1]
+    assert all(record["leecher_id"] == "leecher1" for record in transfers)
+    assert transfers[0]["overhead"] == 1.05
+    [summary] = results_store.read(str(experiment), kind="summary")
+    assert summary["size_category"] == "10kB file"
+    assert summary["throughput_avg_kbps"] == 160.0
+    assert summary["transfer_ratio"] == 1.1
+    assert summary["piece_size"] == 16384
+
+def test_aggregate_writes_the_csv_files(experiment):
+    records = [
+        results_store.make_record("BitTorrent", "transfer", name, size, leecher_id=leecher, iteration=0,
+                                  transfer_time=1.0, throughput_kbps=100.0, total_data_transferred=size,
+                                  transfer_ratio=1.0, overhead=1.05)
+        for name, size in (("A_10kB", 10 * 1024), ("A_3MB", 3 * 1024 ** 2))
+        for leecher in ("leecher1", "leecher2", "leecher3")
+    ]
+    results_store.append(records, str(experiment))
+
+    aggregate.aggregate_results()
+
+    combined = pd.read_csv("results/combined_data_analysis.csv").set_index("Size Category")
+    assert list(combined.index) == ["10kB file", "3MB file"]
+    assert combined.at["3MB file", "Total Data Transferred"] == 3 * 3 * 1024 ** 2
+    assert combined.at["3MB file", "Combined Transfer Ratio"] == 1.0
+    for name in ("all_leechers_results.csv", "leechers_performance_comparison.csv", "all_leechers_summary.csv"):
+        assert os.path.exists(os.path.join("results", name))
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import byte_ranges
+
+def test_parse_byte_range():
+    assert byte_ranges.parse_byte_range("bytes=0-99", 1000) == (0, 99)
+    assert byte_ranges.parse_byte_range("bytes=900-1999", 1000) == (900, 999)
+    # Open-ended and suffix ranges
+    assert byte_ranges.parse_byte_range("bytes=600-", 1000) == (600, 999)
+    assert byte_ranges.parse_byte_range("bytes=-100", 1000) == (900, 999)
+    assert byte_ranges.parse_byte_range("bytes=-5000", 1000) == (0, 999)
+
+def test_ranges_to_ignore():
+    # Answered with the whole file
+    assert byte_ranges.parse_byte_range("bytes=0-99,200-299", 1000) is None
+    assert byte_ranges.parse_byte_range("items=0-9", 1000) is None
+    assert byte_ranges.parse_byte_range("bytes=99-0", 1000) is None
+    assert byte_ranges.parse_byte_range("bytes=a-b", 1000) is None
+    assert byte_ranges.parse_byte_range("bytes=-", 1000) is None
+
+def test_unsatisfiable_ranges():
+    with pytest.raises(ValueError):
+        byte_ranges.parse_byte_range("bytes=1000-", 1000)
+    with pytest.raises(ValueError):
+        byte_ranges.parse_byte_range("bytes=-0", 1000)
+
+def test_ranged_file_response(tmp_path):
+    pytest.importorskip("starlette")
+    path = tmp_path / "A_1kB"
+    path.write_bytes(bytes(range(256)) * 4)
+
+    response = byte_ranges.ranged_file_response(str(path), "bytes=-16")
+    assert response.status_code == 206
+    assert response.body == bytes(range(240, 256))
+    assert response.headers["content-range"] == "bytes 1008-1023/1024"
+
+    response = byte_ranges.ranged_file_response(str(path), "bytes=2048-")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+    assert byte_ranges.ranged_file_response(str(path), "bytes=0-9,20-29") is None
+    assert byte_ranges.ranged_file_response(str(path), None) is None
+
+def test_split_ranges_cover_the_file():
+    assert byte_ranges.split_ranges(10, 3) == [(0, 3), (4, 6), (7, 9)]
+    assert byte_ranges.split_ranges(2, 4) == [(0, 0), (1, 1)]
+    assert byte_ranges.split_ranges(0, 4) == []
+    assert byte_ranges.total_size(byte_ranges.content_range(4, 6, 10)) == 10
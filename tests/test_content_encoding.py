@@ -0,0 +1,62 @@
+import asyncio
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import content_encoding
+
+OFFERED = ("zstd", "br", "gzip")
+
+class FakeRequest:
+    # What download_response reads from a Starlette request
+    def __init__(self, **headers):
+        self.headers = {name.replace("_", "-"): value for name, value in headers.items()}
+
+def test_negotiate_follows_the_q_values():
+    assert content_encoding.negotiate("gzip", OFFERED) == "gzip"
+    assert content_encoding.negotiate("gzip;q=0.5, br;q=0.8", OFFERED) == "br"
+    assert content_encoding.negotiate("GZIP;q=0.5, br;q=0", OFFERED) == "gzip"
+    # Equal weights go to the server's preference
+    assert content_encoding.negotiate("gzip, br", OFFERED) == "br"
+    assert content_encoding.negotiate("*", ("gzip",)) == "gzip"
+    assert content_encoding.negotiate("*;q=0", OFFERED) is None
+    assert content_encoding.negotiate(None, OFFERED) is None
+
+def test_identity_refused():
+    # identity;q=0 forbids an uncompressed body, so an offered coding wins;
+    # with nothing acceptable the body is still sent uncompressed
+    assert content_encoding.negotiate("identity;q=0, gzip;q=0.1", OFFERED) == "gzip"
+    assert content_encoding.negotiate("identity;q=0", OFFERED) is None
+
+def test_variant_etag():
+    assert content_encoding.variant_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert content_encoding.variant_etag('W/"abc"', "br") == 'W/"abc-br"'
+
+def test_download_response_varies_on_accept_encoding(tmp_path):
+    pytest.importorskip("starlette")
+    import download_cache
+
+    (tmp_path / "A_10kB").write_bytes(b"hello world " * 1000)
+    entry = download_cache.DownloadCache(str(tmp_path)).lookup("A_10kB")
+    variants = content_encoding.CompressedVariants(("gzip",))
+
+    def respond(**headers):
+        return asyncio.run(download_cache.download_response(entry, FakeRequest(**headers), variants=variants))
+
+    compressed = respond(accept_encoding="gzip")
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.headers["etag"] == content_encoding.variant_etag(entry.headers["etag"], "gzip")
+    assert gzip.decompress(compressed.body) == entry.data
+
+    plain = respond(accept_encoding="identity")
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert plain.headers["etag"] == entry.headers["etag"]
+
+    # Each coding is its own representation for revalidation
+    assert respond(accept_encoding="gzip", if_none_match=compressed.headers["etag"]).status_code == 304
+    assert respond(accept_encoding="identity", if_none_match=compressed.headers["etag"]).status_code == 200
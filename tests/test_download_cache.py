@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("starlette")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download_cache
+
+@pytest.fixture
+def cache(tmp_path):
+    (tmp_path / "A_10kB").write_bytes(b"a" * 10 * 1024)
+    return download_cache.DownloadCache(str(tmp_path))
+
+def test_unchanged_file_is_a_hit(cache):
+    first = cache.lookup("A_10kB")
+    assert cache.lookup("A_10kB") is first
+    assert (cache.hits, cache.misses, cache.invalidations) == (1, 1, 0)
+
+def test_changed_file_is_reloaded(cache, tmp_path):
+    path = tmp_path / "A_10kB"
+    first = cache.lookup("A_10kB")
+
+    # Same size, new mtime
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    second = cache.lookup("A_10kB")
+    assert second is not first
+    assert second.headers["etag"] != first.headers["etag"]
+
+    # New size; the mtime is pinned so only the size differs
+    st = os.stat(path)
+    path.write_bytes(b"b" * 20 * 1024)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    third = cache.lookup("A_10kB")
+    assert third.size == 20 * 1024
+    assert third.data == b"b" * 20 * 1024
+
+    assert (cache.hits, cache.misses, cache.invalidations) == (0, 3, 2)
+    assert cache.stats()["bytes"] == 20 * 1024
+
+def test_deleted_file_is_dropped(cache, tmp_path):
+    cache.lookup("A_10kB")
+    os.remove(tmp_path / "A_10kB")
+    assert cache.lookup("A_10kB") is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+# The scripts live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import export_results
+import results_store
+
+KB = 1024
+MB = 1024 ** 2
+
+def summary(protocol, size, throughput, overhead=1.01):
+    return results_store.make_record(protocol, "summary", f"A_{size}", size, transfers=3,
+                                     throughput_avg_kbps=throughput, throughput_std_kbps=throughput / 10,
+                                     overhead=overhead)
+
+def test_size_category_follows_the_file_size():
+    assert results_store.size_category(10 * KB) == "10kB file"
+    assert results_store.size_category(3 * MB) == "3MB file"
+    assert results_store.size_category(100 * MB) == "100MB file"
+    assert results_store.size_category(1536) == "1.5kB file"
+    assert results_store.size_category(500) == "500B file"
+    assert results_store.SIZE_CATEGORIES == ("10kB file", "100kB file", "1MB file", "10MB file")
+
+def test_summary_keeps_every_size_apart():
+    sizes = [10 * KB, 100 * KB, 1 * MB, 3 * MB, 10 * MB, 100 * MB, 1024 * MB]
+    summaries = [summary("HTTP/1.1", size, 1000 + i) for i, size in enumerate(sizes)]
+    summaries.append(summary("BitTorrent", 100 * MB, 5000, overhead=1.2))
+
+    df = export_results.summary_table(summaries)
+
+    categories = ["10kB file", "100kB file", "1MB file", "3MB file", "10MB file", "100MB file", "1GB file"]
+    assert list(df.columns) == ([f"{size}_{stat}" for size in categories for stat in ("Average", "Std. Dev.")]
+                                + [f"{size}_Overhead" for size in categories])
+    assert list(df.index) == ["HTTP/1.1", "BitTorrent"]
+    for i, size in enumerate(categories):
+        assert df.at["HTTP/1.1", f"{size}_Average"] == 1000 + i
+    assert df.at["BitTorrent", "100MB file_Average"] == 5000
+    assert df.at["BitTorrent", "100MB file_Overhead"] == 1.2
+    assert pd.isna(df.at["BitTorrent", "10MB file_Average"])
+
+def test_summary_recategorizes_old_records():
+    # Stored before categories followed the size, when everything above 1MB
+    # was a "10MB file"
+    old = [dict(summary("HTTP/2", size, throughput), size_category="10MB file")
+           for size, throughput in ((3 * MB, 300), (10 * MB, 1000), (100 * MB, 10000))]
+
+    df = export_results.summary_table(old)
+
+    assert df.at["HTTP/2", "3MB file_Average"] == 300
+    assert df.at["HTTP/2", "10MB file_Average"] == 1000
+    assert df.at["HTTP/2", "100MB file_Average"] == 10000
+
+def test_export_writes_the_summary_sheet(tmp_path):
+    pytest.importorskip("openpyxl")
+    store = tmp_path / "results.jsonl"
+    sizes = [10 * KB, 100 * KB, 1 * MB, 3 * MB, 10 * MB, 100 * MB]
+    results_store.append([summary("HTTP/1.1", size, 1000 + i) for i, size in enumerate(sizes)], str(store))
+    excel = tmp_path / "results.xlsx"
+
+    assert export_results.export(str(store), str(excel))
+
+    sheet = pd.read_excel(excel, sheet_name="Summary", index_col=0)
+    assert [column for column in sheet.columns if column.endswith("_Average")] == [
+        "10kB file_Average", "100kB file_Average", "1MB file_Average", "3MB file_Average",
+        "10MB file_Average", "100MB file_Average"]
+    assert sheet.at["HTTP/1.1", "100MB file_Average"] == 1005
@@ -0,0 +1,32 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import results_store
+import wire_stats
+
+def test_overhead_report_leaves_unmeasured_layers_out():
+    report = wire_stats.overhead_report({"app_sent": 100, "app_received": 1100}, 1000)
+    assert report == {"application": 1.2}
+    assert wire_stats.overhead_report({"app_sent": 100, "app_received": 1100}, 0) == {}
+
+def test_unmeasured_overhead_is_stored_as_null(tmp_path):
+    overhead = wire_stats.overhead_report({}, 1000).get("application")
+    assert wire_stats.format_ratio(overhead) == "n/a"
+    assert wire_stats.format_ratio(1.23456) == "1.2346"
+
+    store = tmp_path / "results.jsonl"
+    results_store.append(results_store.make_record("HTTP 1.1", "summary", "A_10kB", 10240, overhead=overhead),
+                         str(store))
+    # Strict JSON: a NaN would be written as a bare NaN token
+    record = json.loads(store.read_text(), parse_constant=_reject_constant)
+    assert record["overhead"] is None
+
+def _reject_constant(name):
+    raise AssertionError(f"{name} in the results store")
+
+def test_mean_ratio_skips_unmeasured_transfers():
+    assert wire_stats.mean_ratio([1.0, None, 1.5]) == 1.25
+    assert wire_stats.mean_ratio([None, None]) is None
+    assert wire_stats.mean_ratio([]) is None
@@ -0,0 +1,145 @@
+import statistics
+import time
+
+# Per-transfer phase timing shared by the HTTP/1.1, HTTP/2 and BitTorrent
+# clients. Everything runs on time.perf_counter_ns(): it is monotonic and has
+# sub-microsecond resolution, so a 10kB transfer is not lost in clock
+# granularity or wall-clock adjustments the way it is with time.time().
+
+# Phases in the order they happen during one HTTP transfer. A timer only holds
+# the phases the transfer actually went through: a reused connection has no
+# dns/connect, plain HTTP has no tls, a client that keeps the body in memory
+# never persists it.
+PHASES = ("dns", "connect", "tls", "request_sent", "first_byte", "last_byte", "persisted")
+
+# BitTorrent has no request/response; the leecher records swarm milestones.
+TORRENT_PHASES = ("tracker_reply", "peer_connect", "first_byte", "last_byte", "persisted")
+
+# HTTP/3 runs over QUIC, whose handshake includes TLS 1.3.
+QUIC_PHASES = ("quic_handshake", "request_sent", "first_byte", "last_byte")
+
+PHASE_LABELS = {
+    "dns": "DNS lookup",
+    "connect": "TCP connect",
+    "tls": "TLS handshake",
+    "request_sent": "Request sent",
+    "first_byte": "First byte",
+    "last_byte": "Last byte",
+    "persisted": "File persisted",
+    "tracker_reply": "Tracker reply",
+    "peer_connect": "Peer connected",
+    "quic_handshake": "QUIC handshake",
+}
+
+# httpcore trace events (httpx "trace" request extension) that end a phase.
+# httpcore resolves the name inside connect_tcp, so for httpx clients the
+# connect phase includes DNS.
+HTTPCORE_TRACE_PHASES = {
+    "connection.connect_tcp.complete": "connect",
+    "connection.start_tls.complete": "tls",
+    "http11.send_request_body.complete": "request_sent",
+    "http2.send_request_body.complete": "request_sent",
+    "http11.receive_response_headers.complete": "first_byte",
+    "http2.receive_response_headers.complete": "first_byte",
+}
+
+class PhaseTimer:
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.restart()
+
+    def restart(self):
+        # Drops all marks and starts timing again from now (e.g. on a retry)
+        self.marks = {}
+        self.start_ns = time.perf_counter_ns()
+
+    def mark(self, phase, at_ns=None):
+        # Records that a phase ended now, or at at_ns on the perf_counter_ns
+        # clock (e.g. a libtorrent alert's own timestamp); marking again moves
+        # the mark (used for last_byte while a body is streamed)
+        now = time.perf_counter_ns() if at_ns is None else at_ns
+        self.marks[phase] = now
+        return now
+
+    def elapsed(self, phase=None):
+        # Seconds from the start to the end of a phase, or to now. None if
+        # the phase was never reached.
+        end = time.perf_counter_ns() if phase is None else self.marks.get(phase)
+        if end is None:
+            return None
+        return (end - self.start_ns) / 1e9
+
+    def durations(self):
+        # Seconds spent in each reached phase, measured from the end of the
+        # previous reached phase (or the start)
+        result = {}
+        previous = self.start_ns
+        for phase in self.phases:
+            if phase in self.marks:
+                result[phase] = (self.marks[phase] - previous) / 1e9
+                previous = self.marks[phase]
+        return result
+
+    def trace(self, event_name, info):
+        # Hook for httpx's "trace" request extension on synchronous clients
+        phase = HTTPCORE_TRACE_PHASES.get(event_name)
+        if phase is not None:
+            self.mark(phase)
+
+    async def atrace(self, event_name, info):
+        # Same hook for httpx.AsyncClient, which awaits its trace callback
+        self.trace(event_name, info)
+
+def consume_chunks(chunks, timer):
+    # Drains an iterator of byte chunks (e.g. httpx's iter_raw) without
+    # keeping them, moving the timer's last_byte mark as each one arrives.
+    # Returns the byte count and (seconds since start, bytes) per chunk.
+    received = 0
+    arrivals = []
+    timer.mark("last_byte")
+    for chunk in chunks:
+        arrived = timer.mark("last_byte")
+        received += len(chunk)
+        arrivals.append(((arrived - timer.start_ns) / 1e9, len(chunk)))
+    return received, arrivals
+
+def largest_gap(arrivals):
+    # Longest pause in seconds between consecutive chunk arrivals
+    times = [arrived for arrived, _ in arrivals]
+    return max((b - a for a, b in zip(times, times[1:])), default=0.0)
+
+def summarize(timers):
+    # Mean, min and max seconds per phase over a list of timers, plus how
+    # many transfers went through each phase
+    per_phase = {}
+    for timer in timers:
+        for phase, seconds in timer.durations().items():
+            per_phase.setdefault(phase, []).append(seconds)
+
+    order = timers[0].phases if timers else PHASES
+    summary = {}
+    for phase in order:
+        values = per_phase.get(phase)
+        if values:
+            summary[phase] = {
+                "count": len(values),
+                "mean": statistics.mean(values),
+                "min": min(values),
+                "max": max(values),
+            }
+    return summary
+
+def print_breakdown(timers, title="Phase breakdown", emit=print):
+    # emit lets scripts that report through logging pass logger.info
+    summary = summarize(timers)
+    if not summary:
+        return summary
+    emit(f"{title} (ms, {len(timers)} transfers):")
+    for phase, stats in summary.items():
+        label = PHASE_LABELS.get(phase, phase)
+        emit(f"  {label:<15} avg {stats['mean'] * 1000:9.3f}  "
+             f"min {stats['min'] * 1000:9.3f}  max {stats['max'] * 1000:9.3f}  (n={stats['count']})")
+    totals = [timer.elapsed(max(timer.marks, key=timer.marks.get)) for timer in timers if timer.marks]
+    if totals:
+        emit(f"  {'Total':<15} avg {statistics.mean(totals) * 1000:9.3f}")
+    return summary
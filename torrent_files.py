@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# .torrent creation shared by the BitTorrent seeders (btorr.py, bt.py and
+# bittorrent/bt.py) and piece_bench.py, with the piece size chosen by a
+# policy instead of a hardcoded 16kB.
+#
+# With 16kB pieces a 10MB file already has 640 of them and a 4GB file
+# 262144: 20 bytes of SHA-1 per piece in the metadata the leechers fetch,
+# one hash check per piece, and one HAVE message per piece to every peer.
+# Larger pieces cut all three but make the swarm exchange data in coarser
+# units, so the policy is what piece_bench.py measures.
+#
+# A policy is one of:
+#   a size ("16kB", "1MB", "65536") - that piece size for every file (fixed)
+#   auto                            - the smallest piece size that keeps the
+#                                     file within TARGET_PIECES pieces
+#   sweep                           - every piece size from MIN_PIECE_SIZE up
+#                                     to the first that holds the whole file
+#   a list ("16kB,256kB,4MB")       - a sweep over just these sizes
+# The seeders take theirs from $PIECE_SIZE; "sweep" and lists only make
+# sense for run_experiments.sh and piece_bench.py, which run each file once
+# per piece size.
+#
+# Pieces are hashed on HASH_THREADS threads rather than by
+# lt.set_piece_hashes, which hashes on one, and every created .torrent is
+# cached by file path, size, mtime, piece size and trackers, so a seeder
+# started again on an unchanged file (each run_experiments.sh experiment
+# starts one) does not hash it at all.
+
+# The original hardcoded piece size, kept as the default so results stay
+# comparable with earlier runs
+DEFAULT_PIECE_POLICY = "16kB"
+
+# libtorrent's block size, the smallest piece it accepts; piece sizes must
+# also be a power of two
+MIN_PIECE_SIZE = 16 * 1024
+MAX_PIECE_SIZE = 16 * 1024 ** 2
+
+# What auto aims for: 20kB of piece hashes in the metadata at most
+TARGET_PIECES = 1024
+
+# Bytes each hashing task reads at once
+HASH_CHUNK = 4 * 1024 ** 2
+
+# Created torrents are kept in this directory next to the file they
+# describe; bumped CACHE_VERSION invalidates every entry
+CACHE_DIR = ".torrent_cache"
+CACHE_VERSION = 1
+
+_UNITS = (("GB", 1024 ** 3), ("MB", 1024 ** 2), ("kB", 1024), ("B", 1))
+
+def parse_piece_size(text):
+    # "16kB", "4MB" or a plain byte count, checked against what libtorrent
+    # accepts
+    text = str(text).strip()
+    size = None
+    for unit, factor in _UNITS:
+        if text.lower().endswith(unit.lower()) and text[:-len(unit)].strip():
+            size = int(float(text[:-len(unit)]) * factor)
+            break
+    if size is None:
+        size = int(text)
+    if size < MIN_PIECE_SIZE or size > MAX_PIECE_SIZE or size & (size - 1):
+        raise ValueError(f"Piece size must be a power of two from {format_piece_size(MIN_PIECE_SIZE)} "
+                         f"to {format_piece_size(MAX_PIECE_SIZE)}, got '{text}'")
+    return size
+
+def format_piece_size(size):
+    for unit, factor in _UNITS:
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+def piece_policy(policy=None):
+    # Explicit policy, then $PIECE_SIZE, then the default
+    return str(policy or os.environ.get("PIECE_SIZE") or DEFAULT_PIECE_POLICY).strip()
+
+def auto_piece_size(file_size):
+    size = MIN_PIECE_SIZE
+    while size < MAX_PIECE_SIZE and -(-file_size // size) > TARGET_PIECES:
+        size *= 2
+    return size
+
+def piece_sizes(file_size, policy=None):
+    # Every piece size the policy covers for a file of file_size bytes,
+    # ascending
+    policy = piece_policy(policy)
+    if policy == "auto":
+        return [auto_piece_size(file_size)]
+    if policy == "sweep":
+        sizes = [MIN_PIECE_SIZE]
+        while sizes[-1] < min(file_size, MAX_PIECE_SIZE):
+            sizes.append(sizes[-1] * 2)
+        return sizes
+    return sorted({parse_piece_size(size) for size in policy.split(",") if size.strip()})
+
+def piece_size(file_size, policy=None):
+    # The one piece size a seeder creates its torrent with
+    sizes = piece_sizes(file_size, policy)
+    if len(sizes) != 1:
+        raise ValueError(f"Piece size policy '{piece_policy(policy)}' gives {len(sizes)} piece sizes; "
+                         f"a seeder needs a size or auto")
+    return sizes[0]
+
+def hash_threads(threads=None):
+    # Explicit count, then $HASH_THREADS, then one per CPU
+    return max(1, int(threads or os.environ.get("HASH_THREADS") or os.cpu_count() or 1))
+
+def hash_pieces(path, size, threads=None):
+    # SHA-1 of every size-byte piece of the file, hashed on a thread pool.
+    # hashlib and os.pread release the GIL, so the threads hash in
+    # parallel; each task takes a run of pieces adding up to HASH_CHUNK so
+    # small pieces do not cost one task each.
+    file_size = os.path.getsize(path)
+    pieces = -(-file_size // size)
+    per_task = max(1, HASH_CHUNK // size)
+    fd = os.open(path, os.O_RDONLY)
+
+    def hash_run(first):
+        offset = first * size
+        data = memoryview(os.pread(fd, min(per_task * size, file_size - offset), offset))
+        return [hashlib.sha1(data[i:i + size]).digest() for i in range(0, len(data), size)]
+
+    try:
+        with ThreadPoolExecutor(hash_threads(threads)) as pool:
+            return [digest for run in pool.map(hash_run, range(0, pieces, per_task)) for digest in run]
+    finally:
+        os.close(fd)
+
+def cache_key(abs_path, size, trackers):
+    # A file is hashed again only when its path, size, mtime, the piece size
+    # or the trackers change
+    st = os.stat(abs_path)
+    spec = json.dumps({"version": CACHE_VERSION, "path": abs_path, "size": st.st_size,
+                       "mtime_ns": st.st_mtime_ns, "piece_size": size, "trackers": list(trackers)},
+                      sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:20]
+
+def create_torrent(file_path, size=None, trackers=(), torrent_path=None, threads=None, cache=True):
+    # Writes a .torrent for file_path with the given piece size (by default
+    # the one $PIECE_SIZE gives for the file) next to the file, or to
+    # torrent_path. With cache, a .torrent made before for the same file,
+    # piece size and trackers is copied out of CACHE_DIR next to the file
+    # instead of hashing again. Returns the path, the metadata size in bytes
+    # and whether it came from the cache.
+    # libtorrent is only imported here, so run_experiments.sh can list piece
+    # sizes on a host without it.
+    abs_path = os.path.abspath(file_path)
+    if size is None:
+        size = piece_size(os.path.getsize(abs_path))
+    torrent_path = torrent_path or f"{file_path}.torrent"
+    cache_path = None
+    if cache:
+        cache_dir = os.path.join(os.path.dirname(abs_path), CACHE_DIR)
+        cache_path = os.path.join(cache_dir, cache_key(abs_path, size, trackers) + ".torrent")
+        try:
+            with open(cache_path, 'rb') as f:
+                metadata = f.read()
+        except OSError:
+            pass
+        else:
+            with open(torrent_path, 'wb') as f:
+                f.write(metadata)
+            return torrent_path, len(metadata), True
+
+    import libtorrent as lt
+
+    fs = lt.file_storage()
+    lt.add_files(fs, abs_path)
+    # v1 only: the bindings can set SHA-1 piece hashes but not the SHA-256
+    # merkle trees of a v2 or hybrid torrent, and every peer of the
+    # experiment speaks v1. libtorrent 1.2 has no flag and only makes v1.
+    t = lt.create_torrent(fs, size, getattr(lt.create_torrent, "v1_only", 0))
+    t.set_creator('libtorrent python bindings')
+    for tracker in trackers:
+        t.add_tracker(tracker)
+    for index, digest in enumerate(hash_pieces(abs_path, size, threads)):
+        t.set_hash(index, digest)
+
+    metadata = lt.bencode(t.generate())
+    with open(torrent_path, 'wb') as f:
+        f.write(metadata)
+    if cache_path is not None:
+        # Written under a temporary name and renamed, so a seeder killed
+        # halfway never leaves a truncated entry behind
+        os.makedirs(cache_dir, exist_ok=True)
+        partial = f"{cache_path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(metadata)
+        os.replace(partial, cache_path)
+    return torrent_path, len(metadata), False
+
+if __name__ == "__main__":
+    #python3 torrent_files.py sizes A_10MB sweep
+    #python3 torrent_files.py sizes A_10MB auto
+    # Prints one piece size per line for shell loops
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != "sizes":
+        sys.exit("Usage: torrent_files.py sizes <file_path> [policy]")
+    try:
+        for size in piece_sizes(os.path.getsize(sys.argv[2]), sys.argv[3] if len(sys.argv) == 4 else None):
+            print(format_piece_size(size))
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
@@ -0,0 +1,317 @@
+import os
+import time
+from collections import Counter
+
+import libtorrent as lt
+
+# libtorrent session handling shared by the BitTorrent leechers (btorr.py,
+# bt.py and bittorrent/bt.py).
+#
+# In "cold" mode, the original behaviour, a leecher brings up a new session
+# and parses the .torrent again for every iteration, so each of the 333 runs
+# of a 10kB file pays for opening listen sockets, starting DHT/LSD/UPnP and
+# applying the settings pack. In "warm" mode one session and one parsed
+# torrent_info serve every iteration: the torrent is removed with
+# delete_files and added again, which still announces and connects to peers
+# like a new download. Session bring-up is timed on its own in both modes,
+# so it never ends up in the transfer time.
+#
+# Sessions only subscribe to the alert categories their run profile needs
+# (see ALERT_PROFILES), and the loops hand popped alerts to a dispatch table
+# keyed on the alert type that counts every alert instead of logging it.
+
+SESSION_MODES = ("cold", "warm")
+DEFAULT_SESSION_MODE = "cold"
+
+# Longest the seeder and leecher loops block in wait_for_alert before doing
+# their periodic work (status line, timeouts, re-announces). Any alert wakes
+# them at once, and transfer phases are timed from the alerts' own
+# timestamps, so completion is no longer rounded up to a one-second poll.
+ALERT_WAIT_MS = 1000
+
+# Seconds between forced tracker and DHT re-announces
+REANNOUNCE_INTERVAL = 30
+
+# status() reports a torrent finished slightly before libtorrent posts the
+# block_finished, piece_finished and torrent_finished alerts. Completion is
+# taken from torrent_finished_alert; only if it has not arrived this many
+# seconds after status says finished (e.g. the alert queue overflowed) is
+# the transfer timed from status instead.
+FINISHED_ALERT_GRACE = 2
+
+# Without piece and block alerts ("bulk" below) nothing announces the first
+# payload, so the leecher polls status this often until it has seen it
+FIRST_BYTE_POLL_MS = 10
+
+# Seconds between progress log lines and status line refreshes; the loops
+# can wake far more often than that
+STATUS_INTERVAL = 1.0
+
+_category = lt.alert.category_t
+
+# What the seeder and leecher loops act on: torrent_finished (status),
+# cache_flushed and torrent_deleted (storage), tracker replies, peer
+# connections, plus errors and performance warnings
+_BASE_CATEGORIES = (_category.status_notification | _category.storage_notification
+                    | _category.tracker_notification | _category.connect_notification
+                    | _category.error_notification | _category.performance_warning)
+
+# One alert per finished piece and per received 16kB block. They time the
+# first byte to the microsecond, but a multi-GB torrent produces hundreds
+# of thousands of them.
+_PROGRESS_CATEGORIES = _category.piece_progress_notification | _category.block_progress_notification
+
+# "timing" is the default: exact phase timestamps for the file sizes of the
+# experiment. "bulk" drops the per-piece and per-block alerts for multi-GB
+# transfers; first byte is then taken from polling the torrent status.
+# "verbose" subscribes to everything and logs every alert, as the scripts
+# used to.
+ALERT_PROFILES = {
+    "bulk": _BASE_CATEGORIES,
+    "timing": _BASE_CATEGORIES | _PROGRESS_CATEGORIES,
+    "verbose": _category.all_categories,
+}
+DEFAULT_ALERT_PROFILE = "timing"
+
+def alert_profile(profile=None):
+    # Explicit profile, then $ALERT_PROFILE, then the default
+    profile = profile or os.environ.get("ALERT_PROFILE") or DEFAULT_ALERT_PROFILE
+    if profile not in ALERT_PROFILES:
+        raise ValueError(f"Alert profile must be one of {', '.join(ALERT_PROFILES)}, got '{profile}'")
+    return profile
+
+def alert_mask(profile=None):
+    return ALERT_PROFILES[alert_profile(profile)]
+
+def progress_alerts(profile=None):
+    # Whether the profile delivers piece and block alerts
+    return ALERT_PROFILES[alert_profile(profile)] & _PROGRESS_CATEGORIES == _PROGRESS_CATEGORIES
+
+LEECHER_SETTINGS = {
+    'listen_interfaces': '0.0.0.0:0',
+    'enable_dht': True,
+    'enable_lsd': True,
+    'enable_upnp': True,
+    'enable_natpmp': True,
+    'active_limit': -1,
+    'allow_multiple_connections_per_ip': True,
+    'announce_to_all_trackers': True,
+    'announce_to_all_tiers': True,
+    'connection_speed': 500,
+    'min_announce_interval': 30,
+    'tracker_backoff': 20,
+    'piece_timeout': 20,
+    'request_timeout': 20,
+    'peer_connect_timeout': 20,
+    'upload_rate_limit': 0,
+    'download_rate_limit': 0
+}
+
+def alert_time_ns(alert):
+    # When libtorrent posted the alert, on the time.perf_counter_ns() clock
+    # the phase timers use. The bindings return it as a naive local datetime
+    # with microsecond resolution.
+    wall_ns = round(alert.timestamp().timestamp() * 1e6) * 1000
+    return wall_ns - (time.time_ns() - time.perf_counter_ns())
+
+def wait_for_disk_flush(session, handle, timeout=5):
+    # is_finished only means every piece has been downloaded and verified;
+    # ask libtorrent to write its cache out and wait until it says it has.
+    # Returns when it did (perf_counter_ns, from the alert), None on timeout.
+    handle.flush_cache()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if session.wait_for_alert(100) is None:
+            continue
+        for a in session.pop_alerts():
+            if isinstance(a, lt.cache_flushed_alert):
+                return alert_time_ns(a)
+    return None
+
+class Reannouncer:
+    # Forces a tracker and DHT announce every REANNOUNCE_INTERVAL seconds.
+    # The loops used to check time.time() % 30 once a second; now that they
+    # can wake many times a second, they need an actual deadline.
+    def __init__(self, handle, interval=REANNOUNCE_INTERVAL):
+        self.handle = handle
+        self.interval = interval
+        self.next_announce = time.monotonic() + interval
+
+    def poll(self):
+        now = time.monotonic()
+        if now >= self.next_announce:
+            self.handle.force_reannounce()
+            self.handle.force_dht_announce()
+            self.next_announce = now + self.interval
+
+def load_torrent_info(torrent_path):
+    with open(torrent_path, 'rb') as f:
+        return lt.torrent_info(lt.bdecode(f.read()))
+
+class AlertDispatcher:
+    # Hands each popped alert to the handler registered for its exact type
+    # and counts alerts per type. Alerts without a handler are only counted;
+    # with the verbose profile every alert's message also goes to log.
+    def __init__(self, handlers=None, profile=None, log=None):
+        self.handlers = dict(handlers or {})
+        self.counts = Counter()
+        self.log = log if alert_profile(profile) == "verbose" else None
+
+    def dispatch(self, alerts):
+        handlers = self.handlers
+        counts = self.counts
+        for a in alerts:
+            kind = type(a)
+            counts[kind] += 1
+            handler = handlers.get(kind)
+            if handler is not None:
+                handler(a)
+            if self.log is not None:
+                self.log(a.message())
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def format_counts(self):
+        counts = ", ".join(f"{count} {kind.__name__.replace('_alert', '')}"
+                           for kind, count in self.counts.most_common())
+        return f"Alerts: {self.total()} ({counts or 'none'})"
+
+class SeederAlerts(AlertDispatcher):
+    # Dispatch table for the seeder: new peers go to emit, the rest is
+    # only counted
+    def __init__(self, profile=None, emit=print, log=None):
+        super().__init__({lt.peer_connect_alert: self._peer_connect}, profile, log)
+        self.emit = emit
+        self.peers = set()
+
+    def _peer_connect(self, a):
+        ip = str(a.endpoint[0])
+        if ip not in self.peers:
+            self.peers.add(ip)
+            self.emit(f"New peer connected from {ip}")
+
+class LeecherAlerts(AlertDispatcher):
+    # Dispatch table for one leecher iteration: marks the transfer phases on
+    # the timer at the alerts' own timestamps. emit gets the few events
+    # worth a log line (a new peer, the first payload).
+    def __init__(self, handle, timer, profile=None, emit=print, log=None):
+        super().__init__({
+            lt.peer_connect_alert: self._peer_connect,
+            lt.block_finished_alert: self._payload,
+            lt.piece_finished_alert: self._payload,
+            lt.torrent_finished_alert: self._finished,
+            lt.tracker_reply_alert: self._tracker_reply,
+        }, profile, log)
+        self.handle = handle
+        self.timer = timer
+        self.emit = emit
+        self.peers = set()
+
+    def _peer_connect(self, a):
+        ip = str(a.endpoint[0])
+        if ip not in self.peers:
+            self.peers.add(ip)
+            self.emit(f"Connected to peer: {ip}")
+            if len(self.peers) == 1:
+                self.timer.mark("peer_connect", alert_time_ns(a))
+
+    def _payload(self, a):
+        # libtorrent does not post block_finished_alert for every block, so
+        # a finished piece also counts as data received
+        if a.handle == self.handle and "first_byte" not in self.timer.marks:
+            self.timer.mark("first_byte", alert_time_ns(a))
+            self.emit("Data transfer started")
+
+    def _finished(self, a):
+        if a.handle == self.handle:
+            self.timer.mark("last_byte", alert_time_ns(a))
+
+    def _tracker_reply(self, a):
+        if "tracker_reply" not in self.timer.marks:
+            self.timer.mark("tracker_reply", alert_time_ns(a))
+
+class LeecherSession:
+    def __init__(self, torrent_path, mode=DEFAULT_SESSION_MODE, settings=None, profile=None):
+        if mode not in SESSION_MODES:
+            raise ValueError(f"Session mode must be one of {', '.join(SESSION_MODES)}, got '{mode}'")
+        self.torrent_path = torrent_path
+        self.mode = mode
+        self.profile = alert_profile(profile)
+        self.settings = dict(settings or LEECHER_SETTINGS, alert_mask=alert_mask(self.profile))
+        self.session = None
+        self.info = None
+        # Seconds each session bring-up took (one per iteration when cold,
+        # a single one when warm)
+        self.startup_times = []
+
+    def start(self):
+        # Makes sure a session with the parsed torrent is ready for the next
+        # iteration. Returns the seconds spent bringing it up, 0 when a warm
+        # session is reused.
+        if self.mode == "warm" and self.session is not None:
+            return 0.0
+        # A cold iteration also shuts the previous session down (dropping the
+        # last reference aborts it), which is timed here as well
+        start = time.perf_counter_ns()
+        self.session = None
+        session = lt.session()
+        session.apply_settings(self.settings)
+        self.info = load_torrent_info(self.torrent_path)
+        self.session = session
+        seconds = (time.perf_counter_ns() - start) / 1e9
+        self.startup_times.append(seconds)
+        return seconds
+
+    def add(self, save_dir):
+        return self.session.add_torrent({
+            'ti': self.info,
+            'save_path': save_dir
+        })
+
+    def remove(self, handle, delete_files=False, timeout=10):
+        # Removes the torrent from the session and waits until it is gone, as
+        # removal is asynchronous and the next add of the same torrent fails
+        # as a duplicate until then. With delete_files libtorrent also
+        # deletes the download; wait for that instead so the next iteration
+        # does not find a complete file and skip the transfer.
+        # Returns False if either did not happen in time.
+        if delete_files:
+            self.session.remove_torrent(handle, lt.session.delete_files)
+            done = lt.torrent_deleted_alert
+        else:
+            self.session.remove_torrent(handle)
+            done = lt.torrent_removed_alert
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.session.wait_for_alert(100) is None:
+                continue
+            for a in self.session.pop_alerts():
+                if isinstance(a, done):
+                    return True
+                if isinstance(a, lt.torrent_delete_failed_alert):
+                    return False
+        return False
+
+    def finish(self, handle, downloaded_path, keep=False):
+        # Ends an iteration however it ended (done, timed out or failed):
+        # pauses and removes the torrent, deleting the download unless keep,
+        # by hand if libtorrent does not get to it in time
+        handle.pause()
+        if not self.remove(handle, delete_files=not keep) and not keep and os.path.exists(downloaded_path):
+            os.remove(downloaded_path)
+
+    def startup_report(self):
+        # Fields for the results store
+        return {
+            "session_mode": self.mode,
+            "session_startups": len(self.startup_times),
+            "session_startup_total": sum(self.startup_times),
+        }
+
+    def format_startup(self):
+        total = sum(self.startup_times)
+        count = len(self.startup_times)
+        average = total / count if count else 0.0
+        return (f"Session startup ({self.mode}): {count} session(s), {total * 1000:.1f} ms total, "
+                f"{average * 1000:.1f} ms each")
@@ -0,0 +1,294 @@
+import os
+import socket
+import struct
+
+# Byte accounting shared by the HTTP/1.1, HTTP/2 and BitTorrent experiments.
+#
+# Four layers are measured so overhead numbers mean the same thing for every
+# protocol:
+#   application - bytes the protocol handed to / took from the socket
+#                 (request + response headers + body for HTTP/1.1)
+#   tcp payload - TCP payload bytes reported by the kernel (TCP_INFO); for
+#                 HTTP/2 this is the framing layer (plus TLS records on https)
+#   transport   - TCP payload plus an IPv4/TCP header estimate per segment,
+#                 pure ACKs included
+#   interface   - rx/tx deltas of the network interfaces in /proc/net/dev,
+#                 which also catches traffic on sockets we cannot wrap
+
+# IPv4 (20) + TCP (20) + timestamp option (12) bytes per segment
+TCP_IP_HEADER_BYTES = 52
+
+# struct tcp_info from linux/tcp.h, in order. Older kernels return a shorter
+# struct, so fields are parsed only as far as the returned length allows.
+_TCP_INFO_FIELDS = [
+    ("state", "B"), ("ca_state", "B"), ("retransmits", "B"), ("probes", "B"),
+    ("backoff", "B"), ("options", "B"), ("wscale", "B"), ("app_limited", "B"),
+    ("rto", "I"), ("ato", "I"), ("snd_mss", "I"), ("rcv_mss", "I"),
+    ("unacked", "I"), ("sacked", "I"), ("lost", "I"), ("retrans", "I"), ("fackets", "I"),
+    ("last_data_sent", "I"), ("last_ack_sent", "I"), ("last_data_recv", "I"), ("last_ack_recv", "I"),
+    ("pmtu", "I"), ("rcv_ssthresh", "I"), ("rtt", "I"), ("rttvar", "I"),
+    ("snd_ssthresh", "I"), ("snd_cwnd", "I"), ("advmss", "I"), ("reordering", "I"),
+    ("rcv_rtt", "I"), ("rcv_space", "I"), ("total_retrans", "I"),
+    ("pacing_rate", "Q"), ("max_pacing_rate", "Q"),
+    ("bytes_acked", "Q"), ("bytes_received", "Q"),
+    ("segs_out", "I"), ("segs_in", "I"),
+    ("notsent_bytes", "I"), ("min_rtt", "I"), ("data_segs_in", "I"), ("data_segs_out", "I"),
+    ("delivery_rate", "Q"), ("busy_time", "Q"), ("rwnd_limited", "Q"), ("sndbuf_limited", "Q"),
+    ("delivered", "I"), ("delivered_ce", "I"),
+    ("bytes_sent", "Q"), ("bytes_retrans", "Q"),
+]
+_TCP_INFO_MAX_LEN = struct.calcsize("=" + "".join(fmt for _, fmt in _TCP_INFO_FIELDS))
+
+# Cumulative TCP_INFO counters that are meaningful as per-transfer deltas
+TCP_COUNTERS = ("bytes_acked", "bytes_received", "segs_out", "segs_in", "total_retrans", "bytes_retrans")
+
+class ByteCounter:
+    # Running totals for every socket a connection object has opened.
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+
+class CountingSocket:
+    # Transparent socket proxy that counts application-layer bytes. Only the
+    # calls http.client and the clients here use are intercepted; everything
+    # else is delegated to the real socket.
+    def __init__(self, sock, counter=None):
+        self._sock = sock
+        self.counter = counter if counter is not None else ByteCounter()
+        # Files from makefile() below are counted here, on the proxy, so
+        # close() must wait for them like socket.socket.close() does: http.client
+        # closes the connection on "Connection: close" while the response is
+        # still being read
+        self._io_refs = 0
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def close(self):
+        self._closed = True
+        if self._io_refs <= 0:
+            self._sock.close()
+
+    def _decref_socketios(self):
+        if self._io_refs > 0:
+            self._io_refs -= 1
+        if self._closed:
+            self.close()
+
+    @property
+    def raw_socket(self):
+        return self._sock
+
+    def send(self, data, *args):
+        n = self._sock.send(data, *args)
+        self.counter.sent += n
+        return n
+
+    def sendall(self, data, *args):
+        self._sock.sendall(data, *args)
+        self.counter.sent += memoryview(data).nbytes
+
+    def sendfile(self, file, offset=0, count=None):
+        n = self._sock.sendfile(file, offset, count)
+        self.counter.sent += n
+        return n
+
+    def recv(self, bufsize, *args):
+        data = self._sock.recv(bufsize, *args)
+        self.counter.received += len(data)
+        return data
+
+    def recv_into(self, buffer, nbytes=0, *args):
+        n = self._sock.recv_into(buffer, nbytes, *args)
+        self.counter.received += n
+        return n
+
+    def makefile(self, mode="r", buffering=None, **kwargs):
+        # socket.makefile() wires a SocketIO to the object it is called on,
+        # so calling it unbound on the proxy routes reads through recv_into.
+        return socket.socket.makefile(self, mode, buffering, **kwargs)
+
+def read_tcp_info(sock):
+    # Returns the kernel's TCP_INFO counters for a connected socket as a dict,
+    # or {} where TCP_INFO is unavailable (non-Linux, closed socket).
+    if sock is None or not hasattr(socket, "TCP_INFO"):
+        return {}
+    raw_sock = getattr(sock, "raw_socket", sock)
+    try:
+        raw = raw_sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO_MAX_LEN)
+    except (OSError, ValueError):
+        return {}
+
+    info = {}
+    offset = 0
+    for name, fmt in _TCP_INFO_FIELDS:
+        size = struct.calcsize("=" + fmt)
+        if offset + size > len(raw):
+            break
+        info[name] = struct.unpack_from("=" + fmt, raw, offset)[0]
+        offset += size
+    return info
+
+def snapshot(sock, counter=None):
+    # Cumulative counters for one point in time. Pass the result of two calls
+    # to delta() to get the bytes a single transfer cost.
+    snap = {"sock": id(getattr(sock, "raw_socket", sock)) if sock is not None else None}
+    if counter is not None:
+        snap["app_sent"] = counter.sent
+        snap["app_received"] = counter.received
+    tcp_info = read_tcp_info(sock)
+    for name in TCP_COUNTERS:
+        if name in tcp_info:
+            snap[f"tcp_{name}"] = tcp_info[name]
+    return snap
+
+def delta(after, before):
+    # Counter differences between two snapshots. If the connection reopened
+    # its socket in between, the new socket's TCP counters started from zero.
+    result = {}
+    same_socket = before.get("sock") is not None and before.get("sock") == after.get("sock")
+    for name, value in after.items():
+        if name == "sock":
+            continue
+        if name.startswith("tcp_") and not same_socket:
+            result[name] = value
+        else:
+            result[name] = value - before.get(name, 0)
+    return result
+
+def accumulate(total, counters):
+    for name, value in counters.items():
+        total[name] = total.get(name, 0) + value
+    return total
+
+class ConnectionCounters:
+    # Latest TCP counters of every connection a run used. Without keep-alive
+    # a connection closes as soon as its response has been read and TCP_INFO
+    # goes with it, so take() is called while it is still open and again at
+    # the end of the run; a socket that has closed by then keeps its last
+    # reading.
+    def __init__(self):
+        self.sockets = {}
+        self.snapshots = {}
+
+    def take(self, sock):
+        if sock is None:
+            return
+        snap = snapshot(sock)
+        # Holding on to the socket keeps its id from being reused
+        self.sockets[snap["sock"]] = sock
+        if len(snap) > 1:
+            self.snapshots[snap["sock"]] = snap
+
+    def refresh(self):
+        for sock in list(self.sockets.values()):
+            self.take(sock)
+
+    def totals(self):
+        total = {}
+        for snap in self.snapshots.values():
+            accumulate(total, {name: value for name, value in snap.items() if name != "sock"})
+        return total
+
+    def __len__(self):
+        return len(self.sockets)
+
+def response_socket(response):
+    # Socket behind an httpx response, taken from httpcore's network stream
+    # extension, or None if the transport does not expose it.
+    stream = response.extensions.get("network_stream")
+    if stream is None:
+        return None
+    return stream.get_extra_info("socket")
+
+def estimate_wire_bytes(counters, header_bytes=TCP_IP_HEADER_BYTES):
+    # TCP payload in both directions plus per-segment IP/TCP headers, or None
+    # when TCP_INFO was not available.
+    if "tcp_bytes_received" not in counters:
+        return None
+    payload = counters.get("tcp_bytes_acked", 0) + counters["tcp_bytes_received"]
+    segments = counters.get("tcp_segs_out", 0) + counters.get("tcp_segs_in", 0)
+    return payload + segments * header_bytes
+
+def read_interface_counters(interfaces=None):
+    # Summed rx/tx byte and packet counters from /proc/net/dev for the given
+    # interfaces, or for every interface except loopback. Returns {} where
+    # /proc/net/dev does not exist.
+    try:
+        with open("/proc/net/dev") as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return {}
+
+    totals = {"rx_bytes": 0, "rx_packets": 0, "tx_bytes": 0, "tx_packets": 0}
+    for line in lines:
+        name, _, data = line.partition(":")
+        name = name.strip()
+        if interfaces is not None and name not in interfaces:
+            continue
+        if interfaces is None and name == "lo":
+            continue
+        fields = data.split()
+        totals["rx_bytes"] += int(fields[0])
+        totals["rx_packets"] += int(fields[1])
+        totals["tx_bytes"] += int(fields[8])
+        totals["tx_packets"] += int(fields[9])
+    return totals
+
+class InterfaceMeter:
+    # Interface-level traffic between start() and stop(). Everything the host
+    # sends or receives is included, so it is only meaningful on an otherwise
+    # idle test network.
+    def __init__(self, interfaces=None):
+        if interfaces is None and os.environ.get("WIRE_INTERFACES"):
+            interfaces = os.environ["WIRE_INTERFACES"].split(",")
+        self.interfaces = interfaces
+        self._start = {}
+
+    def start(self):
+        self._start = read_interface_counters(self.interfaces)
+        return self
+
+    def stop(self):
+        end = read_interface_counters(self.interfaces)
+        return {f"if_{name}": end[name] - self._start.get(name, 0) for name in end}
+
+def overhead_report(counters, payload_bytes):
+    # Overhead ratios (total bytes / payload bytes) for each layer that was
+    # measured. Missing layers are left out rather than estimated.
+    report = {}
+    if not payload_bytes:
+        return report
+    if "app_received" in counters:
+        report["application"] = (counters["app_sent"] + counters["app_received"]) / payload_bytes
+    if "tcp_bytes_received" in counters:
+        tcp_payload = counters.get("tcp_bytes_acked", 0) + counters["tcp_bytes_received"]
+        report["tcp_payload"] = tcp_payload / payload_bytes
+    wire_bytes = estimate_wire_bytes(counters)
+    if wire_bytes is not None:
+        report["transport"] = wire_bytes / payload_bytes
+    if "if_rx_bytes" in counters:
+        report["interface"] = (counters["if_rx_bytes"] + counters["if_tx_bytes"]) / payload_bytes
+    return report
+
+# How each layer of overhead_report() is labelled in reports
+LAYER_NAMES = {
+    "application": "Application",
+    "tcp_payload": "TCP payload",
+    "transport": "Transport (TCP/IP est.)",
+    "interface": "Interface",
+}
+
+def format_overhead(report):
+    return ", ".join(f"{LAYER_NAMES[layer]}: {ratio:.4f}" for layer, ratio in report.items())
+
+def format_ratio(ratio):
+    # One overhead ratio for a report line; None is a layer that could not
+    # be measured, which is stored as null rather than NaN
+    return "n/a" if ratio is None else f"{ratio:.4f}"
+
+def mean_ratio(ratios):
+    # Mean of the ratios that were measured, or None if none was
+    measured = [ratio for ratio in ratios if ratio is not None]
+    return sum(measured) / len(measured) if measured else None